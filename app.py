@@ -1,6 +1,7 @@
-from app import create_app
+from app import create_app, initialize
 
 app = create_app()
 
 if __name__ == '__main__':
+    initialize(app)
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -4,12 +4,32 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
 from dotenv import load_dotenv
+from app.utils.cache import FragmentCache
+from app.utils.invalidation import InvalidationBus
+from app.utils.assets import StaticAssets
+from app.utils.image_tasks import ImageProcessor
+from app.utils.login_guard import LoginGuard
+from app.utils.mail_queue import MailSender
+from app.utils.metrics import Metrics
+from app.utils.profiler import RequestProfiler
+from app.utils.warmup import WarmUp
+from app.utils.view_events import ViewRecorder
 
 load_dotenv()
 
 db = SQLAlchemy()
 login_manager = LoginManager()
 csrf = CSRFProtect()
+fragment_cache = FragmentCache()
+invalidation_bus = InvalidationBus()
+static_assets = StaticAssets()
+image_processor = ImageProcessor()
+login_guard = LoginGuard()
+mail_sender = MailSender()
+metrics = Metrics()
+request_profiler = RequestProfiler()
+warmup = WarmUp()
+view_recorder = ViewRecorder()
 
 def create_app(test_config=None):
     """Application factory function"""
@@ -22,48 +42,124 @@ def create_app(test_config=None):
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
         UPLOAD_FOLDER=os.environ.get('UPLOAD_FOLDER', 'app/static/uploads'),
         MAX_CONTENT_LENGTH=int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024)),  # 16MB max upload
+        FRAGMENT_CACHE_TYPE=os.environ.get('FRAGMENT_CACHE_TYPE', 'lru'),  # lru, file or null
+        FRAGMENT_CACHE_MAX_BYTES=int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+        FRAGMENT_CACHE_DIR=os.environ.get('FRAGMENT_CACHE_DIR'),
+        FRAGMENT_CACHE_MAX_ENTRIES=int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES', 10000)),
+        FRAGMENT_CACHE_TIMEOUT=int(os.environ.get('FRAGMENT_CACHE_TIMEOUT', 0)),
+        INVALIDATION_BUS_PATH=os.environ.get('INVALIDATION_BUS_PATH'),
+        INVALIDATION_POLL_INTERVAL=float(os.environ.get('INVALIDATION_POLL_INTERVAL', 1.0)),
+        HTTP_CACHE_SHARED_MAX_AGE=int(os.environ.get('HTTP_CACHE_SHARED_MAX_AGE', 60)),  # s-maxage for anonymous pages
+        STATIC_ASSETS_MAX_AGE=int(os.environ.get('STATIC_ASSETS_MAX_AGE', 365 * 24 * 3600)),
+        STREAMING_CHUNK_SIZE=int(os.environ.get('STREAMING_CHUNK_SIZE', 8192)),
+        STREAMING_GZIP=os.environ.get('STREAMING_GZIP', '1') == '1',
+        STREAMING_GZIP_LEVEL=int(os.environ.get('STREAMING_GZIP_LEVEL', 6)),
+        IMAGE_VARIANT_WIDTHS={  # WebP variant widths per upload folder
+            'post_images': [int(w) for w in os.environ.get('POST_IMAGE_WIDTHS', '320,640,800').split(',')],
+            'profile_pics': [int(w) for w in os.environ.get('PROFILE_IMAGE_WIDTHS', '48,96,150').split(',')],
+        },
+        IMAGE_WEBP_QUALITY=int(os.environ.get('IMAGE_WEBP_QUALITY', 80)),
+        IMAGE_MAX_PIXELS=int(os.environ.get('IMAGE_MAX_PIXELS', 50_000_000)),  # checked before decoding
+        IMAGE_WORKERS=int(os.environ.get('IMAGE_WORKERS', 2)),  # 0 processes uploads in the request
+        IMAGE_QUEUE_LIMIT=int(os.environ.get('IMAGE_QUEUE_LIMIT', 8)),
+        IMAGE_QUEUE_TIMEOUT=float(os.environ.get('IMAGE_QUEUE_TIMEOUT', 2.0)),
+        LOGIN_IP_LIMIT=int(os.environ.get('LOGIN_IP_LIMIT', 20)),  # login attempts per IP per window
+        LOGIN_IP_WINDOW=int(os.environ.get('LOGIN_IP_WINDOW', 60)),
+        LOGIN_USER_LIMIT=int(os.environ.get('LOGIN_USER_LIMIT', 5)),  # failed logins per username per window
+        LOGIN_USER_WINDOW=int(os.environ.get('LOGIN_USER_WINDOW', 300)),
+        PROXY_FIX_HOPS=int(os.environ.get('PROXY_FIX_HOPS', 0)),  # reverse proxies whose X-Forwarded-* headers are trusted for client IPs
+        PASSWORD_HASH_WORKERS=int(os.environ.get('PASSWORD_HASH_WORKERS', 2)),  # 0 hashes in the request
+        PASSWORD_HASH_QUEUE=int(os.environ.get('PASSWORD_HASH_QUEUE', 16)),
+        PASSWORD_HASH_TIMEOUT=float(os.environ.get('PASSWORD_HASH_TIMEOUT', 5.0)),
+        STATS_TOKEN=os.environ.get('STATS_TOKEN'),  # bearer token for /metrics and the stats endpoints, unset hides them
+        MAIL_BACKEND=os.environ.get('MAIL_BACKEND', 'console'),  # smtp, or console to log emails
+        MAIL_SERVER=os.environ.get('SMTP_SERVER', 'localhost'),
+        MAIL_PORT=int(os.environ.get('SMTP_PORT', 587)),
+        MAIL_USE_TLS=os.environ.get('SMTP_USE_TLS', '1') == '1',
+        MAIL_USERNAME=os.environ.get('EMAIL_USER'),
+        MAIL_PASSWORD=os.environ.get('EMAIL_PASSWORD', ''),
+        MAIL_DEFAULT_SENDER=os.environ.get('MAIL_DEFAULT_SENDER', os.environ.get('EMAIL_USER', 'noreply@example.com')),
+        MAIL_TIMEOUT=float(os.environ.get('MAIL_TIMEOUT', 10)),
+        MAIL_BATCH_SIZE=int(os.environ.get('MAIL_BATCH_SIZE', 50)),  # messages per claim, sent over one connection
+        MAIL_POLL_INTERVAL=float(os.environ.get('MAIL_POLL_INTERVAL', 5.0)),
+        MAIL_IDLE_TIMEOUT=float(os.environ.get('MAIL_IDLE_TIMEOUT', 30.0)),
+        MAIL_MAX_ATTEMPTS=int(os.environ.get('MAIL_MAX_ATTEMPTS', 5)),
+        MAIL_RETRY_BASE=float(os.environ.get('MAIL_RETRY_BASE', 30)),  # doubled after each failed attempt
+        MAIL_RETRY_MAX=float(os.environ.get('MAIL_RETRY_MAX', 3600)),
+        MAIL_SENDER_THREAD=os.environ.get('MAIL_SENDER_THREAD', '1') == '1',  # 0 leaves sending to `flask mail worker`
+        TRENDING_HALF_LIFE=float(os.environ.get('TRENDING_HALF_LIFE', 24)),  # hours for a comment's weight to halve
+        TRENDING_SENTIMENT_WEIGHT=float(os.environ.get('TRENDING_SENTIMENT_WEIGHT', 0.5)),  # weight is 1 + this * polarity
+        TRENDING_VIEW_WEIGHT=float(os.environ.get('TRENDING_VIEW_WEIGHT', 0.05)),  # a view counts this much of a comment
+        VIEW_FLUSH_INTERVAL=float(os.environ.get('VIEW_FLUSH_INTERVAL', 5.0)),  # seconds between writes of buffered views
+        VIEW_FLUSH_SIZE=int(os.environ.get('VIEW_FLUSH_SIZE', 500)),  # buffered (user, post) pairs that trigger a write
+        VIEW_BUFFER_MAX=int(os.environ.get('VIEW_BUFFER_MAX', 20000)),  # views of new pairs are dropped past this
+        VIEW_FLUSH_THREAD=os.environ.get('VIEW_FLUSH_THREAD', '1') == '1',  # 0 writes in the request at VIEW_FLUSH_SIZE
+        JINJA_BYTECODE_CACHE=os.environ.get('JINJA_BYTECODE_CACHE', '1') == '1',  # compiled templates kept across restarts
+        JINJA_BYTECODE_CACHE_DIR=os.environ.get('JINJA_BYTECODE_CACHE_DIR'),  # defaults to instance/jinja_cache
+        WARMUP_STEPS=[s for s in os.environ.get('WARMUP_STEPS', 'templates,recommendation_model,sentiment,images').split(',') if s],
+        METRICS_ENABLED=os.environ.get('METRICS_ENABLED', '1') == '1',  # request and SQL timings served at /metrics
+        METRICS_SLOW_REQUEST=float(os.environ.get('METRICS_SLOW_REQUEST', 1.0)),  # seconds, 0 turns the slow request log off
+        PROFILER_TOKEN=os.environ.get('PROFILER_TOKEN'),  # requests with a matching X-Profile header are profiled
+        PROFILER_SAMPLE_RATE=float(os.environ.get('PROFILER_SAMPLE_RATE', 0.0)),  # share of requests profiled at random
+        PROFILER_ENDPOINTS=[e for e in os.environ.get('PROFILER_ENDPOINTS', '').split(',') if e],
+        PROFILER_DIR=os.environ.get('PROFILER_DIR'),  # defaults to instance/profiles
+        PROFILER_INTERVAL=float(os.environ.get('PROFILER_INTERVAL', 0.005)),
+        PROFILER_MAX_CONCURRENT=int(os.environ.get('PROFILER_MAX_CONCURRENT', 2)),
+        PROFILER_MAX_FILES=int(os.environ.get('PROFILER_MAX_FILES', 50)),
+        PROFILER_MAX_BYTES=int(os.environ.get('PROFILER_MAX_BYTES', 20 * 1024 * 1024)),
     )
 
     if test_config:
         app.config.update(test_config)
 
-    try:
-        os.makedirs(app.instance_path)
-    except OSError:
-        pass
-    
-    # Ensure upload folders exist
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-    os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'profile_pics'), exist_ok=True)
-    os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'post_images'), exist_ok=True)
-    
-    # Check if default profile image exists and has content
-    default_profile_path = os.path.join(app.config['UPLOAD_FOLDER'], 'default_profile.jpg')
-    if not os.path.exists(default_profile_path) or os.path.getsize(default_profile_path) < 100:
-            # Create a basic default profile image or copy from a template
-        from PIL import Image, ImageDraw
-        img = Image.new('RGB', (150, 150), color=(73, 109, 137))
-        d = ImageDraw.Draw(img)
-        d.ellipse((10, 10, 140, 140), fill=(255, 255, 255))
-        img.save(default_profile_path)
+    if app.config['PROXY_FIX_HOPS']:
+        # Client addresses, e.g. for login rate limits, come from the proxies' X-Forwarded-For
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        hops = app.config['PROXY_FIX_HOPS']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
+    # Upload folders, the default profile picture and the tables are set up by `flask init`
+    os.makedirs(app.instance_path, exist_ok=True)
 
     db.init_app(app)
+    metrics.init_app(app)
+    request_profiler.init_app(app)
+    warmup.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message_category = 'info'
     csrf.init_app(app)
+    fragment_cache.init_app(app)
+    invalidation_bus.init_app(app)
+    invalidation_bus.subscribe('fragments', fragment_cache.handle_remote_invalidation)
+    static_assets.init_app(app)
+    image_processor.init_app(app)
+    login_guard.init_app(app)
+    mail_sender.init_app(app)
+    view_recorder.init_app(app)
     
-    from app.utils.context_processors import inject_now
+    from app.utils.context_processors import inject_now, inject_image_helpers
     app.context_processor(inject_now)
+    app.context_processor(inject_image_helpers)
 
     from app.routes.main import main_bp
     from app.routes.auth import auth_bp
     from app.routes.posts import posts_bp
     from app.routes.errors import errors_bp
+    from app.routes.api import api_bp
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(posts_bp)
     app.register_blueprint(errors_bp)
+    app.register_blueprint(api_bp)
+
+    from app.cli import init_command, data_cli, assets_cli, images_cli, mail_cli, trending_cli
+    app.cli.add_command(init_command)
+    app.cli.add_command(data_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(images_cli)
+    app.cli.add_command(mail_cli)
+    app.cli.add_command(trending_cli)
 
     @app.shell_context_processor
     def make_shell_context():
@@ -72,6 +168,31 @@ def create_app(test_config=None):
         return {'db': db, 'User': User, 'Post': Post}
 
     with app.app_context():
-        db.create_all()
+        if db.engine.dialect.name == 'sqlite':
+            from sqlalchemy import event
+            from app.utils.db_utils import enable_sqlite_foreign_keys
+            event.listen(db.engine, 'connect', enable_sqlite_foreign_keys)
 
     return app
+
+
+def initialize(app):
+    """
+    One-off setup of a deployment: the upload folders, the default profile
+    picture and the database tables. Run by `flask init`, not on every start.
+    """
+    upload_folder = app.config['UPLOAD_FOLDER']
+    for folder in ('profile_pics', 'post_images'):
+        os.makedirs(os.path.join(upload_folder, folder), exist_ok=True)
+
+    # Check if default profile image exists and has content
+    default_profile_path = os.path.join(upload_folder, 'default_profile.jpg')
+    if not os.path.exists(default_profile_path) or os.path.getsize(default_profile_path) < 100:
+        from PIL import Image, ImageDraw
+        img = Image.new('RGB', (150, 150), color=(73, 109, 137))
+        d = ImageDraw.Draw(img)
+        d.ellipse((10, 10, 140, 140), fill=(255, 255, 255))
+        img.save(default_profile_path)
+
+    with app.app_context():
+        db.create_all()
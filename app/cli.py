@@ -0,0 +1,401 @@
+"""
+Command line tools.
+The data group exports and imports posts, comments, tags and users as JSONL files,
+streaming rows in fixed size batches so memory use does not grow with the data.
+The assets group builds the fingerprinted static files and the images group
+maintains the resized variants of uploaded pictures. The mail group sends and
+inspects the outbound mail queue. The trending group compacts and rebuilds the
+trending scores. `flask init` does the one-off setup of a deployment.
+"""
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+from itertools import islice
+
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+
+from app import db
+from app.utils.cache import clear_fragments
+
+data_cli = AppGroup('data', help='Bulk export, import and clearing of application data.')
+assets_cli = AppGroup('assets', help='Build fingerprinted and compressed static assets.')
+images_cli = AppGroup('images', help='Maintain resized variants of uploaded pictures.')
+mail_cli = AppGroup('mail', help='Send and inspect the outbound mail queue.')
+trending_cli = AppGroup('trending', help='Maintain the trending post scores.')
+
+# Tables in dependency order, the derived tables are rebuilt after imports
+EXPORT_TABLES = ['users', 'tags', 'posts', 'comments', 'post_tags']
+DERIVED_TABLES = ['tag_counts', 'upload_refs']
+
+
+def get_table(name):
+    """Get a table from the model metadata by name"""
+    # Import the models so their tables are registered
+    from app.models import post, upload, user  # noqa: F401
+    return db.metadata.tables[name]
+
+
+def encode_value(value):
+    """Convert a column value to a JSON compatible value"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_rows(table, batch_size):
+    """Stream a table's rows as dicts without loading the table into memory"""
+    result = db.session.execute(
+        db.select(table).order_by(*table.primary_key.columns).execution_options(yield_per=batch_size)
+    )
+    for row in result.mappings():
+        yield {key: encode_value(value) for key, value in row.items()}
+
+
+def iter_jsonl(path):
+    """Stream the records of a JSONL file"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_batches(records, batch_size):
+    """Group an iterable into lists of at most batch_size items"""
+    records = iter(records)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def decode_row(table, record):
+    """Convert a JSONL record back into column values for an insert"""
+    row = {}
+    for column in table.columns:
+        if column.name not in record:
+            continue
+        value = record[column.name]
+        if value is not None and isinstance(column.type, db.DateTime):
+            value = datetime.fromisoformat(value)
+        row[column.name] = value
+
+    if table.name == 'posts' and 'excerpt' not in record:
+        # Older exports have no stored summary, compute it like Post does
+        from app.utils.text_utils import plain_text, make_excerpt, count_words
+        text = plain_text(record.get('content'))
+        row['excerpt'] = make_excerpt(text)
+        row['word_count'] = count_words(text)
+    return row
+
+
+def truncate_tables(tables):
+    """
+    Remove all rows from the given tables with set-based statements.
+
+    Args:
+        tables: Table objects in dependency order, parents first
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        names = ', '.join(table.name for table in tables)
+        db.session.execute(db.text(f'TRUNCATE {names} RESTART IDENTITY CASCADE'))
+    else:
+        # SQLite turns an unfiltered DELETE into a truncate of the table
+        for table in reversed(tables):
+            db.session.execute(table.delete())
+    db.session.commit()
+
+
+def rebuild_aggregates():
+    """Recompute derived counters after a bulk change"""
+    from app.models.post import Post, Comment, TagCount
+    from app.models.trending import TrendingScore
+    from app.models.upload import UploadRef
+
+    comment_counts = db.select(db.func.count()).where(
+        Comment.post_id == Post.id
+    ).scalar_subquery()
+    db.session.execute(
+        # Recomputing a counter does not modify the posts, updated_at is kept
+        db.update(Post).values(comment_count=comment_counts, updated_at=Post.updated_at),
+        execution_options={'synchronize_session': False}
+    )
+    TagCount.rebuild()
+    TrendingScore.rebuild()
+    UploadRef.rebuild()
+    db.session.commit()
+
+
+@click.command('init')
+@with_appcontext
+def init_command():
+    """Create the upload folders, default profile picture and database tables."""
+    from app import initialize
+    initialize(current_app._get_current_object())
+    click.echo('Initialized the upload folders and the database')
+
+
+@data_cli.command('export')
+@click.argument('directory', type=click.Path(file_okay=False))
+@click.option('--batch-size', default=1000, show_default=True, help='Rows fetched per round trip.')
+def export_data(directory, batch_size):
+    """Export users, tags, posts, comments and post tags to DIRECTORY as JSONL."""
+    os.makedirs(directory, exist_ok=True)
+
+    for name in EXPORT_TABLES:
+        table = get_table(name)
+        path = os.path.join(directory, f'{name}.jsonl')
+        count = 0
+        with open(path, 'w', encoding='utf-8') as f:
+            for row in iter_rows(table, batch_size):
+                f.write(json.dumps(row, ensure_ascii=False))
+                f.write('\n')
+                count += 1
+        click.echo(f'Exported {count} rows to {path}')
+
+
+@data_cli.command('import')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--batch-size', default=1000, show_default=True, help='Rows inserted per transaction.')
+@click.option('--clear', is_flag=True, help='Remove existing data before importing.')
+def import_data(directory, batch_size, clear):
+    """Import JSONL files written by 'flask data export' from DIRECTORY."""
+    tables = [get_table(name) for name in EXPORT_TABLES]
+
+    if clear:
+        truncate_tables(tables + [get_table(name) for name in DERIVED_TABLES])
+
+    # Secondary indexes are rebuilt once at the end instead of on every insert
+    deferred_indexes = [index for table in tables for index in table.indexes if not index.unique]
+    bind = db.session.get_bind()
+    for index in deferred_indexes:
+        index.drop(bind, checkfirst=True)
+
+    try:
+        for table in tables:
+            path = os.path.join(directory, f'{table.name}.jsonl')
+            if not os.path.exists(path):
+                click.echo(f'Skipping {table.name}, {path} not found')
+                continue
+
+            count = 0
+            for batch in iter_batches(iter_jsonl(path), batch_size):
+                db.session.execute(table.insert(), [decode_row(table, record) for record in batch])
+                db.session.commit()
+                count += len(batch)
+            click.echo(f'Imported {count} rows into {table.name}')
+    finally:
+        db.session.rollback()
+        for index in deferred_indexes:
+            index.create(bind, checkfirst=True)
+
+    rebuild_aggregates()
+    clear_fragments()
+    click.echo('Rebuilt comment, tag and upload reference counts')
+
+
+@data_cli.command('clear')
+@click.confirmation_option(prompt='This will delete ALL posts, comments, tags and users. Continue?')
+def clear_data():
+    """Remove all posts, comments, tags and users."""
+    truncate_tables([get_table(name) for name in EXPORT_TABLES + DERIVED_TABLES])
+    clear_fragments()
+    click.echo('Database cleared successfully!')
+
+
+@assets_cli.command('build')
+def build_assets_command():
+    """Fingerprint and precompress CSS and JS into static/dist."""
+    from app.utils.assets import build_assets, brotli
+
+    manifest = build_assets(current_app.static_folder)
+    for filename, hashed in sorted(manifest.items()):
+        click.echo(f'{filename} -> {hashed}')
+    if brotli is None:
+        click.echo('brotli is not installed, only gzip variants were written')
+    click.echo('Restart the application to serve the new assets')
+
+
+@assets_cli.command('clean')
+def clean_assets_command():
+    """Remove built assets, the original files are served again."""
+    from app.utils.assets import DIST_FOLDER
+
+    shutil.rmtree(os.path.join(current_app.static_folder, DIST_FOLDER), ignore_errors=True)
+    click.echo('Removed built assets')
+
+
+def iter_upload_files(directory):
+    """Walk an upload folder and its shard directories, yielding (path, name relative to the folder)"""
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            yield path, os.path.relpath(path, directory).replace(os.sep, '/')
+
+
+@images_cli.command('backfill')
+@click.option('--folder', 'folders', multiple=True, type=click.Choice(['post_images', 'profile_pics']),
+              help='Upload folder to process, both by default.')
+@click.option('--force', is_flag=True, help='Rewrite variants that already exist.')
+def backfill_images(folders, force):
+    """Write missing WebP variants for pictures uploaded before they existed.
+
+    Uploads left unprocessed by a worker that stopped are processed too.
+    """
+    from PIL import UnidentifiedImageError
+    from app.utils.image_tasks import process_image
+    from app.utils.image_utils import (
+        FALLBACK_SIZES, PENDING_SUFFIX, generate_variants, is_variant, variant_widths
+    )
+
+    for folder in folders or ('post_images', 'profile_pics'):
+        directory = os.path.join(current_app.config['UPLOAD_FOLDER'], folder)
+        if not os.path.isdir(directory):
+            continue
+
+        processed = written = 0
+        for path, name in iter_upload_files(directory):
+            if is_variant(name) or name.endswith('.tmp'):
+                continue
+            try:
+                if name.endswith(PENDING_SUFFIX):
+                    widths = variant_widths(folder)
+                    process_image(
+                        path, directory, name[:-len(PENDING_SUFFIX)], FALLBACK_SIZES[folder],
+                        widths, current_app.config.get('IMAGE_WEBP_QUALITY', 80)
+                    )
+                    written += len(widths)
+                else:
+                    written += len(generate_variants(folder, name, force=force))
+                processed += 1
+            except (OSError, UnidentifiedImageError) as e:
+                click.echo(f'Skipping {folder}/{name}: {e}')
+        click.echo(f'{folder}: wrote {written} variants for {processed} pictures')
+    # Cached pages list the variants pictures had when they were rendered
+    clear_fragments()
+
+
+@images_cli.command('gc')
+@click.option('--min-age', default=3600, show_default=True,
+              help='Seconds since a file was written before it may be removed, so uploads whose record is not committed yet are kept.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows fetched per round trip.')
+@click.option('--dry-run', is_flag=True, help='List orphaned files without removing them.')
+def collect_garbage(min_age, batch_size, dry_run):
+    """Remove stored pictures no post or user refers to and resync reference counts."""
+    from app.models.post import Post
+    from app.models.upload import UploadRef
+    from app.models.user import User
+    from app.utils.image_utils import upload_stem
+
+    # Stream both columns into the set of names in use, per folder
+    referenced = {}
+    for folder, column in (('post_images', Post.image_file), ('profile_pics', User.profile_image)):
+        names = db.session.execute(
+            db.select(column).where(column.isnot(None)).execution_options(yield_per=batch_size)
+        ).scalars()
+        referenced[folder] = {upload_stem(name) for name in names}
+
+    cutoff = time.time() - min_age
+    for folder, stems in referenced.items():
+        directory = os.path.join(current_app.config['UPLOAD_FOLDER'], folder)
+        orphans = [
+            path for path, name in iter_upload_files(directory)
+            if upload_stem(name) not in stems and os.path.getmtime(path) < cutoff
+        ]
+        if dry_run:
+            for path in orphans:
+                click.echo(path)
+            click.echo(f'{folder}: {len(orphans)} orphaned files')
+            continue
+
+        removed = 0
+        for path in orphans:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        # Shard directories left empty
+        for root, dirs, files in os.walk(directory, topdown=False):
+            if root != directory and not os.listdir(root):
+                os.rmdir(root)
+        click.echo(f'{folder}: removed {removed} orphaned files')
+
+    if not dry_run:
+        UploadRef.rebuild()
+        db.session.commit()
+        click.echo('Rebuilt upload reference counts')
+
+
+@mail_cli.command('send')
+def send_mail():
+    """Send every message that is due now, then exit."""
+    from app import mail_sender
+
+    claimed = 0
+    while True:
+        count = mail_sender.send_due()
+        claimed += count
+        if count < current_app.config.get('MAIL_BATCH_SIZE', 50):
+            break
+    stats = mail_sender.stats()
+    click.echo(f"Sent {stats['sent']} of {claimed} messages, {stats['retried']} will be retried, {stats['failed']} failed")
+
+
+@mail_cli.command('worker')
+def mail_worker():
+    """Send queued messages continuously, for deployments with MAIL_SENDER_THREAD=0."""
+    from app import mail_sender
+
+    click.echo('Sending queued mail, press Ctrl+C to stop')
+    try:
+        mail_sender.run()
+    except KeyboardInterrupt:
+        pass
+
+
+@mail_cli.command('status')
+def mail_status():
+    """Show the number of pending and failed messages."""
+    from app.models.email import OutboundEmail
+
+    counts = dict(db.session.query(OutboundEmail.status, db.func.count()).group_by(OutboundEmail.status))
+    click.echo(f"pending: {counts.get('pending', 0)}, failed: {counts.get('failed', 0)}")
+
+
+@mail_cli.command('retry')
+def retry_mail():
+    """Queue failed messages again."""
+    from app.models.email import OutboundEmail
+
+    result = db.session.execute(
+        db.update(OutboundEmail).where(OutboundEmail.status == 'failed').values(
+            status='pending', attempts=0, next_attempt_at=datetime.utcnow()
+        )
+    )
+    db.session.commit()
+    click.echo(f'Queued {result.rowcount} failed messages again')
+
+
+@trending_cli.command('compact')
+def compact_trending():
+    """Rescale trending scores to now and drop decayed ones, run it e.g. hourly."""
+    from app.models.trending import TrendingScore
+
+    removed = TrendingScore.compact()
+    db.session.commit()
+    click.echo(f'Compacted trending scores, removed {removed}')
+
+
+@trending_cli.command('rebuild')
+def rebuild_trending():
+    """Recompute every trending score from the comments."""
+    from app.models.trending import TrendingScore
+
+    TrendingScore.rebuild()
+    db.session.commit()
+    click.echo('Rebuilt the trending scores')
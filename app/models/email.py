@@ -0,0 +1,80 @@
+import uuid
+from datetime import datetime, timedelta
+from app import db
+
+
+class OutboundEmail(db.Model):
+    """Email waiting to be sent by the background mail sender"""
+    __tablename__ = 'outbound_emails'
+    __table_args__ = (
+        db.Index('ix_outbound_emails_due', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    html_body = db.Column(db.Text, nullable=False)
+    # 'pending' until sent, sent messages are deleted; 'failed' once retries run out
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Sender that claimed the message, the claim lapses at next_attempt_at
+    claim = db.Column(db.String(32))
+    last_error = db.Column(db.String(300))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<OutboundEmail {self.id} to {self.recipient}: {self.status}>'
+
+    @staticmethod
+    def queue(subject, recipient, html_body):
+        """
+        Add a message to the queue, sent once the current transaction is committed.
+
+        Returns:
+            OutboundEmail: The queued message
+        """
+        message = OutboundEmail(recipient=recipient, subject=subject, html_body=html_body)
+        db.session.add(message)
+        return message
+
+    @staticmethod
+    def claim_due(limit, lease):
+        """
+        Claim up to `limit` messages that are due, oldest first.
+
+        Due messages are looked up with a read first, so polling an empty queue
+        never takes the write lock. The claim is then a single UPDATE that
+        rechecks that the messages are still due, so concurrent senders never
+        get the same message. Claimed messages are not due again for `lease`
+        seconds, a sender that dies mid-batch leaves them to be retried after that.
+
+        Returns:
+            list: Claimed OutboundEmail rows
+        """
+        now = datetime.utcnow()
+        is_due = (OutboundEmail.status == 'pending', OutboundEmail.next_attempt_at <= now)
+        due_ids = db.session.execute(
+            db.select(OutboundEmail.id).where(*is_due)
+            .order_by(OutboundEmail.next_attempt_at, OutboundEmail.id).limit(limit)
+        ).scalars().all()
+        if not due_ids:
+            # Ends the read transaction, nothing was written
+            db.session.commit()
+            return []
+
+        token = uuid.uuid4().hex
+        db.session.execute(
+            db.update(OutboundEmail).where(OutboundEmail.id.in_(due_ids), *is_due).values(
+                claim=token, next_attempt_at=now + timedelta(seconds=lease)
+            ),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        return OutboundEmail.query.filter_by(claim=token).order_by(OutboundEmail.id).all()
+
+    @staticmethod
+    def pending_count():
+        return db.session.query(db.func.count(OutboundEmail.id)).filter(
+            OutboundEmail.status == 'pending'
+        ).scalar()
@@ -3,8 +3,8 @@ from app import db
 
 # Tags association table for many-to-many relationship
 post_tags = db.Table('post_tags',
-    db.Column('post_id', db.Integer, db.ForeignKey('posts.id'), primary_key=True),
-    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id'), primary_key=True)
+    db.Column('post_id', db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id', ondelete='CASCADE'), primary_key=True)
 )
 
 class Post(db.Model):
@@ -14,17 +14,24 @@ class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(120), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    excerpt = db.Column(db.String(200), nullable=False, default='')
+    word_count = db.Column(db.Integer, nullable=False, default=0)
     image_file = db.Column(db.String(120))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     published = db.Column(db.Boolean, default=True)
+    comment_count = db.Column(db.Integer, nullable=False, default=0)
+    # When the image finished processing or was dropped, listings revalidate on it
+    image_updated_at = db.Column(db.DateTime)
     
     # Foreign keys
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     
-    # Relationships
-    comments = db.relationship('Comment', backref='post', lazy='dynamic', cascade='all, delete-orphan')
-    tags = db.relationship('Tag', secondary=post_tags, backref=db.backref('posts', lazy='dynamic'))
+    # Relationships, child rows are removed by ON DELETE CASCADE in the database
+    comments = db.relationship('Comment', backref='post', lazy='dynamic',
+                               cascade='all, delete-orphan', passive_deletes=True)
+    tags = db.relationship('Tag', secondary=post_tags, passive_deletes=True,
+                           backref=db.backref('posts', lazy='dynamic', passive_deletes=True))
     
     def __init__(self, title, content, user_id, image_file=None, published=True):
         self.title = title
@@ -33,6 +40,16 @@ class Post(db.Model):
         self.image_file = image_file
         self.published = published
     
+    @db.validates('content')
+    def update_summary(self, key, content):
+        """Keep the stored excerpt and word count in sync with the content"""
+        from app.utils.text_utils import plain_text, make_excerpt, count_words
+        
+        text = plain_text(content)
+        self.excerpt = make_excerpt(text)
+        self.word_count = count_words(text)
+        return content
+    
     def add_tag(self, tag):
         """Add a tag to the post"""
         if tag not in self.tags:
@@ -43,47 +60,110 @@ class Post(db.Model):
         if tag in self.tags:
             self.tags.remove(tag)
     
+    def set_tags(self, tag_names, was_published=None):
+        """
+        Replace the post's tags, touching only the rows that changed.
+        
+        Tag counts are adjusted for the difference, taking into account
+        whether the post was and is published.
+        
+        Args:
+            tag_names (list): Normalized tag names, see Tag.normalize_names
+            was_published (bool): Whether the post was published before this
+                change, read from the attribute history if not given. Any
+                flush since published was set resets that history
+        """
+        # Read the published history first, queries below autoflush and reset it
+        state = db.inspect(self)
+        if state.transient or state.pending:
+            was_published = False
+            old_tags = []
+        else:
+            if was_published is None:
+                history = state.attrs.published.history
+                was_published = bool(history.deleted[0]) if history.deleted else bool(self.published)
+            old_tags = list(self.tags)
+        
+        tags = Tag.resolve(tag_names)
+        old_ids = {tag.id for tag in old_tags}
+        new_ids = {tag.id for tag in tags}
+        
+        for tag in old_tags:
+            if tag.id not in new_ids:
+                self.tags.remove(tag)
+        for tag in tags:
+            if tag.id not in old_ids:
+                self.tags.append(tag)
+        
+        if old_tags and old_ids != new_ids:
+            # Tag changes do not touch the posts row, mark the post as modified anyway
+            self.updated_at = datetime.utcnow()
+        
+        deltas = {}
+        if was_published:
+            for tag_id in old_ids:
+                deltas[tag_id] = deltas.get(tag_id, 0) - 1
+        if self.published:
+            for tag_id in new_ids:
+                deltas[tag_id] = deltas.get(tag_id, 0) + 1
+        TagCount.adjust(deltas)
+    
+    def release_tags(self):
+        """Remove this post from the tag counts before it is deleted"""
+        if self.published:
+            TagCount.adjust({tag.id: -1 for tag in self.tags})
+    
     def __repr__(self):
         return f'<Post {self.title}>'
+    
+    @staticmethod
+    def adjust_comment_count(post_id, delta):
+        """
+        Change a post's comment count in place.
+        
+        Comments do not modify the post, so updated_at is kept as it is.
+        """
+        db.session.execute(
+            db.update(Post).where(Post.id == post_id).values(
+                comment_count=Post.comment_count + delta, updated_at=Post.updated_at
+            )
+        )
         
     @staticmethod
     def get_similar_posts(post_id, limit=3):
-        """Get similar posts based on content similarity"""
+        """Get similar posts based on content similarity, as PostCard objects"""
         from app.utils.ai.recommendation import get_similar_posts
-        from app import db
+        from app.models.read_models import card_query, load_cards
         
         similar_post_ids = get_similar_posts(post_id, num_recommendations=limit)
         
         if not similar_post_ids:
             # If no recommendations, return recent posts
-            return Post.query.filter_by(published=True).filter(
-                Post.id != post_id
-            ).order_by(Post.created_at.desc()).limit(limit).all()
+            return load_cards(card_query().filter(
+                Post.published == True, Post.id != post_id
+            ).order_by(Post.created_at.desc()).limit(limit))
         
-        # Get the actual post objects
-        similar_posts = Post.query.filter(
+        # Get the listed columns of the similar posts
+        return load_cards(card_query().filter(
             Post.id.in_(similar_post_ids),
             Post.published == True
-        ).all()
-        
-        return similar_posts
+        ))
         
     @staticmethod
     def get_recommendations_for_user(user_id, limit=5):
-        """Get personalized recommendations for a user"""
+        """Get personalized recommendations for a user, as PostCard objects"""
         from app.utils.ai.recommendation import get_user_recommendations
-        from app import db
         
-        # Get all published posts for the recommendation engine
-        all_posts = Post.query.filter_by(published=True).all()
-        
-        # Get recommendations
-        return get_user_recommendations(user_id, all_posts, num_recommendations=limit)
+        return get_user_recommendations(user_id, num_recommendations=limit)
 
 
 class Comment(db.Model):
     """Comment model for post comments"""
     __tablename__ = 'comments'
+    __table_args__ = (
+        # Serves the keyset pagination in get_page
+        db.Index('ix_comments_post_created', 'post_id', 'created_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
@@ -95,11 +175,13 @@ class Comment(db.Model):
     sentiment_subjectivity = db.Column(db.Float, default=0.0)
     
     # Foreign keys
-    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     
     # Relationships
-    user = db.relationship('User', backref=db.backref('comments', lazy='dynamic'))
+    user = db.relationship('User', backref=db.backref(
+        'comments', lazy='dynamic', cascade='all, delete-orphan', passive_deletes=True
+    ))
     
     def analyze_sentiment(self):
         """Analyze the sentiment of the comment content"""
@@ -115,6 +197,68 @@ class Comment(db.Model):
         from app.utils.ai.sentiment_analysis import get_sentiment_emoji
         return get_sentiment_emoji(self.sentiment)
     
+    def get_cursor(self):
+        """Get the pagination cursor pointing after this comment"""
+        return f'{self.created_at.isoformat()}_{self.id}'
+    
+    @staticmethod
+    def parse_cursor(cursor):
+        """
+        Parse a cursor made by get_cursor, aborting with 400 if it is malformed.
+        
+        Returns:
+            tuple: (created_at, id) or None if the cursor is missing
+        """
+        from flask import abort
+        
+        if not cursor:
+            return None
+        try:
+            created_at, comment_id = cursor.rsplit('_', 1)
+            return datetime.fromisoformat(created_at), int(comment_id)
+        except ValueError:
+            abort(400, description='Invalid cursor.')
+    
+    @staticmethod
+    def get_page(post_id, cursor=None, per_page=20):
+        """
+        Get one page of a post's comments, newest first.
+        
+        Uses keyset pagination on (created_at, id) so deep pages cost the same
+        as the first one, and loads the comment authors in the same query.
+        
+        Args:
+            post_id (int): The ID of the post
+            cursor (str): Cursor returned with the previous page, None for the first page
+            per_page (int): Number of comments per page
+            
+        Returns:
+            tuple: (list of Comment objects, cursor for the next page or None)
+        """
+        query = Comment.query.filter_by(post_id=post_id).options(
+            db.joinedload(Comment.user)
+        )
+        
+        position = Comment.parse_cursor(cursor)
+        if position:
+            created_at, comment_id = position
+            query = query.filter(
+                (Comment.created_at < created_at) |
+                ((Comment.created_at == created_at) & (Comment.id < comment_id))
+            )
+        
+        # Fetch one extra row to know whether there is a next page
+        comments = query.order_by(
+            Comment.created_at.desc(), Comment.id.desc()
+        ).limit(per_page + 1).all()
+        
+        next_cursor = None
+        if len(comments) > per_page:
+            comments = comments[:per_page]
+            next_cursor = comments[-1].get_cursor()
+        
+        return comments, next_cursor
+    
     def __repr__(self):
         return f'<Comment {self.id}>'
 
@@ -131,3 +275,112 @@ class Tag(db.Model):
     
     def __repr__(self):
         return f'<Tag {self.name}>'
+    
+    @staticmethod
+    def normalize(name):
+        """Lowercase a tag name, collapse whitespace and cap its length"""
+        return ' '.join(name.split()).lower()[:50]
+    
+    @staticmethod
+    def normalize_names(tags_text):
+        """
+        Parse a comma separated tag string into unique normalized names.
+        
+        Args:
+            tags_text (str): Raw tags field, e.g. "Python, flask,python"
+            
+        Returns:
+            list: Tag names in input order without duplicates or blanks
+        """
+        names = []
+        for raw_name in (tags_text or '').split(','):
+            name = Tag.normalize(raw_name)
+            if name and name not in names:
+                names.append(name)
+        return names
+    
+    @staticmethod
+    def resolve(names):
+        """
+        Get Tag objects for the given names, creating missing ones in bulk.
+        
+        Args:
+            names (list): Normalized tag names
+            
+        Returns:
+            list: Tag objects in the same order as names
+        """
+        from app.utils.db_utils import insert_ignore
+        
+        if not names:
+            return []
+        
+        tags = {tag.name: tag for tag in Tag.query.filter(Tag.name.in_(names))}
+        missing = [name for name in names if name not in tags]
+        
+        if missing:
+            # Another request may create the same tag concurrently, so ignore conflicts
+            insert_ignore(Tag, [{'name': name} for name in missing], ['name'])
+            tags.update({tag.name: tag for tag in Tag.query.filter(Tag.name.in_(missing))})
+        
+        return [tags[name] for name in names if name in tags]
+
+
+class TagCount(db.Model):
+    """Number of published posts per tag, maintained on every tag write"""
+    __tablename__ = 'tag_counts'
+
+    tag_id = db.Column(db.Integer, db.ForeignKey('tags.id', ondelete='CASCADE'), primary_key=True)
+    post_count = db.Column(db.Integer, nullable=False, default=0, index=True)
+    
+    tag = db.relationship('Tag', backref=db.backref('count', uselist=False))
+    
+    def __repr__(self):
+        return f'<TagCount {self.tag_id}: {self.post_count}>'
+    
+    @staticmethod
+    def adjust(deltas):
+        """
+        Apply count changes with a single upsert.
+        
+        Args:
+            deltas (dict): Mapping of tag id to the change in post count
+        """
+        from app.utils.db_utils import upsert_increment
+        
+        rows = [{'tag_id': tag_id, 'post_count': delta}
+                for tag_id, delta in deltas.items() if delta]
+        upsert_increment(TagCount, rows, ['tag_id'], 'post_count')
+    
+    @staticmethod
+    def get_count(tag_id):
+        """Get the number of published posts with a tag"""
+        count = db.session.query(TagCount.post_count).filter_by(tag_id=tag_id).scalar()
+        return count or 0
+    
+    @staticmethod
+    def popular(limit=10):
+        """
+        Get the most used tags.
+        
+        Returns:
+            list: (name, post_count) tuples, most used first
+        """
+        return db.session.query(Tag.name, TagCount.post_count).join(
+            TagCount, TagCount.tag_id == Tag.id
+        ).filter(TagCount.post_count > 0).order_by(
+            TagCount.post_count.desc(), Tag.name
+        ).limit(limit).all()
+    
+    @staticmethod
+    def rebuild():
+        """Recompute all tag counts from post_tags with one set-based statement"""
+        db.session.execute(TagCount.__table__.delete())
+        db.session.execute(
+            TagCount.__table__.insert().from_select(
+                ['tag_id', 'post_count'],
+                db.select(post_tags.c.tag_id, db.func.count()).join(
+                    Post, Post.id == post_tags.c.post_id
+                ).where(Post.published == True).group_by(post_tags.c.tag_id)
+            )
+        )
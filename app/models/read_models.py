@@ -0,0 +1,153 @@
+"""
+Read models for post listings.
+Selects only the columns that list and card views display into small
+slotted objects, instead of loading full Post entities with their content.
+"""
+from itertools import islice
+
+from flask_sqlalchemy.pagination import QueryPagination
+
+from app import db
+from app.models.post import Post, Tag, post_tags
+from app.models.user import User
+from app.utils.text_utils import make_excerpt
+
+CARD_COLUMNS = (
+    Post.id, Post.title, Post.excerpt, Post.word_count, Post.image_file,
+    Post.created_at, Post.published, Post.comment_count, Post.user_id,
+    User.username, User.first_name, User.last_name, User.profile_image
+)
+
+
+class AuthorCard:
+    """Post author fields shown next to a post"""
+    __slots__ = ('id', 'username', 'first_name', 'last_name', 'profile_image')
+
+    def __init__(self, id, username, first_name, last_name, profile_image):
+        self.id = id
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+        self.profile_image = profile_image
+
+    def get_full_name(self):
+        """Return the author's full name or username if not available"""
+        if self.first_name and self.last_name:
+            return f"{self.first_name} {self.last_name}"
+        return self.username
+
+
+class TagCard:
+    """Tag name attached to a listed post"""
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+
+class PostCard:
+    """Post fields needed by list pages and similar post cards"""
+    __slots__ = ('id', 'title', 'excerpt', 'word_count', 'image_file', 'created_at',
+                 'published', 'comment_count', 'user_id', 'author', 'tags')
+
+    def __init__(self, row):
+        (self.id, self.title, self.excerpt, self.word_count, self.image_file,
+         self.created_at, self.published, self.comment_count, self.user_id,
+         username, first_name, last_name, profile_image) = row
+        self.author = AuthorCard(self.user_id, username, first_name, last_name, profile_image)
+        self.tags = []
+
+    @property
+    def short_excerpt(self):
+        """Shorter excerpt for small cards"""
+        return make_excerpt(self.excerpt or '', 80)
+
+    def __repr__(self):
+        return f'<PostCard {self.title}>'
+
+
+def card_query():
+    """
+    Start a query that selects post card columns.
+    
+    Returns:
+        Query: Query over CARD_COLUMNS, filter and order it like a Post query
+    """
+    return db.session.query(*CARD_COLUMNS).join(User, User.id == Post.user_id)
+
+
+def attach_tags(cards):
+    """Load the tag names of all cards with one query"""
+    by_id = {card.id: card for card in cards}
+    if not by_id:
+        return cards
+    
+    rows = db.session.query(post_tags.c.post_id, Tag.name).join(
+        Tag, Tag.id == post_tags.c.tag_id
+    ).filter(post_tags.c.post_id.in_(by_id)).order_by(Tag.name)
+    
+    for post_id, name in rows:
+        by_id[post_id].tags.append(TagCard(name))
+    return cards
+
+
+def load_cards(query):
+    """
+    Run a card query.
+    
+    Returns:
+        list: PostCard objects with their tags
+    """
+    return attach_tags([PostCard(row) for row in query])
+
+
+def paginate_cards(query, page, per_page, count=True):
+    """
+    Paginate a card query.
+    
+    Returns:
+        Pagination: Pagination whose items are PostCard objects with their tags
+    """
+    pagination = query.paginate(page=page, per_page=per_page, count=count)
+    pagination.items = attach_tags([PostCard(row) for row in pagination.items])
+    return pagination
+
+
+class CardStream:
+    """Post cards of a query, fetched in batches from a server-side cursor while iterating"""
+
+    def __init__(self, query, batch_size=100):
+        self.query = query
+        self.batch_size = batch_size
+
+    def __iter__(self):
+        rows = iter(self.query.yield_per(self.batch_size))
+        while True:
+            batch = attach_tags([PostCard(row) for row in islice(rows, self.batch_size)])
+            if not batch:
+                return
+            yield from batch
+
+
+class StreamedCardPagination(QueryPagination):
+    """Pagination whose items are a CardStream, run when the page template reaches them"""
+
+    def _query_items(self):
+        query = self._query_args['query'].limit(self.per_page).offset(self._query_offset)
+        return CardStream(query, self._query_args.get('batch_size', 100))
+
+
+def stream_cards(query, page, per_page, batch_size=100):
+    """
+    Paginate a card query without loading the page up front.
+    
+    Only the count runs here, the items are streamed in batches of batch_size
+    so pages with a large per_page are rendered in constant memory.
+    
+    Returns:
+        Pagination: Pagination whose items are a CardStream
+    """
+    return StreamedCardPagination(
+        query=query, batch_size=batch_size,
+        page=page, per_page=per_page, max_per_page=None, error_out=False
+    )
@@ -0,0 +1,216 @@
+"""
+Trending scores.
+Every comment adds its weight, 1 + TRENDING_SENTIMENT_WEIGHT * polarity, and
+every view TRENDING_VIEW_WEIGHT to its post's score, decayed exponentially
+with a half-life of TRENDING_HALF_LIFE hours. Instead of decaying every
+score as time passes, weights are stored scaled up by
+exp(decay * (created_at - epoch)); the current score of every post is then
+its stored score times the same factor, so ordering by the stored column
+ranks posts by their current score. Scores are kept up to date as comments
+are added or removed and view batches are written, and `flask trending
+compact` moves the epoch forward by rescaling every score, which keeps the
+stored numbers small and drops posts that stopped trending.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime
+
+from flask import current_app
+
+from app import db
+
+# Stored scores below this, in current units, are removed by compaction
+MIN_SCORE = 1e-3
+# Compaction happens inline before scale factors could lose precision
+MAX_EXPONENT = 100
+
+
+class TrendingEpoch(db.Model):
+    """The single row holding the time stored trending scores are relative to"""
+    __tablename__ = 'trending_epoch'
+
+    id = db.Column(db.Integer, primary_key=True)
+    epoch = db.Column(db.DateTime, nullable=False)
+
+    @staticmethod
+    def current():
+        """
+        Get the epoch, creating it on first use.
+
+        The row is read with a shared lock on databases that have one, so a
+        compaction cannot move the epoch before the caller commits.
+        """
+        epoch = db.session.query(TrendingEpoch.epoch).filter_by(id=1).with_for_update(read=True).scalar()
+        if epoch is None:
+            from app.utils.db_utils import insert_ignore
+            insert_ignore(TrendingEpoch, [{'id': 1, 'epoch': datetime.utcnow()}], ['id'])
+            epoch = db.session.query(TrendingEpoch.epoch).filter_by(id=1).scalar()
+        return epoch
+
+
+class TrendingScore(db.Model):
+    """Time-decayed comment activity per post, relative to TrendingEpoch"""
+    __tablename__ = 'trending_scores'
+
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Float, nullable=False, default=0.0, index=True)
+
+    def __repr__(self):
+        return f'<TrendingScore {self.post_id}: {self.score}>'
+
+    @staticmethod
+    def decay_rate():
+        """Decay per second for the configured half-life"""
+        return math.log(2) / (current_app.config.get('TRENDING_HALF_LIFE', 24) * 3600)
+
+    @staticmethod
+    def weight(polarity):
+        """Weight of one comment, positive comments count for more"""
+        sentiment_weight = current_app.config.get('TRENDING_SENTIMENT_WEIGHT', 0.5)
+        return max(0.0, 1.0 + sentiment_weight * (polarity or 0.0))
+
+    @staticmethod
+    def add(activity):
+        """
+        Add weighted activity to post scores with a single upsert.
+
+        Args:
+            activity: (post_id, time, weight) tuples, negative weights take activity out down to a score of 0
+        """
+        from app.utils.db_utils import upsert_increment
+
+        activity = list(activity)
+        if not activity:
+            return
+
+        epoch = TrendingEpoch.current()
+        rate = TrendingScore.decay_rate()
+        if max(rate * (time - epoch).total_seconds() for _, time, _ in activity) > MAX_EXPONENT:
+            TrendingScore.compact()
+            epoch = TrendingEpoch.current()
+
+        deltas = defaultdict(float)
+        for post_id, time, weight in activity:
+            deltas[post_id] += weight * math.exp(rate * (time - epoch).total_seconds())
+
+        rows = [{'post_id': post_id, 'score': delta} for post_id, delta in deltas.items() if delta > 0]
+        upsert_increment(TrendingScore, rows, ['post_id'], 'score')
+
+        # Removed activity only lowers existing scores and never below zero, compaction
+        # may already have dropped or shrunk a score past what is taken out
+        removals = [{'_post_id': post_id, '_delta': delta} for post_id, delta in deltas.items() if delta < 0]
+        if removals:
+            table = TrendingScore.__table__
+            lowered = table.c.score + db.bindparam('_delta')
+            db.session.execute(
+                table.update().where(table.c.post_id == db.bindparam('_post_id')).values(
+                    score=db.case((lowered < 0, 0.0), else_=lowered)
+                ),
+                removals
+            )
+
+    @staticmethod
+    def adjust(comments, sign=1):
+        """
+        Add or remove the contribution of comments.
+
+        Args:
+            comments: (post_id, created_at, sentiment_polarity) tuples
+            sign (int): 1 for added comments, -1 for removed ones
+        """
+        TrendingScore.add(
+            (post_id, created_at, sign * TrendingScore.weight(polarity))
+            for post_id, created_at, polarity in comments
+        )
+
+    @staticmethod
+    def record_views(views):
+        """
+        Add post views, each worth TRENDING_VIEW_WEIGHT of a neutral comment.
+
+        Args:
+            views (dict): post_id -> (number of views, time of the last one)
+        """
+        view_weight = current_app.config.get('TRENDING_VIEW_WEIGHT', 0.05)
+        if view_weight:
+            TrendingScore.add(
+                (post_id, last_viewed_at, view_weight * count)
+                for post_id, (count, last_viewed_at) in views.items()
+            )
+
+    @staticmethod
+    def record_comment(comment):
+        """Add a new comment to its post's score"""
+        TrendingScore.adjust([(comment.post_id, comment.created_at or datetime.utcnow(), comment.sentiment_polarity)])
+
+    @staticmethod
+    def remove_comment(comment):
+        """Take a deleted comment out of its post's score"""
+        TrendingScore.adjust([(comment.post_id, comment.created_at, comment.sentiment_polarity)], sign=-1)
+
+    @staticmethod
+    def top(limit=10):
+        """
+        Get the highest scoring published posts.
+
+        Reads the score index from the top, published is checked per row.
+
+        Returns:
+            list: (post_id, current score) tuples, highest first
+        """
+        from app.models.post import Post
+
+        rows = db.session.query(TrendingScore.post_id, TrendingScore.score).join(
+            Post, Post.id == TrendingScore.post_id
+        ).filter(Post.published == True).order_by(TrendingScore.score.desc()).limit(limit).all()
+        if not rows:
+            return []
+
+        epoch = db.session.query(TrendingEpoch.epoch).filter_by(id=1).scalar()
+        factor = math.exp(-TrendingScore.decay_rate() * (datetime.utcnow() - epoch).total_seconds())
+        return [(post_id, score * factor) for post_id, score in rows]
+
+    @staticmethod
+    def compact(now=None):
+        """
+        Move the epoch to now, rescaling every stored score, and remove
+        scores that have decayed below MIN_SCORE.
+
+        Returns:
+            int: Number of removed scores
+        """
+        now = now or datetime.utcnow()
+        TrendingEpoch.current()
+        # Lock the epoch before any score, the same order comment writes take them in
+        epoch = db.session.query(TrendingEpoch.epoch).filter_by(id=1).with_for_update().scalar()
+        factor = math.exp(-TrendingScore.decay_rate() * (now - epoch).total_seconds())
+
+        table = TrendingScore.__table__
+        db.session.execute(table.update().values(score=table.c.score * factor))
+        removed = db.session.execute(table.delete().where(table.c.score < MIN_SCORE)).rowcount
+        db.session.execute(TrendingEpoch.__table__.update().where(TrendingEpoch.id == 1).values(epoch=now))
+        return removed
+
+    @staticmethod
+    def rebuild(batch_size=1000):
+        """Recompute every score from the comments, streaming them in batches, views are not replayed"""
+        from app.models.post import Comment
+
+        now = datetime.utcnow()
+        db.session.execute(TrendingScore.__table__.delete())
+        db.session.execute(TrendingEpoch.__table__.delete())
+        db.session.execute(TrendingEpoch.__table__.insert().values(id=1, epoch=now))
+
+        rate = TrendingScore.decay_rate()
+        scores = defaultdict(float)
+        comments = db.session.execute(
+            db.select(Comment.post_id, Comment.created_at, Comment.sentiment_polarity).execution_options(
+                yield_per=batch_size
+            )
+        )
+        for post_id, created_at, polarity in comments:
+            scores[post_id] += TrendingScore.weight(polarity) * math.exp(rate * (created_at - now).total_seconds())
+
+        rows = [{'post_id': post_id, 'score': score} for post_id, score in scores.items() if score >= MIN_SCORE]
+        for start in range(0, len(rows), batch_size):
+            db.session.execute(TrendingScore.__table__.insert(), rows[start:start + batch_size])
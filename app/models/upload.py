@@ -0,0 +1,83 @@
+from collections import Counter
+from app import db
+
+
+class UploadRef(db.Model):
+    """Number of records using a stored upload, identical uploads share one file"""
+    __tablename__ = 'upload_refs'
+
+    # Path relative to UPLOAD_FOLDER, e.g. 'post_images/ab/cd/abcd....jpg'
+    path = db.Column(db.String(160), primary_key=True)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<UploadRef {self.path}: {self.ref_count}>'
+
+    @staticmethod
+    def adjust(deltas):
+        """
+        Apply reference count changes with a single upsert.
+
+        Args:
+            deltas (dict): Mapping of upload path to the change in references
+        """
+        from app.utils.db_utils import upsert_increment
+
+        rows = [{'path': path, 'ref_count': delta}
+                for path, delta in deltas.items() if delta]
+        upsert_increment(UploadRef, rows, ['path'], 'ref_count')
+
+    @staticmethod
+    def acquire(*paths):
+        """Add a reference to each upload path"""
+        UploadRef.adjust(Counter(path for path in paths if path))
+
+    @staticmethod
+    def release(*paths):
+        """
+        Drop a reference to each upload path.
+
+        Returns:
+            list: Paths no longer used by any record, to remove with
+                delete_files once the change is committed
+        """
+        deltas = Counter(path for path in paths if path)
+        if not deltas:
+            return []
+
+        UploadRef.adjust({path: -count for path, count in deltas.items()})
+        # Uploads stored before reference counting have no row and a single user
+        unused = [
+            path for (path,) in db.session.query(UploadRef.path).filter(
+                UploadRef.path.in_(deltas), UploadRef.ref_count <= 0
+            )
+        ]
+        db.session.execute(
+            db.delete(UploadRef).where(UploadRef.path.in_(unused)),
+            execution_options={'synchronize_session': False}
+        )
+        return unused
+
+    @staticmethod
+    def rebuild():
+        """Recompute all reference counts from the posts and users tables"""
+        from app.models.post import Post
+        from app.models.user import User
+        from app.utils.image_utils import DEFAULT_PROFILE_IMAGE
+
+        references = db.union_all(
+            db.select((db.literal('post_images/') + Post.image_file).label('path')).where(
+                Post.image_file.isnot(None)
+            ),
+            db.select((db.literal('profile_pics/') + User.profile_image).label('path')).where(
+                User.profile_image.isnot(None), User.profile_image != DEFAULT_PROFILE_IMAGE
+            )
+        ).subquery()
+
+        db.session.execute(UploadRef.__table__.delete())
+        db.session.execute(
+            UploadRef.__table__.insert().from_select(
+                ['path', 'ref_count'],
+                db.select(references.c.path, db.func.count()).group_by(references.c.path)
+            )
+        )
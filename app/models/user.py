@@ -1,8 +1,7 @@
 from datetime import datetime
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
-
 from app import db, login_manager
+from app.utils.login_guard import hash_password, verify_password
 
 class User(db.Model, UserMixin):
     """User model for authentication and user management"""
@@ -21,9 +20,12 @@ class User(db.Model, UserMixin):
     is_active = db.Column(db.Boolean, default=True)
     reset_token = db.Column(db.String(100))
     reset_token_expiration = db.Column(db.DateTime)
+    # Last change of the name or picture shown next to the user's posts and comments
+    profile_updated_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
-    posts = db.relationship('Post', backref='author', lazy='dynamic', cascade='all, delete-orphan')
+    posts = db.relationship('Post', backref='author', lazy='dynamic',
+                            cascade='all, delete-orphan', passive_deletes=True)
     
     def __init__(self, username, email, password, first_name=None, last_name=None):
         self.username = username
@@ -34,17 +36,66 @@ class User(db.Model, UserMixin):
     
     def set_password(self, password):
         """Set password hash from plain text password"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
         """Check if password matches the hash"""
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
     
     def update_last_seen(self):
         """Update the last seen timestamp"""
         self.last_seen = datetime.utcnow()
         db.session.commit()
     
+    def delete_account(self):
+        """
+        Delete the user together with all of their posts and comments.
+        
+        The posts, comments and tag links are removed by ON DELETE CASCADE,
+        so only the counters they feed are corrected here, with set-based updates.
+        
+        Returns:
+            list: Upload paths no other record uses, to remove with delete_files once the delete is committed
+        """
+        from app.models.post import Post, Comment, TagCount, post_tags
+        from app.models.upload import UploadRef
+        from app.models.trending import TrendingScore
+        
+        image_files = [
+            f'post_images/{image_file}' for (image_file,) in db.session.query(Post.image_file).filter(
+                Post.user_id == self.id, Post.image_file.isnot(None)
+            )
+        ]
+        if self.profile_image and self.profile_image != 'default_profile.jpg':
+            image_files.append(f'profile_pics/{self.profile_image}')
+        
+        # Tags lose the user's published posts
+        tag_rows = db.session.query(post_tags.c.tag_id, db.func.count()).join(
+            Post, Post.id == post_tags.c.post_id
+        ).filter(Post.user_id == self.id, Post.published == True).group_by(post_tags.c.tag_id)
+        TagCount.adjust({tag_id: -count for tag_id, count in tag_rows})
+        
+        # Other users' posts lose the user's comments
+        user_comments = db.select(db.func.count()).where(
+            Comment.post_id == Post.id, Comment.user_id == self.id
+        ).scalar_subquery()
+        db.session.execute(
+            db.update(Post).where(
+                Post.user_id != self.id,
+                Post.id.in_(db.select(Comment.post_id).where(Comment.user_id == self.id))
+            ).values(comment_count=Post.comment_count - user_comments, updated_at=Post.updated_at),
+            execution_options={'synchronize_session': False}
+        )
+        TrendingScore.adjust(db.session.query(
+            Comment.post_id, Comment.created_at, Comment.sentiment_polarity
+        ).join(Post, Post.id == Comment.post_id).filter(
+            Comment.user_id == self.id, Post.user_id != self.id
+        ), sign=-1)
+        
+        unused_files = UploadRef.release(*image_files)
+        db.session.delete(self)
+        return unused_files
+    
     def get_full_name(self):
         """Return user's full name or username if not available"""
         if self.first_name and self.last_name:
@@ -0,0 +1,86 @@
+from app import db
+
+
+class PostViewCount(db.Model):
+    """Number of times a post has been viewed, written in batches by the view recorder"""
+    __tablename__ = 'post_view_counts'
+
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), primary_key=True)
+    views = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<PostViewCount {self.post_id}: {self.views}>'
+
+    @staticmethod
+    def get_count(post_id):
+        """Get the number of recorded views of a post"""
+        count = db.session.query(PostViewCount.views).filter_by(post_id=post_id).scalar()
+        return count or 0
+
+
+class PostView(db.Model):
+    """Views of a post by one signed-in user"""
+    __tablename__ = 'post_views'
+    __table_args__ = (
+        # Serves the most recently viewed posts of a user
+        db.Index('ix_post_views_user_viewed', 'user_id', 'last_viewed_at'),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), primary_key=True)
+    view_count = db.Column(db.Integer, nullable=False, default=0)
+    last_viewed_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<PostView {self.user_id} {self.post_id}: {self.view_count}>'
+
+    @staticmethod
+    def recent_post_ids(user_id, limit=20):
+        """
+        Get the posts a user viewed most recently.
+
+        Returns:
+            list: Post IDs, most recently viewed first
+        """
+        return [post_id for (post_id,) in db.session.query(PostView.post_id).filter_by(
+            user_id=user_id
+        ).order_by(PostView.last_viewed_at.desc()).limit(limit)]
+
+    @staticmethod
+    def merge(events):
+        """
+        Write merged view events with one upsert per table.
+
+        Posts and users deleted since the views happened are skipped.
+
+        Args:
+            events (dict): (user_id or None, post_id) -> (number of views, time of the last one)
+
+        Returns:
+            dict: post_id -> (number of views, time of the last one) of the written views
+        """
+        from app.models.post import Post
+        from app.models.user import User
+        from app.utils.db_utils import upsert_increment
+
+        post_ids = {post_id for _, post_id in events}
+        existing_posts = {post_id for (post_id,) in db.session.query(Post.id).filter(Post.id.in_(post_ids))}
+        user_ids = {user_id for user_id, _ in events if user_id is not None}
+        existing_users = {user_id for (user_id,) in db.session.query(User.id).filter(User.id.in_(user_ids))} \
+            if user_ids else set()
+
+        per_post = {}
+        per_user = []
+        for (user_id, post_id), (count, last_viewed_at) in events.items():
+            if post_id not in existing_posts:
+                continue
+            total, latest = per_post.get(post_id, (0, last_viewed_at))
+            per_post[post_id] = (total + count, max(latest, last_viewed_at))
+            if user_id in existing_users:
+                per_user.append({'user_id': user_id, 'post_id': post_id,
+                                 'view_count': count, 'last_viewed_at': last_viewed_at})
+
+        upsert_increment(PostViewCount, [{'post_id': post_id, 'views': total}
+                                         for post_id, (total, _) in per_post.items()], ['post_id'], 'views')
+        upsert_increment(PostView, per_user, ['user_id', 'post_id'], 'view_count', replace=['last_viewed_at'])
+        return per_post
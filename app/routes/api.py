@@ -0,0 +1,375 @@
+"""
+Versioned JSON API for posts, comments, tags, search, trending posts and
+recommendations.
+Every list takes ?limit= and ?cursor= (the next_cursor of the previous page)
+and every resource takes ?fields= to return only some of its fields.
+"""
+from datetime import datetime
+
+from flask import Blueprint, abort, request, url_for
+from flask_login import current_user
+from werkzeug.exceptions import HTTPException
+
+from app import db, view_recorder
+from app.models.post import Post, Comment, Tag, TagCount, post_tags
+from app.models.trending import TrendingScore
+from app.models.view import PostViewCount
+from app.models.user import User
+from app.utils.api import (
+    Field, Fieldset, column_field, decode_cursor, encode_cursor, json_response, limit_arg, page_size
+)
+from app.utils.http_cache import body_etag, conditional
+from app.utils.image_utils import upload_ready, upload_url
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+AUTHOR_JOIN = ((User, User.id == Post.user_id),)
+COMMENT_AUTHOR_JOIN = ((User, User.id == Comment.user_id),)
+VIEW_COUNT_JOIN = ((PostViewCount, PostViewCount.post_id == Post.id, True),)
+
+
+def serialize_author(row):
+    return {
+        'id': row['author_id'],
+        'username': row['author_username'],
+        'name': f"{row['author_first_name']} {row['author_last_name']}"
+                if row['author_first_name'] and row['author_last_name'] else row['author_username'],
+        'profile_image_url': upload_url('profile_pics', row['author_profile_image']),
+    }
+
+
+AUTHOR_COLUMNS = (
+    User.id.label('author_id'), User.username.label('author_username'),
+    User.first_name.label('author_first_name'), User.last_name.label('author_last_name'),
+    User.profile_image.label('author_profile_image'),
+)
+
+POST_FIELDS = {
+    'id': column_field(Post.id, 'id'),
+    'title': column_field(Post.title, 'title'),
+    'excerpt': column_field(Post.excerpt, 'excerpt'),
+    'content': column_field(Post.content, 'content'),
+    'word_count': column_field(Post.word_count, 'word_count'),
+    'image_url': column_field(Post.image_file, 'image_file',
+                              lambda image_file: upload_url('post_images', image_file) if image_file else None),
+    'created_at': column_field(Post.created_at, 'created_at'),
+    'updated_at': column_field(Post.updated_at, 'updated_at'),
+    'published': column_field(Post.published, 'published'),
+    'comment_count': column_field(Post.comment_count, 'comment_count'),
+    'view_count': Field([db.func.coalesce(PostViewCount.views, 0).label('view_count')],
+                        lambda row: row['view_count'], VIEW_COUNT_JOIN),
+    'url': Field([Post.id.label('id')], lambda row: url_for('posts.post', post_id=row['id'])),
+    'author': Field(AUTHOR_COLUMNS, serialize_author, AUTHOR_JOIN),
+    'tags': None,
+}
+POST_LIST_FIELDS = ('id', 'title', 'excerpt', 'image_url', 'created_at', 'comment_count', 'url', 'author', 'tags')
+POST_DETAIL_FIELDS = POST_LIST_FIELDS + ('content', 'word_count', 'updated_at')
+
+COMMENT_FIELDS = {
+    'id': column_field(Comment.id, 'id'),
+    'content': column_field(Comment.content, 'content'),
+    'created_at': column_field(Comment.created_at, 'created_at'),
+    'sentiment': column_field(Comment.sentiment, 'sentiment'),
+    'sentiment_polarity': column_field(Comment.sentiment_polarity, 'sentiment_polarity'),
+    'author': Field(AUTHOR_COLUMNS, serialize_author, COMMENT_AUTHOR_JOIN),
+}
+COMMENT_LIST_FIELDS = ('id', 'content', 'created_at', 'sentiment', 'author')
+
+TAG_FIELDS = {
+    'name': column_field(Tag.name, 'name'),
+    'post_count': column_field(TagCount.post_count, 'post_count'),
+    'url': Field([Tag.name.label('name')], lambda row: url_for('api.list_posts', tag=row['name'])),
+}
+
+# Sort keys of the keyset pagination, selected whatever the requested fields
+POST_SORT_KEY = (Post.created_at.label('_created_at'), Post.id.label('_id'))
+COMMENT_SORT_KEY = (Comment.created_at.label('_created_at'), Comment.id.label('_id'))
+
+
+# The codes with application wide HTML handlers need their own entries to take precedence
+@api_bp.errorhandler(HTTPException)
+@api_bp.errorhandler(403)
+@api_bp.errorhandler(404)
+@api_bp.errorhandler(500)
+def handle_http_error(error):
+    """Answer API errors with JSON instead of the HTML error pages"""
+    return json_response({'error': {'status': error.code, 'message': error.description}}, error.code)
+
+
+def attach_tags(fieldset, posts):
+    """Add the tag names of serialized posts with one query, if the request wants them"""
+    if 'tags' not in fieldset or not posts:
+        return posts
+    by_id = {post['_id']: post for post in posts}
+    for post in posts:
+        post['tags'] = []
+    rows = db.session.query(post_tags.c.post_id, Tag.name).join(
+        Tag, Tag.id == post_tags.c.tag_id
+    ).filter(post_tags.c.post_id.in_(by_id)).order_by(Tag.name)
+    for post_id, name in rows:
+        by_id[post_id]['tags'].append(name)
+    return posts
+
+
+def serialize_posts(fieldset, rows):
+    posts = []
+    for row in rows:
+        post = fieldset.serialize(row)
+        post['_id'] = row._mapping['_id']
+        posts.append(post)
+    attach_tags(fieldset, posts)
+    for post in posts:
+        del post['_id']
+    return posts
+
+
+def keyset_page(fieldset, query, created_at, item_id, serialize):
+    """
+    Get one page of a query ordered newest first, after the request's cursor.
+
+    Uses keyset pagination on (created_at, id) so deep pages cost the same as
+    the first one.
+
+    Returns:
+        dict: The serialized items and the cursor of the next page or None
+    """
+    limit = page_size()
+    position = decode_cursor(request.args.get('cursor'), datetime.fromisoformat, int)
+    if position:
+        after_created_at, after_id = position
+        query = query.filter(
+            (created_at < after_created_at) | ((created_at == after_created_at) & (item_id < after_id))
+        )
+
+    # Fetch one extra row to know whether there is a next page
+    rows = query.order_by(created_at.desc(), item_id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]._mapping['_created_at'], rows[-1]._mapping['_id'])
+    return {'data': serialize(fieldset, rows), 'next_cursor': next_cursor}
+
+
+def posts_validators():
+    """Values every published post listing depends on, for conditional requests"""
+    # Listed posts show their authors' names and pictures, and placeholders until their images are processed
+    latest, total, comments, author_profiles, images = db.session.query(
+        db.func.max(Post.updated_at), db.func.count(Post.id), db.func.sum(Post.comment_count),
+        db.func.max(User.profile_updated_at), db.func.max(Post.image_updated_at)
+    ).join(User, User.id == Post.user_id).filter(Post.published == True).one()
+    last_modified = max(filter(None, [latest, author_profiles, images]), default=None)
+    parts = [latest, total, comments, author_profiles, images, request.query_string]
+    return with_view_counts(parts, last_modified, Post.published == True)
+
+
+def with_view_counts(parts, last_modified, *criteria):
+    """
+    Add the views of the posts matching criteria to validators, if the request asked for view_count.
+
+    Views have no modification time, so those responses are only revalidated by their ETag.
+    """
+    if 'view_count' not in Fieldset(POST_FIELDS, ()):
+        return parts, last_modified
+    views = db.session.query(db.func.sum(PostViewCount.views)).join(
+        Post, Post.id == PostViewCount.post_id
+    ).filter(*criteria).scalar()
+    return [*parts, views], None
+
+
+def can_see(published, user_id):
+    """Check whether the current user may see a post, unpublished posts are only shown to their author"""
+    return published or (current_user.is_authenticated and current_user.id == user_id)
+
+
+def visible_post(post_id):
+    """Get (published, user_id) of a post the current user may see, aborting with 404 otherwise"""
+    row = db.session.query(Post.published, Post.user_id).filter_by(id=post_id).first()
+    if row is None or not can_see(row.published, row.user_id):
+        abort(404, description='Post not found.')
+    return row
+
+
+def post_validators(post_id):
+    """Values a post depends on, for conditional requests"""
+    row = db.session.query(
+        Post.updated_at, Post.comment_count, Post.published, Post.user_id, Post.image_file,
+        User.profile_updated_at
+    ).join(User, User.id == Post.user_id).filter(Post.id == post_id).first()
+    # Missing and hidden posts are left to the view
+    if row is None or not can_see(row.published, row.user_id):
+        return None
+    # image_url points at a placeholder until the image has been processed
+    image_ready = upload_ready('post_images', row.image_file) if row.image_file else None
+    parts = [post_id, row.updated_at, row.comment_count, row.published, row.profile_updated_at, image_ready,
+             request.query_string]
+    return with_view_counts(parts, max(filter(None, [row.updated_at, row.profile_updated_at]), default=None),
+                            Post.id == post_id)
+
+
+def comments_validators(post_id):
+    """Values a post's comments depend on, for conditional requests"""
+    post = db.session.query(Post.published, Post.user_id).filter_by(id=post_id).first()
+    if post is None or not can_see(post.published, post.user_id):
+        return None
+    # Comments show their authors' names and pictures
+    count, latest, commenter_profiles = db.session.query(
+        db.func.count(Comment.id), db.func.max(Comment.created_at), db.func.max(User.profile_updated_at)
+    ).join(User, User.id == Comment.user_id).filter(Comment.post_id == post_id).one()
+    last_modified = max(filter(None, [latest, commenter_profiles]), default=None)
+    return [post_id, count, latest, commenter_profiles, request.query_string], last_modified
+
+
+def post_rows_by_id(fieldset, post_ids, limit):
+    """Get the requested fields of published posts, newest first"""
+    return fieldset.query(Post, *POST_SORT_KEY).filter(
+        Post.id.in_(post_ids), Post.published == True
+    ).order_by(Post.created_at.desc()).limit(limit).all()
+
+
+@api_bp.route('/posts')
+@conditional(posts_validators)
+def list_posts():
+    """Published posts, newest first, optionally of one ?tag= or ?author="""
+    fieldset = Fieldset(POST_FIELDS, POST_LIST_FIELDS)
+    query = fieldset.query(Post, *POST_SORT_KEY).filter(Post.published == True)
+
+    tag_name = request.args.get('tag')
+    if tag_name:
+        tag_id = db.session.query(Tag.id).filter_by(name=Tag.normalize(tag_name)).scalar()
+        if tag_id is None:
+            abort(404, description='Tag not found.')
+        query = query.join(post_tags, post_tags.c.post_id == Post.id).filter(post_tags.c.tag_id == tag_id)
+
+    username = request.args.get('author')
+    if username:
+        user_id = db.session.query(User.id).filter_by(username=username).scalar()
+        if user_id is None:
+            abort(404, description='Author not found.')
+        query = query.filter(Post.user_id == user_id)
+
+    return json_response(keyset_page(fieldset, query, Post.created_at, Post.id, serialize_posts))
+
+
+@api_bp.route('/posts/<int:post_id>')
+@view_recorder.counted
+@conditional(post_validators)
+def get_post(post_id):
+    """One post, with its content by default"""
+    visible_post(post_id)
+    fieldset = Fieldset(POST_FIELDS, POST_DETAIL_FIELDS)
+    row = fieldset.query(Post, *POST_SORT_KEY).filter(Post.id == post_id).one()
+    return json_response({'data': serialize_posts(fieldset, [row])[0]})
+
+
+@api_bp.route('/posts/<int:post_id>/comments')
+@conditional(comments_validators)
+def list_comments(post_id):
+    """A post's comments, newest first"""
+    visible_post(post_id)
+    fieldset = Fieldset(COMMENT_FIELDS, COMMENT_LIST_FIELDS)
+    query = fieldset.query(Comment, *COMMENT_SORT_KEY).filter(Comment.post_id == post_id)
+
+    def serialize(fieldset, rows):
+        return [fieldset.serialize(row) for row in rows]
+    return json_response(keyset_page(fieldset, query, Comment.created_at, Comment.id, serialize))
+
+
+@api_bp.route('/posts/<int:post_id>/similar')
+@body_etag
+def similar_posts(post_id):
+    """Posts similar in content to a post, recent posts while there is no model"""
+    from app.utils.ai.recommendation import get_similar_posts
+
+    visible_post(post_id)
+    fieldset = Fieldset(POST_FIELDS, POST_LIST_FIELDS)
+    limit = limit_arg(3, 20)
+
+    similar_post_ids = get_similar_posts(post_id, num_recommendations=limit)
+    if similar_post_ids:
+        # Most similar first
+        rank = {similar_post_id: index for index, similar_post_id in enumerate(similar_post_ids)}
+        rows = sorted(post_rows_by_id(fieldset, similar_post_ids, limit), key=lambda row: rank[row._mapping['_id']])
+    else:
+        rows = fieldset.query(Post, *POST_SORT_KEY).filter(
+            Post.published == True, Post.id != post_id
+        ).order_by(Post.created_at.desc()).limit(limit).all()
+    return json_response({'data': serialize_posts(fieldset, rows)})
+
+
+@api_bp.route('/trending')
+@body_etag
+def trending():
+    """Posts ranked by their time-decayed comment activity, with their current score"""
+    fieldset = Fieldset(POST_FIELDS, POST_LIST_FIELDS)
+    limit = limit_arg(10, 50)
+
+    ranked = TrendingScore.top(limit=limit)
+    scores = dict(ranked)
+    rank = {post_id: index for index, (post_id, _) in enumerate(ranked)}
+    rows = sorted(post_rows_by_id(fieldset, list(scores), limit), key=lambda row: rank[row._mapping['_id']])
+    posts = serialize_posts(fieldset, rows)
+    for row, post in zip(rows, posts):
+        post['trending_score'] = round(scores[row._mapping['_id']], 4)
+    return json_response({'data': posts})
+
+
+@api_bp.route('/recommendations')
+@body_etag
+def recommendations():
+    """Posts recommended to the signed-in user"""
+    from app.utils.ai.recommendation import get_user_recommendation_ids
+
+    if not current_user.is_authenticated:
+        abort(401, description='Sign in to get recommendations.')
+    fieldset = Fieldset(POST_FIELDS, POST_LIST_FIELDS)
+    limit = limit_arg(5, 20)
+
+    recommended_post_ids = get_user_recommendation_ids(current_user.id, limit)
+    return json_response({'data': serialize_posts(fieldset, post_rows_by_id(fieldset, recommended_post_ids, limit))})
+
+
+@api_bp.route('/search')
+@body_etag
+def search():
+    """Published posts matching ?q= in their title, content or tags, newest first"""
+    query_text = request.args.get('q', '').strip()
+    if not query_text:
+        abort(400, description='The q argument is required.')
+    fieldset = Fieldset(POST_FIELDS, POST_LIST_FIELDS)
+
+    tagged_post_ids = db.select(post_tags.c.post_id).join(
+        Tag, Tag.id == post_tags.c.tag_id
+    ).where(Tag.name.contains(query_text))
+    query = fieldset.query(Post, *POST_SORT_KEY).filter(
+        Post.published == True,
+        Post.title.contains(query_text) |
+        Post.content.contains(query_text) |
+        Post.id.in_(tagged_post_ids)
+    )
+    return json_response(keyset_page(fieldset, query, Post.created_at, Post.id, serialize_posts))
+
+
+@api_bp.route('/tags')
+@body_etag
+def list_tags():
+    """Tags in use, most used first"""
+    fieldset = Fieldset(TAG_FIELDS, TAG_FIELDS)
+    limit = page_size()
+    query = fieldset.query(
+        Tag, TagCount.post_count.label('_post_count'), Tag.name.label('_name')
+    ).join(TagCount, TagCount.tag_id == Tag.id).filter(TagCount.post_count > 0)
+
+    # Keyset pagination on (post_count descending, name)
+    position = decode_cursor(request.args.get('cursor'), int, str)
+    if position:
+        after_count, after_name = position
+        query = query.filter(
+            (TagCount.post_count < after_count) | ((TagCount.post_count == after_count) & (Tag.name > after_name))
+        )
+
+    rows = query.order_by(TagCount.post_count.desc(), Tag.name).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]._mapping['_post_count'], rows[-1]._mapping['_name'])
+    return json_response({'data': [fieldset.serialize(row) for row in rows], 'next_cursor': next_cursor})
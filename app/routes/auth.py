@@ -1,17 +1,23 @@
 from datetime import datetime, timedelta
 import secrets
-from flask import Blueprint, render_template, redirect, url_for, flash, request, session, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session, current_app, jsonify
 from flask_login import login_user, logout_user, current_user, login_required
 from urllib.parse import urlparse
 
-from app import db
+from app import db, login_guard, mail_sender
 from app.models.user import User
 from app.forms.auth import (
     RegistrationForm, LoginForm, UpdateProfileForm,
     PasswordResetRequestForm, PasswordResetForm
 )
-from app.utils.file_utils import save_picture
+from app.models.upload import UploadRef
+from app.utils.file_utils import save_picture, delete_files
+from app.utils.image_utils import DEFAULT_PROFILE_IMAGE, InvalidImage
+from app.utils.image_tasks import ImageQueueFull
 from app.utils.email_utils import send_reset_email
+from app.utils.login_guard import PasswordHashBusy
+from app.utils.metrics import stats_token_required
+from app.utils.cache import clear_fragments
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -42,13 +48,17 @@ def register():
     
     form = RegistrationForm()
     if form.validate_on_submit():
-        user = User(
-            username=form.username.data,
-            email=form.email.data,
-            password=form.password.data,
-            first_name=form.first_name.data,
-            last_name=form.last_name.data
-        )
+        try:
+            user = User(
+                username=form.username.data,
+                email=form.email.data,
+                password=form.password.data,
+                first_name=form.first_name.data,
+                last_name=form.last_name.data
+            )
+        except PasswordHashBusy as e:
+            flash(str(e), 'warning')
+            return render_template('auth/register.html', title='Register', form=form), 503
         db.session.add(user)
         db.session.commit()
         
@@ -66,9 +76,25 @@ def login():
     
     form = LoginForm()
     if form.validate_on_submit():
+        # Limits are checked before any password hashing is done
+        retry_after = login_guard.check_attempt(request.remote_addr or '', form.username.data)
+        if retry_after:
+            flash('Too many login attempts. Please wait a few minutes and try again.', 'danger')
+            response = current_app.make_response(
+                (render_template('auth/login.html', title='Login', form=form), 429)
+            )
+            response.headers['Retry-After'] = str(int(retry_after) + 1)
+            return response
+
         user = User.query.filter_by(username=form.username.data).first()
-        
-        if user and user.check_password(form.password.data):
+        try:
+            authenticated = user is not None and user.check_password(form.password.data)
+        except PasswordHashBusy as e:
+            flash(str(e), 'warning')
+            return render_template('auth/login.html', title='Login', form=form), 503
+
+        if authenticated:
+            login_guard.record_success(form.username.data)
             login_user(user, remember=form.remember_me.data)
             session['last_active'] = datetime.utcnow().timestamp()
             
@@ -79,11 +105,19 @@ def login():
             flash('Login successful!', 'success')
             return redirect(next_page)
         else:
+            login_guard.record_failure(form.username.data)
             flash('Login failed. Please check your username and password.', 'danger')
     
     return render_template('auth/login.html', title='Login', form=form)
 
 
+@auth_bp.route('/login/stats')
+@stats_token_required
+def login_stats():
+    """Login rate limiting and password hashing queue counters"""
+    return jsonify(login_guard.stats())
+
+
 @auth_bp.route('/logout')
 def logout():
     """User logout route"""
@@ -99,13 +133,21 @@ def profile():
     form = UpdateProfileForm(current_user.username, current_user.email)
     
     if form.validate_on_submit():
+        # Post listings and comments show the author's username and name
+        profile_changed = (form.username.data, form.first_name.data, form.last_name.data) != (
+            current_user.username, current_user.first_name, current_user.last_name
+        )
         current_user.username = form.username.data
         current_user.email = form.email.data
         current_user.first_name = form.first_name.data
         current_user.last_name = form.last_name.data
         current_user.about_me = form.about_me.data
+        if profile_changed:
+            current_user.profile_updated_at = datetime.utcnow()
         
         db.session.commit()
+        if profile_changed:
+            clear_fragments()
         flash('Your profile has been updated!', 'success')
         return redirect(url_for('auth.profile'))
     
@@ -136,15 +178,45 @@ def update_profile_picture():
     if file:
         try:
             picture_file = save_picture(file, folder='profile_pics', size=(150, 150))
+            old_picture = current_user.profile_image
             current_user.profile_image = picture_file
+            current_user.profile_updated_at = datetime.utcnow()
+            
+            # The replaced picture is deleted unless another account uses the same file
+            UploadRef.acquire(f'profile_pics/{picture_file}')
+            unused_files = []
+            if old_picture and old_picture != DEFAULT_PROFILE_IMAGE:
+                unused_files = UploadRef.release(f'profile_pics/{old_picture}')
             db.session.commit()
+            # Cached post listings show the author's picture
+            clear_fragments()
+            delete_files(unused_files)
             flash('Your profile picture has been updated!', 'success')
+        except InvalidImage as e:
+            flash(str(e), 'danger')
+        except ImageQueueFull as e:
+            flash(str(e), 'warning')
         except Exception as e:
             flash(f'Error updating profile picture: {str(e)}', 'danger')
     
     return redirect(url_for('auth.profile'))
 
 
+@auth_bp.route('/profile/delete', methods=['POST'])
+@login_required
+def delete_account():
+    """Delete the current user's account with their posts and comments"""
+    unused_files = current_user.delete_account()
+    db.session.commit()
+    logout_user()
+    # Cached listings show the deleted posts and comment counts
+    clear_fragments()
+    delete_files(unused_files)
+    
+    flash('Your account has been deleted.', 'info')
+    return redirect(url_for('main.home'))
+
+
 @auth_bp.route('/reset_password', methods=['GET', 'POST'])
 def reset_password_request():
     """Request password reset route"""
@@ -159,10 +231,11 @@ def reset_password_request():
             token = secrets.token_urlsafe(32)
             user.reset_token = token
             user.reset_token_expiration = datetime.utcnow() + timedelta(hours=1)
-            db.session.commit()
             
-            # Send email
+            # The email is queued with the token and sent in the background
             send_reset_email(user)
+            db.session.commit()
+            mail_sender.notify()
         
         # Always show this message even if email not found (security)
         flash('If your email exists in our database, you will receive a password reset link.', 'info')
@@ -187,7 +260,11 @@ def reset_password(token):
     
     form = PasswordResetForm()
     if form.validate_on_submit():
-        user.set_password(form.password.data)
+        try:
+            user.set_password(form.password.data)
+        except PasswordHashBusy as e:
+            flash(str(e), 'warning')
+            return render_template('auth/reset_password.html', title='Reset Password', form=form), 503
         user.reset_token = None
         user.reset_token_expiration = None
         db.session.commit()
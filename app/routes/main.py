@@ -1,25 +1,77 @@
-from flask import Blueprint, render_template, request, current_app
-from app.models.post import Post, Tag
+from flask import Blueprint, render_template, request, current_app, jsonify
+from app import db, fragment_cache
+from app.models.post import Post, Tag, TagCount, post_tags
+from app.models.read_models import card_query, load_cards, paginate_cards, stream_cards
+from app.models.trending import TrendingScore
+from app.models.user import User
+from app.utils.api import limit_arg
+from app.utils.http_cache import conditional
+from app.utils.metrics import stats_token_required
+from app.utils.streaming import stream_page
 from app.forms.post import SearchForm
 
 main_bp = Blueprint('main', __name__)
 
+def home_validators():
+    """Values the home page depends on, for conditional requests"""
+    latest, total, profiles, images = db.session.query(
+        db.func.max(Post.updated_at), db.func.count(Post.id), db.func.max(User.profile_updated_at),
+        db.func.max(Post.image_updated_at)
+    ).join(User, User.id == Post.user_id).filter(Post.published == True).one()
+    return [latest, total, profiles, images], max(filter(None, [latest, profiles, images]), default=None)
+
+def tag_validators(tag_name):
+    """Values a tag page depends on, for conditional requests"""
+    tag_id = db.session.query(Tag.id).filter_by(name=Tag.normalize(tag_name)).scalar()
+    if tag_id is None:
+        return None
+    
+    latest, profiles, images = db.session.query(
+        db.func.max(Post.updated_at), db.func.max(User.profile_updated_at), db.func.max(Post.image_updated_at)
+    ).join(post_tags, post_tags.c.post_id == Post.id).join(User, User.id == Post.user_id).filter(
+        post_tags.c.tag_id == tag_id, Post.published == True
+    ).one()
+    return [tag_id, TagCount.get_count(tag_id), latest, profiles, images], \
+        max(filter(None, [latest, profiles, images]), default=None)
+
 @main_bp.route('/')
 @main_bp.route('/home')
+@conditional(home_validators)
+@fragment_cache.cached_page('home')
 def home():
     """Home page route"""
     page = request.args.get('page', 1, type=int)
-    posts = Post.query.filter_by(published=True).order_by(
-        Post.created_at.desc()
-    ).paginate(page=page, per_page=5)
+    posts = paginate_cards(
+        card_query().filter(Post.published == True).order_by(Post.created_at.desc()),
+        page=page, per_page=5
+    )
+    popular_tags = TagCount.popular(limit=10)
+    
+    return render_template('main/home.html', posts=posts, popular_tags=popular_tags, title='Home')
+
+@main_bp.route('/trending')
+def trending():
+    """Posts ranked by their time-decayed comment activity"""
+    limit = limit_arg(10, 50)
+    ranked = TrendingScore.top(limit=limit)
     
-    return render_template('main/home.html', posts=posts, title='Home')
+    # One card query for the ranked posts, then back into ranking order
+    cards = {card.id: card for card in load_cards(card_query().filter(Post.id.in_([post_id for post_id, _ in ranked])))}
+    posts = [cards[post_id] for post_id, _ in ranked if post_id in cards]
+    
+    return render_template('main/trending.html', posts=posts, title='Trending')
 
 @main_bp.route('/about')
 def about():
     """About page route"""
     return render_template('main/about.html', title='About')
 
+@main_bp.route('/cache/stats')
+@stats_token_required
+def cache_stats():
+    """Fragment cache hit ratio and size"""
+    return jsonify(fragment_cache.stats())
+
 @main_bp.route('/search')
 def search():
     """Search for posts"""
@@ -31,26 +83,21 @@ def search():
         return render_template('main/search.html', title='Search', form=SearchForm())
     
     # Search in title, content, and tags
-    # First get posts that match title or content
-    base_query = Post.query.filter(
-        (Post.title.contains(query) | 
-         Post.content.contains(query)) &
-        Post.published == True
-    )
+    tagged_post_ids = db.select(post_tags.c.post_id).join(
+        Tag, Tag.id == post_tags.c.tag_id
+    ).where(Tag.name.contains(query))
     
-    # Also search for posts with matching tags
-    tag_query = Post.query.join(Post.tags).filter(
+    matches = card_query().filter(
         Post.published == True,
-        Tag.name.contains(query)
+        Post.title.contains(query) |
+        Post.content.contains(query) |
+        Post.id.in_(tagged_post_ids)
     )
     
-    # Combine the results and remove duplicates
-    combined_query = base_query.union(tag_query)
+    # Result rows are fetched while the page streams, per_page is up to the client
+    posts = stream_cards(matches.order_by(Post.created_at.desc()), page=page, per_page=per_page)
     
-    # Apply pagination
-    posts = combined_query.order_by(Post.created_at.desc()).paginate(page=page, per_page=per_page)
-    
-    return render_template(
+    return stream_page(
         'main/search_results.html',
         title=f'Search Results for "{query}"',
         posts=posts,
@@ -59,15 +106,22 @@ def search():
     )
 
 @main_bp.route('/tag/<string:tag_name>')
+@conditional(tag_validators)
+@fragment_cache.cached_page(lambda tag_name: f'tag:{Tag.normalize(tag_name)}')
 def tag_posts(tag_name):
     """Show posts with specific tag"""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 5, type=int)
-    tag = Tag.query.filter_by(name=tag_name).first_or_404()
+    tag = Tag.query.filter_by(name=Tag.normalize(tag_name)).first_or_404()
     
-    posts = tag.posts.filter_by(published=True).order_by(
-        Post.created_at.desc()
-    ).paginate(page=page, per_page=per_page)
+    # The total comes from the materialized tag count instead of a COUNT query
+    posts = paginate_cards(
+        card_query().join(post_tags, post_tags.c.post_id == Post.id).filter(
+            post_tags.c.tag_id == tag.id, Post.published == True
+        ).order_by(Post.created_at.desc()),
+        page=page, per_page=per_page, count=False
+    )
+    posts.total = TagCount.get_count(tag.id)
     
     return render_template(
         'main/tag_posts.html',
@@ -1,12 +1,48 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, abort
+from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, jsonify
 from flask_login import current_user, login_required
-from app import db
+from app import db, fragment_cache, view_recorder
 from app.models.post import Post, Comment, Tag
+from app.models.upload import UploadRef
+from app.models.trending import TrendingScore
+from app.models.user import User
+from app.models.read_models import card_query, paginate_cards
 from app.forms.post import PostForm, CommentForm
-from app.utils.file_utils import save_picture, delete_file
+from app.utils.file_utils import save_picture, delete_files
+from app.utils.image_tasks import ImageQueueFull
+from app.utils.image_utils import InvalidImage, upload_ready
+from app.utils.cache import invalidate_post_pages, invalidate_fragments
+from app.utils.http_cache import conditional
+from app.utils.streaming import stream_page
 
 posts_bp = Blueprint('posts', __name__)
 
+COMMENTS_PER_PAGE = 20
+
+def post_validators(post_id):
+    """Values a post page depends on, for conditional requests"""
+    from app.utils.ai.recommendation import get_model_version
+    
+    row = db.session.query(
+        Post.updated_at, Post.comment_count, Post.published, Post.user_id, Post.image_file,
+        User.profile_updated_at
+    ).join(User, User.id == Post.user_id).filter(Post.id == post_id).first()
+    
+    # Missing and hidden posts are left to the view
+    if row is None or (not row.published and (not current_user.is_authenticated or current_user.id != row.user_id)):
+        return None
+    
+    # Comments show their authors' names and pictures
+    latest_comment, commenter_profiles = db.session.query(
+        db.func.max(Comment.created_at), db.func.max(User.profile_updated_at)
+    ).join(User, User.id == Comment.user_id).filter(Comment.post_id == post_id).one()
+    last_modified = max(
+        filter(None, [row.updated_at, latest_comment, row.profile_updated_at, commenter_profiles]), default=None
+    )
+    # The page shows a placeholder until its image has been processed
+    image_ready = upload_ready('post_images', row.image_file) if row.image_file else None
+    return [row.updated_at, row.comment_count, latest_comment, row.profile_updated_at, commenter_profiles,
+            get_model_version(), image_ready], last_modified
+
 @posts_bp.route('/post/new', methods=['GET', 'POST'])
 @login_required
 def new_post():
@@ -23,22 +59,27 @@ def new_post():
         
         # Handle image upload
         if form.image.data:
-            image_file = save_picture(form.image.data, folder='post_images')
+            try:
+                image_file = save_picture(form.image.data, folder='post_images')
+            except InvalidImage as e:
+                form.image.errors.append(str(e))
+                return render_template('posts/create_post.html', title='New Post',
+                                      form=form, legend='New Post'), 400
+            except ImageQueueFull as e:
+                flash(str(e), 'warning')
+                return render_template('posts/create_post.html', title='New Post',
+                                      form=form, legend='New Post'), 503
             post.image_file = image_file
+            UploadRef.acquire(f'post_images/{image_file}')
+        
+        db.session.add(post)
         
         # Handle tags
-        if form.tags.data:
-            tag_names = [tag.strip() for tag in form.tags.data.split(',')]
-            for tag_name in tag_names:
-                if tag_name:
-                    tag = Tag.query.filter_by(name=tag_name).first()
-                    if not tag:
-                        tag = Tag(name=tag_name)
-                        db.session.add(tag)
-                    post.tags.append(tag)
+        post.set_tags(Tag.normalize_names(form.tags.data))
         
-        db.session.add(post)
         db.session.commit()
+        if post.published:
+            invalidate_post_pages(*[tag.name for tag in post.tags])
         
         flash('Your post has been created!', 'success')
         return redirect(url_for('posts.post', post_id=post.id))
@@ -48,6 +89,8 @@ def new_post():
 
 
 @posts_bp.route('/post/<int:post_id>')
+@view_recorder.counted
+@conditional(post_validators)
 def post(post_id):
     """View a specific post"""
     post = Post.query.get_or_404(post_id)
@@ -57,14 +100,37 @@ def post(post_id):
         abort(404)
     
     form = CommentForm()
-    comments = Comment.query.filter_by(post_id=post.id).order_by(Comment.created_at.desc()).all()
+    comments, next_cursor = Comment.get_page(post.id, per_page=COMMENTS_PER_PAGE)
     
-    # Get similar posts based on content similarity
-    similar_posts = Post.get_similar_posts(post_id, limit=3)
+    # Get similar posts based on content similarity, the block is the same for every viewer.
+    # It is rendered when the streamed page reaches it, after the post and comments went out
+    def similar_html():
+        return fragment_cache.get_or_render('similar', (post_id,), lambda: render_template(
+            'posts/_similar_posts.html', similar_posts=Post.get_similar_posts(post_id, limit=3)
+        ))
     
-    return render_template('posts/post.html', title=post.title, 
-                          post=post, form=form, comments=comments,
-                          similar_posts=similar_posts)
+    return stream_page('posts/post.html', title=post.title, 
+                       post=post, form=form, comments=comments,
+                       next_cursor=next_cursor, similar_html=similar_html)
+
+
+@posts_bp.route('/post/<int:post_id>/comments')
+def post_comments(post_id):
+    """Get the next page of a post's comments as JSON"""
+    post = Post.query.get_or_404(post_id)
+    
+    if not post.published and (not current_user.is_authenticated or current_user.id != post.user_id):
+        abort(404)
+    
+    comments, next_cursor = Comment.get_page(
+        post.id, cursor=request.args.get('cursor'), per_page=COMMENTS_PER_PAGE
+    )
+    
+    return jsonify({
+        'html': render_template('posts/_comments.html', post=post, comments=comments),
+        'next_cursor': next_cursor,
+        'comment_count': post.comment_count
+    })
 
 
 @posts_bp.route('/post/<int:post_id>/update', methods=['GET', 'POST'])
@@ -80,35 +146,39 @@ def update_post(post_id):
     form = PostForm()
     
     if form.validate_on_submit():
+        old_tag_names = [tag.name for tag in post.tags]
+        was_published = post.published
         post.title = form.title.data
         post.content = form.content.data
         post.published = form.published.data
         
-        # Handle image upload
+        # Handle tags, only the added and removed ones are written
+        post.set_tags(Tag.normalize_names(form.tags.data), was_published=was_published)
+        
+        # Handle image upload, the old image is deleted once the new one is committed
+        unused_files = []
         if form.image.data:
-            # Delete old image if exists
-            if post.image_file:
-                delete_file(post.image_file)
-            
-            image_file = save_picture(form.image.data, folder='post_images')
+            old_image_file = post.image_file
+            try:
+                image_file = save_picture(form.image.data, folder='post_images')
+            except InvalidImage as e:
+                db.session.rollback()
+                form.image.errors.append(str(e))
+                return render_template('posts/create_post.html', title='Update Post',
+                                      form=form, legend='Update Post', post=post), 400
+            except ImageQueueFull as e:
+                db.session.rollback()
+                flash(str(e), 'warning')
+                return render_template('posts/create_post.html', title='Update Post',
+                                      form=form, legend='Update Post', post=post), 503
             post.image_file = image_file
-        
-        # Handle tags
-        # Remove all existing tags
-        post.tags = []
-        
-        # Add new tags
-        if form.tags.data:
-            tag_names = [tag.strip() for tag in form.tags.data.split(',')]
-            for tag_name in tag_names:
-                if tag_name:
-                    tag = Tag.query.filter_by(name=tag_name).first()
-                    if not tag:
-                        tag = Tag(name=tag_name)
-                        db.session.add(tag)
-                    post.tags.append(tag)
+            UploadRef.acquire(f'post_images/{image_file}')
+            if old_image_file:
+                unused_files = UploadRef.release(f'post_images/{old_image_file}')
         
         db.session.commit()
+        invalidate_post_pages(*old_tag_names, *[tag.name for tag in post.tags])
+        delete_files(unused_files)
         flash('Your post has been updated!', 'success')
         return redirect(url_for('posts.post', post_id=post.id))
     
@@ -132,12 +202,18 @@ def delete_post(post_id):
     if post.user_id != current_user.id:
         abort(403)
     
-    # Delete post image if exists
-    if post.image_file:
-        delete_file(post.image_file)
+    image_file = post.image_file
+    tag_names = [tag.name for tag in post.tags]
     
+    # Comments and tag links are removed by ON DELETE CASCADE
+    post.release_tags()
+    unused_files = UploadRef.release(f'post_images/{image_file}') if image_file else []
     db.session.delete(post)
     db.session.commit()
+    invalidate_post_pages(*tag_names)
+    
+    # Delete post image if no other record shares it
+    delete_files(unused_files)
     
     flash('Your post has been deleted!', 'success')
     return redirect(url_for('main.home'))
@@ -161,6 +237,8 @@ def add_comment(post_id):
         comment.analyze_sentiment()
         
         db.session.add(comment)
+        Post.adjust_comment_count(post.id, 1)
+        TrendingScore.record_comment(comment)
         db.session.commit()
         
         # Flash different messages based on sentiment
@@ -187,6 +265,8 @@ def delete_comment(comment_id):
     post_id = comment.post_id
     
     db.session.delete(comment)
+    Post.adjust_comment_count(post_id, -1)
+    TrendingScore.remove_comment(comment)
     db.session.commit()
     
     flash('Comment has been deleted!', 'success')
@@ -196,21 +276,17 @@ def delete_comment(comment_id):
 @posts_bp.route('/user/<string:username>/posts')
 def user_posts(username):
     """View all posts by a specific user"""
-    from app.models.user import User
-    
     page = request.args.get('page', 1, type=int)
     user = User.query.filter_by(username=username).first_or_404()
     
+    query = card_query().filter(Post.user_id == user.id)
+    
     # If current user is the author, show all posts including unpublished
-    if current_user.is_authenticated and current_user.id == user.id:
-        posts = Post.query.filter_by(user_id=user.id).order_by(
-            Post.created_at.desc()
-        ).paginate(page=page, per_page=5)
-    else:
-        # Otherwise show only published posts
-        posts = Post.query.filter_by(
-            user_id=user.id, published=True
-        ).order_by(Post.created_at.desc()).paginate(page=page, per_page=5)
+    # Otherwise show only published posts
+    if not (current_user.is_authenticated and current_user.id == user.id):
+        query = query.filter(Post.published == True)
+    
+    posts = paginate_cards(query.order_by(Post.created_at.desc()), page=page, per_page=5)
     
     return render_template('posts/user_posts.html', posts=posts, 
                           user=user, title=f'Posts by {username}')
@@ -228,6 +304,7 @@ def recommendations():
     if should_rebuild_model():
         all_posts = Post.query.filter_by(published=True).all()
         build_recommendation_model(all_posts)
+        invalidate_fragments('similar')
     
     return render_template('posts/recommendations.html', 
                           title='Recommended Posts',
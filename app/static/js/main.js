@@ -60,4 +60,28 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         });
     });
+
+    // Load more comments
+    const loadMoreButton = document.getElementById('load-more-comments');
+    if (loadMoreButton) {
+        loadMoreButton.addEventListener('click', function() {
+            const url = `${this.dataset.url}?cursor=${encodeURIComponent(this.dataset.cursor)}`;
+            loadMoreButton.disabled = true;
+
+            fetch(url)
+                .then(response => response.json())
+                .then(data => {
+                    document.getElementById('comments-list').insertAdjacentHTML('beforeend', data.html);
+                    if (data.next_cursor) {
+                        loadMoreButton.dataset.cursor = data.next_cursor;
+                        loadMoreButton.disabled = false;
+                    } else {
+                        loadMoreButton.remove();
+                    }
+                })
+                .catch(() => {
+                    loadMoreButton.disabled = false;
+                });
+        });
+    }
 });
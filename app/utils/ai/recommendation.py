@@ -1,20 +1,24 @@
 """
 Content recommendation module for recommending posts to users.
 Uses a TF-IDF vectorizer and cosine similarity to find similar posts.
+numpy, scikit-learn and joblib take about a second to import, they are
+imported on first use or by the warm-up.
 """
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import joblib
 import os
 from datetime import datetime, timedelta
 
+from app.utils.metrics import timed
+
 # Constants
 MODEL_PATH = 'app/utils/ai/models'
 VECTORIZER_FILE = 'tfidf_vectorizer.joblib'
 FEATURES_FILE = 'tfidf_features.joblib'
 POST_IDS_FILE = 'post_ids.joblib'
 MODEL_EXPIRY_DAYS = 1  # Rebuild model if older than this many days
+VIEWED_POSTS_CONSIDERED = 20  # Most recently viewed posts used as reading history
+
+# (model version, (vectorizer, features, post_ids)) of the last model loaded in this process
+_loaded_model = (None, None)
 
 def ensure_model_directory():
     """Ensure the model directory exists"""
@@ -36,6 +40,19 @@ def should_rebuild_model():
     model_time = datetime.fromtimestamp(os.path.getmtime(vectorizer_path))
     return datetime.now() - model_time > timedelta(days=MODEL_EXPIRY_DAYS)
 
+def get_model_version():
+    """
+    Get a value that changes whenever the model is rebuilt.
+    
+    Returns:
+        float: Modification time of the stored model, 0 if there is none
+    """
+    try:
+        return os.path.getmtime(get_model_path(VECTORIZER_FILE))
+    except OSError:
+        return 0
+
+@timed('ai.build_model')
 def build_recommendation_model(posts):
     """
     Build the recommendation model using TF-IDF vectorization.
@@ -46,6 +63,10 @@ def build_recommendation_model(posts):
     Returns:
         tuple: (vectorizer, features, post_ids)
     """
+    import joblib
+    import numpy as np
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    
     ensure_model_directory()
     
     # Extract text and IDs
@@ -73,28 +94,44 @@ def build_recommendation_model(posts):
     # Transform documents to TF-IDF features
     features = vectorizer.fit_transform(documents)
     
-    # Save the model
-    joblib.dump(vectorizer, get_model_path(VECTORIZER_FILE))
+    # Save the model, the vectorizer last since its modification time is the model version
     joblib.dump(features, get_model_path(FEATURES_FILE))
     joblib.dump(post_ids, get_model_path(POST_IDS_FILE))
+    joblib.dump(vectorizer, get_model_path(VECTORIZER_FILE))
     
     return vectorizer, features, post_ids
 
+@timed('ai.load_model')
 def load_recommendation_model():
     """
     Load the recommendation model.
     
+    The model stays in memory until a newer one is stored, loading it before
+    the server forks lets every worker share it.
+    
     Returns:
         tuple: (vectorizer, features, post_ids) or None if model doesn't exist
     """
+    global _loaded_model
+    
+    version = get_model_version()
+    loaded_version, model = _loaded_model
+    if version and version == loaded_version:
+        return model
+    
+    import joblib
+    
     try:
         vectorizer = joblib.load(get_model_path(VECTORIZER_FILE))
         features = joblib.load(get_model_path(FEATURES_FILE))
         post_ids = joblib.load(get_model_path(POST_IDS_FILE))
-        return vectorizer, features, post_ids
     except (FileNotFoundError, EOFError):
         return None, None, None
+    
+    _loaded_model = (version, (vectorizer, features, post_ids))
+    return vectorizer, features, post_ids
 
+@timed('ai.similar_posts')
 def get_similar_posts(post_id, num_recommendations=3):
     """
     Get similar posts based on content similarity.
@@ -120,6 +157,8 @@ def get_similar_posts(post_id, num_recommendations=3):
         # Post not in model
         return []
     
+    from sklearn.metrics.pairwise import cosine_similarity
+    
     # Get the feature vector for the post
     post_vector = features[post_index:post_index+1]
     
@@ -137,57 +176,78 @@ def get_similar_posts(post_id, num_recommendations=3):
     
     return similar_post_ids
 
-def get_user_recommendations(user_id, posts, num_recommendations=5):
+def get_user_recommendation_ids(user_id, num_recommendations=5):
     """
-    Get personalized recommendations for a user based on their reading history.
+    Get the IDs of posts to recommend to a user based on their comments and recent views.
     
     Args:
         user_id (int): The ID of the user
-        posts (list): List of all Post objects
-        num_recommendations (int): Number of recommendations to return
+        num_recommendations (int): Number of recommendations wanted
         
     Returns:
-        list: List of recommended Post objects
+        list: Candidate post IDs, list them newest first and keep num_recommendations
     """
     from app.models.post import Post
+    from app.models.view import PostView
     from app import db
     
-    # Get posts the user has commented on
+    # Get posts the user has commented on, and the ones they viewed lately
     user_commented_posts = db.session.query(Post.id).join(
         Post.comments
     ).filter_by(user_id=user_id).all()
     
-    user_commented_post_ids = [p[0] for p in user_commented_posts]
+    user_post_ids = list(dict.fromkeys(
+        [p[0] for p in user_commented_posts] + PostView.recent_post_ids(user_id, limit=VIEWED_POSTS_CONSIDERED)
+    ))
     
-    # If user hasn't commented on any posts, return most recent posts
-    if not user_commented_post_ids:
-        return Post.query.filter_by(published=True).order_by(
+    # If user hasn't commented on or viewed any posts, return most recent posts
+    if not user_post_ids:
+        return [post_id for (post_id,) in db.session.query(Post.id).filter_by(published=True).order_by(
             Post.created_at.desc()
-        ).limit(num_recommendations).all()
+        ).limit(num_recommendations)]
     
-    # Get recommendations for each post the user has commented on
+    # Get recommendations for each post the user has commented on or viewed
     recommended_post_ids = set()
-    for post_id in user_commented_post_ids:
+    for post_id in user_post_ids:
         similar_post_ids = get_similar_posts(post_id, num_recommendations=2)
         recommended_post_ids.update(similar_post_ids)
     
-    # Remove posts the user has already commented on
-    recommended_post_ids = recommended_post_ids - set(user_commented_post_ids)
+    # Remove posts the user has already read
+    recommended_post_ids = recommended_post_ids - set(user_post_ids)
     
     # If we don't have enough recommendations, add recent posts
     if len(recommended_post_ids) < num_recommendations:
-        recent_posts = Post.query.filter_by(published=True).filter(
-            ~Post.id.in_(user_commented_post_ids)
+        recent_posts = db.session.query(Post.id).filter_by(published=True).filter(
+            ~Post.id.in_(user_post_ids)
         ).order_by(Post.created_at.desc()).limit(
             num_recommendations - len(recommended_post_ids)
         ).all()
         
         recommended_post_ids.update([p.id for p in recent_posts])
     
-    # Get the actual post objects
-    recommended_posts = Post.query.filter(
+    return list(recommended_post_ids)
+
+@timed('ai.user_recommendations')
+def get_user_recommendations(user_id, num_recommendations=5):
+    """
+    Get personalized recommendations for a user based on their reading history.
+    
+    Args:
+        user_id (int): The ID of the user
+        num_recommendations (int): Number of recommendations to return
+        
+    Returns:
+        list: List of recommended PostCard objects
+    """
+    from app.models.post import Post
+    from app.models.read_models import card_query, load_cards
+    
+    recommended_post_ids = get_user_recommendation_ids(user_id, num_recommendations)
+    
+    # Get the listed columns of the recommended posts
+    recommended_posts = load_cards(card_query().filter(
         Post.id.in_(recommended_post_ids),
         Post.published == True
-    ).order_by(Post.created_at.desc()).limit(num_recommendations).all()
+    ).order_by(Post.created_at.desc()).limit(num_recommendations))
     
     return recommended_posts
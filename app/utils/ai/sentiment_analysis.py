@@ -1,10 +1,11 @@
 """
 Sentiment analysis module for analyzing the sentiment of text content.
-Uses TextBlob for sentiment analysis.
+Uses TextBlob for sentiment analysis, imported on first use or by the warm-up.
 """
-from textblob import TextBlob
 import re
 
+from app.utils.metrics import timed
+
 def clean_text(text):
     """
     Clean text by removing special characters, URLs, etc.
@@ -29,6 +30,7 @@ def clean_text(text):
     
     return text
 
+@timed('ai.sentiment')
 def analyze_sentiment(text):
     """
     Analyze the sentiment of a text using TextBlob.
@@ -49,6 +51,8 @@ def analyze_sentiment(text):
             'sentiment': 'neutral'
         }
     
+    from textblob import TextBlob
+    
     # Clean the text
     cleaned_text = clean_text(text)
     
@@ -0,0 +1,157 @@
+"""
+JSON API helpers.
+Resources are described as a set of named fields, each selecting its own
+columns, so a request for ?fields=id,title only reads those two columns.
+Lists are paginated with opaque keyset cursors instead of page numbers, and
+bodies are encoded with orjson when it is installed.
+"""
+import base64
+import json
+from datetime import datetime
+
+from flask import abort, current_app, request
+
+try:
+    import orjson
+except ImportError:  # Optional, the standard json module is used without it
+    orjson = None
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def default(value):
+    """Encode values the json module does not know, the same way orjson does"""
+    if isinstance(value, datetime):
+        return value.isoformat() + 'Z' if value.tzinfo is None else value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def dumps(data):
+    """Encode data as compact JSON bytes, naive datetimes as UTC"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z)
+    return json.dumps(data, default=default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def json_response(data, status=200):
+    """Build a JSON response without going through Flask's JSON provider"""
+    return current_app.response_class(dumps(data), status=status, mimetype='application/json')
+
+
+def encode_cursor(*values):
+    """Make an opaque cursor from the sort key of the last row of a page"""
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, *types):
+    """
+    Parse a cursor made by encode_cursor, aborting with 400 if it is malformed.
+
+    Args:
+        cursor (str): Cursor from the request, None for the first page
+        types: Converter per value, e.g. datetime.fromisoformat, int
+
+    Returns:
+        tuple: Converted values, or None for the first page
+    """
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if len(values) != len(types):
+            raise ValueError(cursor)
+        return tuple(convert(value) for convert, value in zip(types, values))
+    except (ValueError, TypeError):
+        abort(400, description='Invalid cursor.')
+
+
+def limit_arg(default, maximum):
+    """Get the limit argument of a request, clamped to 1..maximum"""
+    return max(1, min(request.args.get('limit', default, type=int), maximum))
+
+
+def page_size():
+    """Get the limit argument of a list request, capped at MAX_PAGE_SIZE"""
+    return limit_arg(DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+
+
+class Field:
+    """
+    One field of a resource: the labeled columns it reads, how it is
+    serialized and the (target, onclause[, outer]) joins its columns need.
+    """
+    __slots__ = ('columns', 'serialize', 'joins')
+
+    def __init__(self, columns, serialize, joins=()):
+        self.columns = tuple(columns)
+        self.serialize = serialize
+        self.joins = tuple(joins)
+
+
+def column_field(column, name, convert=None):
+    """Field holding a single column value"""
+    if convert is None:
+        return Field([column.label(name)], lambda row: row[name])
+    return Field([column.label(name)], lambda row: convert(row[name]))
+
+
+class Fieldset:
+    """
+    The fields a request asked for with ?fields=, or the resource's defaults.
+
+    Args:
+        fields (dict): Field name -> Field for the resource, a Field of None
+            marks a field filled in after the query (e.g. tags)
+        defaults (list): Field names returned when the request names none
+    """
+
+    def __init__(self, fields, defaults):
+        requested = request.args.get('fields')
+        if requested:
+            names = list(dict.fromkeys(name.strip() for name in requested.split(',') if name.strip()))
+            unknown = [name for name in names if name not in fields]
+            if unknown:
+                abort(400, description=f'Unknown fields: {", ".join(unknown)}. '
+                                       f'Available: {", ".join(fields)}.')
+        else:
+            names = list(defaults)
+        self.names = names
+        self.fields = {name: fields[name] for name in names if fields[name] is not None}
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def query(self, entity, *extra_columns):
+        """
+        Start a query selecting only the columns of the requested fields.
+
+        Args:
+            entity: Model the query selects from
+            extra_columns: Labeled columns always needed, e.g. the sort key
+
+        Returns:
+            Query: Rows with the requested and extra columns
+        """
+        from app import db
+
+        columns = {}
+        joins = {}
+        for field in self.fields.values():
+            for column in field.columns:
+                columns[column.name] = column
+            for target, onclause, *outer in field.joins:
+                joins[target] = (onclause, bool(outer and outer[0]))
+        for column in extra_columns:
+            columns[column.name] = column
+
+        query = db.session.query(*columns.values()).select_from(entity)
+        for target, (onclause, outer) in joins.items():
+            query = query.join(target, onclause, isouter=outer)
+        return query
+
+    def serialize(self, row):
+        """Serialize a row of the query into a dict of the requested fields"""
+        mapping = row._mapping
+        return {name: field.serialize(mapping) for name, field in self.fields.items()}
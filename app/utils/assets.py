@@ -0,0 +1,167 @@
+"""
+Fingerprinted and precompressed static assets.
+'flask assets build' copies CSS and JS files into static/dist with a content hash
+in their names, writes gzip and brotli variants next to them and records the
+mapping in a manifest. url_for('static', ...) then points at the fingerprinted
+names, which are served with far-future immutable caching and, when the client
+accepts it, from the precompressed variant.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # Optional, only gzip variants are built without it
+    brotli = None
+
+DIST_FOLDER = 'dist'
+MANIFEST_FILE = 'manifest.json'
+ASSET_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt')
+COMPRESSED_MIN_SIZE = 256
+
+# Uploads get random names that are never reused, so they can be cached for good too
+IMMUTABLE_PREFIXES = (f'{DIST_FOLDER}/', 'uploads/post_images/', 'uploads/profile_pics/')
+
+
+def fingerprint(path):
+    """Get a short content hash of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def compress_file(path):
+    """
+    Write .gz and, if brotli is installed, .br variants of a file
+
+    Returns:
+        list: Paths of the written variants
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < COMPRESSED_MIN_SIZE:
+        return []
+
+    variants = []
+    gz_path = path + '.gz'
+    with open(gz_path, 'wb') as f:
+        # mtime=0 keeps the output identical between builds
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    variants.append(gz_path)
+
+    if brotli is not None:
+        br_path = path + '.br'
+        with open(br_path, 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+        variants.append(br_path)
+    return variants
+
+
+def build_assets(static_folder):
+    """
+    Fingerprint and compress the static assets.
+
+    Args:
+        static_folder: The application's static folder
+
+    Returns:
+        dict: Manifest mapping original filenames to fingerprinted ones
+    """
+    dist_folder = os.path.join(static_folder, DIST_FOLDER)
+    shutil.rmtree(dist_folder, ignore_errors=True)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        # Uploads are user content and dist is our own output
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_folder and d != 'uploads']
+        for name in files:
+            if not name.endswith(ASSET_EXTENSIONS):
+                continue
+            source = os.path.join(root, name)
+            filename = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            stem, ext = os.path.splitext(filename)
+            hashed = f'{stem}.{fingerprint(source)}{ext}'
+
+            target = os.path.join(dist_folder, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+            compress_file(target)
+            manifest[filename] = f'{DIST_FOLDER}/{hashed}'
+
+    with open(os.path.join(dist_folder, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class StaticAssets:
+    """
+    Serve fingerprinted assets when a manifest has been built.
+
+    Configured with STATIC_ASSETS_MAX_AGE (seconds) for immutable files.
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.max_age = 31536000
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_age = app.config.get('STATIC_ASSETS_MAX_AGE', 31536000)
+        self.manifest = self.load_manifest(app.static_folder)
+
+        app.url_defaults(self.rewrite_static_url)
+        app.view_functions['static'] = self.serve
+        app.extensions['static_assets'] = self
+        self.app = app
+
+    @staticmethod
+    def load_manifest(static_folder):
+        try:
+            with open(os.path.join(static_folder, DIST_FOLDER, MANIFEST_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def rewrite_static_url(self, endpoint, values):
+        """Point url_for('static', filename=...) at the fingerprinted file"""
+        if endpoint == 'static' and values.get('filename') in self.manifest:
+            values['filename'] = self.manifest[values['filename']]
+
+    def serve(self, filename):
+        """Static file view serving precompressed variants and immutable cache headers"""
+        static_folder = self.app.static_folder
+        immutable = filename.startswith(IMMUTABLE_PREFIXES)
+        encoding = None
+
+        if filename.startswith(f'{DIST_FOLDER}/'):
+            accepted = request.accept_encodings
+            for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+                if accepted[candidate] and os.path.isfile(os.path.join(static_folder, filename + suffix)):
+                    encoding = candidate
+                    break
+
+        if encoding:
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            suffix = '.br' if encoding == 'br' else '.gz'
+            response = send_from_directory(static_folder, filename + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+        else:
+            response = send_from_directory(static_folder, filename)
+
+        if filename.startswith(f'{DIST_FOLDER}/'):
+            response.vary.add('Accept-Encoding')
+        if immutable:
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = self.max_age
+            response.cache_control.immutable = True
+        return response
@@ -0,0 +1,301 @@
+"""
+Rendered page and fragment cache.
+Keeps rendered HTML for pages that only change when posts or tags are written.
+Entries are grouped in namespaces (e.g. 'home', 'tag:python', 'similar') and a
+namespace is invalidated by bumping its version, so stale entries are never read
+again and age out through normal eviction.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, session, make_response, current_app
+from flask_login import current_user
+
+
+class NullBackend:
+    """Backend that stores nothing, used to turn caching off"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, timeout=0):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'entries': 0, 'bytes': 0}
+
+
+class LRUBackend:
+    """In-process cache that evicts the least recently used entries past a byte limit"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires and expires < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=0):
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, time.time() + timeout if timeout else 0)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        return {'entries': len(self._entries), 'bytes': self._bytes}
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+
+class FileBackend:
+    """On-disk cache shared by every worker process on the host"""
+
+    def __init__(self, directory, max_entries=10000):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                expires = float(f.readline())
+                if expires and expires < time.time():
+                    return None
+                return f.read()
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, value, timeout=0):
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(f'{time.time() + timeout if timeout else 0}\n')
+            f.write(value)
+        # Atomic rename, readers in other processes never see half written entries
+        os.replace(tmp_path, path)
+
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._prune()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        entries = [entry.stat().st_size for entry in os.scandir(self.directory)]
+        return {'entries': len(entries), 'bytes': sum(entries)}
+
+    def _prune(self):
+        """Remove the least recently written files past max_entries"""
+        entries = list(os.scandir(self.directory))
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+class FragmentCache:
+    """
+    Cache for rendered pages and template fragments.
+
+    Configured with FRAGMENT_CACHE_TYPE ('lru', 'file' or 'null'),
+    FRAGMENT_CACHE_MAX_BYTES, FRAGMENT_CACHE_DIR, FRAGMENT_CACHE_MAX_ENTRIES
+    and FRAGMENT_CACHE_TIMEOUT.
+    """
+
+    def __init__(self, app=None):
+        self.backend = NullBackend()
+        self.timeout = 0
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        cache_type = app.config.get('FRAGMENT_CACHE_TYPE', 'lru')
+        if cache_type == 'lru':
+            self.backend = LRUBackend(app.config.get('FRAGMENT_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+        elif cache_type == 'file':
+            directory = app.config.get('FRAGMENT_CACHE_DIR') or os.path.join(app.instance_path, 'fragment_cache')
+            self.backend = FileBackend(directory, app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 10000))
+        else:
+            self.backend = NullBackend()
+        self.timeout = app.config.get('FRAGMENT_CACHE_TIMEOUT', 0)
+        app.extensions['fragment_cache'] = self
+
+    def _version(self, namespace):
+        return self.backend.get(f'version:{namespace}') or '0'
+
+    def make_key(self, namespace, *args):
+        """Build a cache key from a namespace, its current version and arguments"""
+        parts = ':'.join(str(arg) for arg in args)
+        return f'{namespace}:v{self._version(namespace)}:{parts}'
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value, self.timeout)
+
+    def get_or_render(self, namespace, args, render):
+        """
+        Get a cached fragment or render and store it.
+
+        Args:
+            namespace (str): Namespace used to invalidate the fragment
+            args (tuple): Values that identify the fragment within the namespace
+            render (callable): Function returning the fragment HTML
+
+        Returns:
+            str: The fragment HTML
+        """
+        key = self.make_key(namespace, *args)
+        value = self.get(key)
+        if value is None:
+            value = render()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, *namespaces):
+        """Make every entry in the given namespaces unreachable"""
+        for namespace in namespaces:
+            # A new random version instead of a counter, so concurrent bumps never collide
+            self.backend.set(f'version:{namespace}', os.urandom(4).hex())
+
+    def clear(self):
+        """Remove every entry"""
+        self.backend.clear()
+
+    def handle_remote_invalidation(self, key):
+        """Apply an invalidation published by another worker"""
+        if isinstance(self.backend, FileBackend):
+            # Versions live in the shared store, the publisher already bumped them
+            return
+        if key == '*':
+            self.clear()
+        else:
+            self.invalidate(key)
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """Get hit counts and backend usage"""
+        stats = {'hits': self.hits, 'misses': self.misses, 'hit_ratio': round(self.hit_ratio, 4)}
+        stats.update(self.backend.stats())
+        return stats
+
+    def cached_page(self, namespace):
+        """
+        Cache a view's full HTML response for anonymous visitors.
+
+        Args:
+            namespace: Namespace name, or a function building it from the view arguments
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # Pages for logged in users or with pending flash messages are personal
+                if current_user.is_authenticated or session.get('_flashes'):
+                    return view(*args, **kwargs)
+
+                name = namespace(**kwargs) if callable(namespace) else namespace
+                key = self.make_key(name, request.path, sorted(request.args.items(multi=True)))
+                html = self.get(key)
+                if html is not None:
+                    response = make_response(html)
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and response.mimetype == 'text/html':
+                    self.set(key, response.get_data(as_text=True))
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+
+def invalidate_fragments(*namespaces):
+    """Invalidate namespaces in this worker and publish them to the other workers"""
+    current_app.extensions['fragment_cache'].invalidate(*namespaces)
+    bus = current_app.extensions.get('invalidation_bus')
+    if bus is not None:
+        bus.publish('fragments', *namespaces)
+
+
+def clear_fragments():
+    """Clear the cache in this worker and in the other workers"""
+    current_app.extensions['fragment_cache'].clear()
+    bus = current_app.extensions.get('invalidation_bus')
+    if bus is not None:
+        bus.publish('fragments', '*')
+
+
+def invalidate_post_pages(*tag_names):
+    """Invalidate the cached pages that list posts, after a post write"""
+    invalidate_fragments('home', 'similar', *[f'tag:{name}' for name in tag_names])
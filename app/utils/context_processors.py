@@ -1,5 +1,10 @@
 from datetime import datetime
+from app.utils.image_utils import upload_url, upload_srcset
 
 def inject_now():
     """Inject current datetime into templates"""
     return {'now': datetime.utcnow()}
+
+def inject_image_helpers():
+    """Inject upload URL helpers used by the picture macro"""
+    return {'upload_url': upload_url, 'upload_srcset': upload_srcset}
@@ -0,0 +1,104 @@
+from sqlalchemy import insert, update
+from app import db
+
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """Turn on foreign key enforcement, SQLite has it off for every new connection"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+
+def dialect_insert(table):
+    """
+    Build an INSERT statement that supports ON CONFLICT clauses
+
+    Args:
+        table: Table or model to insert into
+
+    Returns:
+        Insert: Dialect-specific insert, or None if the backend has no ON CONFLICT support
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as conflict_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as conflict_insert
+    else:
+        return None
+    return conflict_insert(table)
+
+
+def insert_ignore(table, rows, index_elements):
+    """
+    Insert many rows in one statement, skipping rows that already exist
+
+    Args:
+        table: Table or model to insert into
+        rows: List of dicts with column values
+        index_elements: Columns of the unique constraint to check
+    """
+    if not rows:
+        return
+
+    stmt = dialect_insert(table)
+    if stmt is None:
+        # No ON CONFLICT support, fall back to a plain insert
+        db.session.execute(insert(table), rows)
+        return
+
+    db.session.execute(stmt.on_conflict_do_nothing(index_elements=index_elements), rows)
+
+
+def upsert_increment(table, rows, index_elements, column, replace=()):
+    """
+    Insert many rows, adding to a counter column for rows that already exist
+
+    Args:
+        table: Table or model to upsert into
+        rows: List of dicts with key and counter values
+        index_elements: Columns of the unique constraint to check
+        column: Name of the counter column to increment
+        replace: Names of columns overwritten with the new row's value, e.g. a timestamp
+    """
+    if not rows:
+        return
+
+    stmt = dialect_insert(table)
+    if stmt is None:
+        # No ON CONFLICT support, fall back to a statement per row
+        update_or_insert(table, rows, index_elements, column, replace)
+        return
+
+    target = getattr(stmt.table.c, column)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={column: target + getattr(stmt.excluded, column),
+              **{name: getattr(stmt.excluded, name) for name in replace}}
+    )
+    db.session.execute(stmt, rows)
+
+
+def update_or_insert(table, rows, index_elements, column, replace=()):
+    """
+    Add to the counter of existing rows one UPDATE at a time, then insert the rest in one statement
+
+    Used by upsert_increment on backends without ON CONFLICT. Unlike the upsert
+    it is not atomic, a concurrent insert of the same key fails with an IntegrityError.
+
+    Args:
+        table: Table or model to upsert into
+        rows: List of dicts with key and counter values
+        index_elements: Columns of the unique constraint to check
+        column: Name of the counter column to increment
+        replace: Names of columns overwritten with the new row's value
+    """
+    table = getattr(table, '__table__', table)
+    missing = []
+    for row in rows:
+        stmt = update(table).where(*(table.c[name] == row[name] for name in index_elements)).values(
+            {column: table.c[column] + row[column], **{name: row[name] for name in replace}}
+        )
+        if db.session.execute(stmt).rowcount == 0:
+            missing.append(row)
+    if missing:
+        db.session.execute(insert(table), missing)
@@ -1,39 +1,18 @@
-import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from flask import url_for, current_app
+from flask import url_for
+
+from app.models.email import OutboundEmail
 
 def send_email(subject, recipient, html_body):
     """
-    Send an email using SMTP
-    
-    In a production environment, you would use a proper email service.
-    This is a simplified version for demonstration purposes.
+    Queue an email for the background mail sender.
+
+    The message is sent once the current transaction is committed and the
+    sender is woken with mail_sender.notify().
+
+    Returns:
+        OutboundEmail: The queued message
     """
-    # For demonstration purposes only - in a real app, use environment variables
-    sender_email = os.environ.get('EMAIL_USER', 'noreply@example.com')
-    password = os.environ.get('EMAIL_PASSWORD', '')
-    smtp_server = os.environ.get('SMTP_SERVER', 'smtp.example.com')
-    smtp_port = int(os.environ.get('SMTP_PORT', 587))
-    
-    # Create message
-    message = MIMEMultipart("alternative")
-    message["Subject"] = subject
-    message["From"] = sender_email
-    message["To"] = recipient
-    
-    # Add HTML content
-    html_part = MIMEText(html_body, "html")
-    message.attach(html_part)
-    
-    # For development, just print the email content instead of sending
-    print(f"Would send email to {recipient}:")
-    print(f"Subject: {subject}")
-    print(f"Body: {html_body}")
-    
-    # For development, we'll return True to simulate successful email sending
-    return True
+    return OutboundEmail.queue(subject, recipient, html_body)
 
 def send_reset_email(user):
     """Send password reset email to user"""
@@ -55,5 +34,5 @@ def send_reset_email(user):
     </html>
     '''
     
-    # Send the email
+    # Queue the email
     return send_email(subject, user.email, html_body)
@@ -1,37 +1,107 @@
+import glob
+import hashlib
 import os
-import secrets
-from PIL import Image
+import tempfile
 from flask import current_app
+from app.utils.image_tasks import ImageQueueFull
+from app.utils.image_utils import FALLBACK_SIZES, PENDING_SUFFIX, InvalidImage, check_signature, probe_image
+from app.utils.metrics import timed
 
-def save_picture(form_picture, folder='uploads', size=(800, 800)):
+def spool_upload(form_picture, directory, chunk_size=64 * 1024, check_header=None):
     """
-    Save uploaded picture with a random name and resize it
+    Copy an upload to a temporary file in chunks, hashing it on the way
+    
+    Only one chunk is held in memory at a time, whatever the upload size.
     
     Args:
         form_picture: The uploaded file from form
-        folder: Subfolder within UPLOAD_FOLDER to save to
-        size: Tuple of (width, height) to resize image to
+        directory: Directory for the temporary file, on the same filesystem as its destination
+        chunk_size: Bytes read at a time
+        check_header: Optional function called with the first chunk, raising to reject the upload
         
     Returns:
-        String: Filename of the saved picture
+        Tuple: (temporary file path, SHA-256 hex digest of the content)
+    """
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(dir=directory, suffix='.tmp', delete=False) as f:
+        try:
+            first = True
+            for chunk in iter(lambda: form_picture.stream.read(chunk_size), b''):
+                if first and check_header is not None:
+                    check_header(chunk)
+                first = False
+                digest.update(chunk)
+                f.write(chunk)
+            if first and check_header is not None:
+                check_header(b'')
+        except Exception:
+            f.close()
+            os.remove(f.name)
+            raise
+    return f.name, digest.hexdigest()
+
+
+def content_filename(digest, file_ext):
+    """Get the sharded, content-addressed name of an upload, e.g. 'ab/cd/abcd....jpg'"""
+    return f'{digest[:2]}/{digest[2:4]}/{digest}{file_ext.lower()}'
+
+
+@timed('image.save')
+def save_picture(form_picture, folder='uploads', size=None):
     """
-    # Generate random filename to avoid collisions
-    random_hex = secrets.token_hex(8)
-    _, file_ext = os.path.splitext(form_picture.filename)
-    picture_filename = random_hex + file_ext
+    Save uploaded picture under its content hash and queue it for resizing
+    
+    The resized picture keeps its original format as a fallback, WebP
+    variants at the folder's IMAGE_VARIANT_WIDTHS are written next to it.
+    Both are written by the image processor after the request has returned.
+    An upload identical to one already stored reuses the stored file, callers
+    record the reference with UploadRef.acquire.
     
-    # Create full path for saving
+    Args:
+        form_picture: The uploaded file from form
+        folder: Subfolder within UPLOAD_FOLDER to save to
+        size: Tuple of (width, height) to resize image to, defaults to the folder's size
+        
+    Returns:
+        String: Filename the picture will have once processed, relative to the folder
+        
+    Raises:
+        InvalidImage: If the upload is not a JPEG, PNG or GIF image within IMAGE_MAX_PIXELS
+        ImageQueueFull: If too many uploads are already being processed
+    """
     upload_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], folder)
     os.makedirs(upload_folder, exist_ok=True)
+    
+    # Stage the upload as it arrives, its name is only known once it has been hashed.
+    # Invalid files are rejected from their first bytes and their header, before any decoding
+    spooled_path, digest = spool_upload(form_picture, upload_folder, check_header=check_signature)
+    try:
+        file_ext = probe_image(spooled_path, current_app.config.get('IMAGE_MAX_PIXELS', 50_000_000))
+    except InvalidImage:
+        os.remove(spooled_path)
+        raise
+    picture_filename = content_filename(digest, file_ext)
     picture_path = os.path.join(upload_folder, picture_filename)
     
-    # Resize and save image
-    img = Image.open(form_picture)
-    img.thumbnail(size)
-    img.save(picture_path)
+    # Stored already, or being processed for an identical upload
+    if os.path.exists(picture_path) or os.path.exists(picture_path + PENDING_SUFFIX):
+        os.remove(spooled_path)
+        return picture_filename
+    
+    # The pool decodes and resizes it
+    os.makedirs(os.path.dirname(picture_path), exist_ok=True)
+    staged_path = picture_path + PENDING_SUFFIX
+    os.replace(spooled_path, staged_path)
+    try:
+        current_app.extensions['image_processor'].submit(
+            staged_path, folder, picture_filename, size or FALLBACK_SIZES.get(folder, (800, 800))
+        )
+    except ImageQueueFull:
+        os.remove(staged_path)
+        raise
     
     # Return only the filename without the folder prefix
-    # This is because templates use url_for('static', filename='uploads/' + path)
+    # This is because templates use url_for('static', filename='uploads/<folder>/' + path)
     return picture_filename
 
 
@@ -71,3 +141,48 @@ def delete_file(filename):
     except Exception as e:
         print(f"Error deleting file: {e}")
     return False
+
+
+def delete_files(filenames):
+    """
+    Delete several files and their WebP variants from the upload folder in one pass
+    
+    Call this after the database change that dropped the references
+    has been committed, so a rollback never leaves records without files.
+    Files an identical upload has started using again since then are kept.
+    
+    Args:
+        filenames: Relative paths of files to delete
+        
+    Returns:
+        Integer: Number of files deleted
+    """
+    from app import db
+    from app.models.upload import UploadRef
+
+    filenames = list(filenames)
+    if not filenames:
+        return 0
+    # save_picture reuses a stored file without a lock, its new reference is committed by now
+    reused = {path for (path,) in db.session.query(UploadRef.path).filter(UploadRef.path.in_(filenames))}
+    
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    deleted = 0
+    for filename in filenames:
+        if filename in reused:
+            continue
+        path = os.path.join(upload_folder, filename)
+        stem, _ = os.path.splitext(path)
+        for variant in glob.glob(glob.escape(stem) + '.w*.webp'):
+            try:
+                os.remove(variant)
+            except OSError:
+                pass
+        try:
+            os.remove(path)
+            deleted += 1
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error deleting file: {e}")
+    return deleted
@@ -0,0 +1,128 @@
+"""
+HTTP conditional request helpers.
+Views declare a cheap validator function that returns the values their page
+depends on; the page's ETag and Last-Modified are derived from those values,
+and a 304 is returned before the view runs when the client copy is current.
+Views without cheap validators can hash their body instead, which still saves
+sending it.
+"""
+import hashlib
+import time
+from datetime import timezone
+from functools import wraps
+
+from flask import request, session, make_response, current_app
+from flask_login import current_user
+
+
+def make_etag(parts):
+    """Hash validator values into an ETag"""
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def as_http_date(value):
+    """Convert a naive UTC datetime to the second precision used by Last-Modified"""
+    if value is None:
+        return None
+    return value.replace(microsecond=0, tzinfo=timezone.utc)
+
+
+def form_validators():
+    """
+    Values the forms of a signed-in user's page depend on.
+
+    Personal pages embed CSRF tokens, which are signed from the session's
+    secret and expire WTF_CSRF_TIME_LIMIT seconds after the page rendered.
+    The ETag changes with the secret and every half time limit, so a page
+    revalidated with a 304 still has at least half the limit to be posted.
+    """
+    config = current_app.config
+    if not current_user.is_authenticated or not config.get('WTF_CSRF_ENABLED', True):
+        return []
+    limit = config.get('WTF_CSRF_TIME_LIMIT', 3600)
+    period = int(time.time() // (limit / 2)) if limit else None
+    return [session.get(config.get('WTF_CSRF_FIELD_NAME', 'csrf_token')), period]
+
+
+def set_cache_headers(response, etag, last_modified):
+    """Add validators and caching rules for the current viewer to a response"""
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+
+    if current_user.is_authenticated:
+        # Personal page, the browser may keep it but must revalidate every time
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    else:
+        # Shared caches may serve anonymous pages for a short while
+        response.cache_control.public = True
+        response.cache_control.max_age = 0
+        response.cache_control.s_maxage = current_app.config.get('HTTP_CACHE_SHARED_MAX_AGE', 60)
+        response.vary.add('Cookie')
+    return response
+
+
+def conditional(validators):
+    """
+    Answer conditional GET requests for a view with 304 Not Modified.
+
+    Args:
+        validators: Function called with the view arguments, returning a tuple
+            (list of values the page depends on, last modified datetime or None),
+            or None to let the view handle the request as usual (e.g. for a 404)
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Flash messages are shown once, so those pages are never conditional
+            if request.method != 'GET' or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            result = validators(**kwargs)
+            if result is None:
+                return view(*args, **kwargs)
+
+            parts, last_modified = result
+            viewer = current_user.id if current_user.is_authenticated else 'anonymous'
+            etag = make_etag([viewer, *form_validators(), *parts])
+            last_modified = as_http_date(last_modified)
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                not_modified = bool(
+                    last_modified and request.if_modified_since and
+                    last_modified <= request.if_modified_since
+                )
+
+            if not_modified:
+                return set_cache_headers(make_response('', 304), etag, last_modified)
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                set_cache_headers(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+def body_etag(view):
+    """
+    Answer conditional GET requests for a view with 304 Not Modified, using a
+    hash of the response body as the ETag.
+
+    The view still runs, only the transfer of an unchanged body is saved. Use
+    conditional when the page has validators that are cheaper to compute.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        response = make_response(view(*args, **kwargs))
+        if request.method != 'GET' or response.status_code != 200 or response.is_streamed:
+            return response
+
+        etag = hashlib.sha1(response.get_data()).hexdigest()
+        if request.if_none_match.contains_weak(etag):
+            return set_cache_headers(make_response('', 304), etag, None)
+        return set_cache_headers(response, etag, None)
+    return wrapper
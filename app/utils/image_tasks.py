@@ -0,0 +1,231 @@
+"""
+Off-request image processing.
+Uploads are written to disk as they arrive and decoded, resized and re-encoded
+in a small process pool, so CPU-bound Pillow work never runs in a request thread.
+Each web worker keeps at most IMAGE_QUEUE_LIMIT uploads in flight; past that,
+new uploads wait up to IMAGE_QUEUE_TIMEOUT seconds for a slot and are then
+refused with ImageQueueFull instead of queueing without bound. Templates show
+a placeholder for a picture until its processed file lands.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from functools import partial
+
+from app.utils.image_utils import DEFAULT_PROFILE_IMAGE, PENDING_SUFFIX, variant_widths, write_variants
+from app.utils.metrics import observe_span, span
+
+logger = logging.getLogger(__name__)
+
+
+class ImageQueueFull(Exception):
+    """Raised when too many uploads are already waiting to be processed"""
+
+    def __init__(self):
+        super().__init__('Too many images are being processed right now, please try again in a moment.')
+
+
+def process_image(source, directory, filename, size, widths, quality):
+    """
+    Turn a staged upload into its resized fallback file and WebP variants.
+
+    Runs in a pool process. The fallback is moved into place last, so once it
+    exists the variants do too.
+
+    Args:
+        source: Path of the staged upload
+        directory: Directory to write to
+        filename: Name of the fallback file
+        size: Bounding box of the fallback file
+        widths: WebP variant widths
+        quality: WebP quality
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(source) as img:
+            largest = max([size[0], *widths])
+            if img.format == 'JPEG' and img.width > largest:
+                # libjpeg decodes straight to a reduced scale that still covers the largest output
+                img.draft('RGB', (largest, max(1, largest * img.height // img.width)))
+            img.thumbnail(size)
+
+            write_variants(img, directory, filename, widths, quality)
+
+            image_format = Image.registered_extensions().get(os.path.splitext(filename)[1].lower(), img.format)
+            if image_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            target = os.path.join(directory, filename)
+            img.save(target + '.tmp', format=image_format)
+            os.replace(target + '.tmp', target)
+    finally:
+        os.remove(source)
+
+
+class ImageProcessor:
+    """
+    Bounded process pool for upload processing.
+
+    Configured with IMAGE_WORKERS (pool processes, 0 processes uploads in the
+    request), IMAGE_QUEUE_LIMIT, IMAGE_QUEUE_TIMEOUT (seconds) and
+    IMAGE_POOL_START_METHOD ('spawn' by default, pool processes import the
+    application modules fresh instead of inheriting a threaded web worker).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.workers = 2
+        self.queue_limit = 8
+        self.queue_timeout = 2.0
+        self.start_method = 'spawn'
+        self.pending = 0
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(self.queue_limit)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.workers = app.config.get('IMAGE_WORKERS', 2)
+        self.queue_limit = app.config.get('IMAGE_QUEUE_LIMIT', max(self.workers, 1) * 4)
+        self.queue_timeout = app.config.get('IMAGE_QUEUE_TIMEOUT', 2.0)
+        self.start_method = app.config.get('IMAGE_POOL_START_METHOD', 'spawn')
+        self._slots = threading.BoundedSemaphore(self.queue_limit)
+        self.app = app
+        app.extensions['image_processor'] = self
+
+    def _get_executor(self, replace=False):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # Pools do not survive a fork, each worker process starts its own on first use
+        with self._lock:
+            if replace or self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context(self.start_method)
+                )
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def submit(self, source, folder, filename, size):
+        """
+        Queue a staged upload for processing.
+
+        Args:
+            source: Path of the staged upload
+            folder: Subfolder within UPLOAD_FOLDER
+            filename: Name the processed picture is saved under
+            size: Bounding box of the fallback file
+
+        Raises:
+            ImageQueueFull: If no slot frees up within IMAGE_QUEUE_TIMEOUT
+            Exception: Processing errors, only when uploads are processed in the request
+        """
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise ImageQueueFull()
+        with self._lock:
+            self.pending += 1
+
+        config = self.app.config
+        args = (
+            source, os.path.join(config['UPLOAD_FOLDER'], folder), filename, size,
+            variant_widths(folder), config.get('IMAGE_WEBP_QUALITY', 80)
+        )
+        if self.workers == 0:
+            try:
+                with span('image.process'):
+                    process_image(*args)
+            finally:
+                self._release()
+            return
+
+        from concurrent.futures.process import BrokenProcessPool
+
+        try:
+            try:
+                future = self._get_executor().submit(process_image, *args)
+            except BrokenProcessPool:
+                # A pool process died, e.g. killed for memory, start a new pool once
+                future = self._get_executor(replace=True).submit(process_image, *args)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(partial(self._done, folder, filename, time.perf_counter()))
+
+    def _release(self):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def _done(self, folder, filename, submitted, future):
+        self._release()
+        # Includes the wait for a pool process
+        observe_span('image.process', time.perf_counter() - submitted)
+        with self.app.app_context():
+            try:
+                handle_processed(folder, filename, future.exception())
+            except Exception:
+                logger.exception('Could not record processed image %s/%s', folder, filename)
+
+    def stats(self):
+        """Get pool size and queue usage"""
+        return {
+            'workers': self.workers, 'queue_limit': self.queue_limit,
+            'pending': self.pending, 'rejected': self.rejected
+        }
+
+
+def handle_processed(folder, filename, error):
+    """
+    Update the records using a picture once it has been processed.
+
+    Pages showing its placeholder are invalidated and the records are marked
+    as changed for conditional requests, without touching updated_at. If
+    processing failed, the records stop referring to the picture.
+    """
+    from app import db
+    from app.models.post import Post, Tag, post_tags
+    from app.models.upload import UploadRef
+    from app.models.user import User
+    from app.utils.cache import invalidate_post_pages
+
+    tag_names = []
+    if folder == 'post_images':
+        tag_names = db.session.query(Tag.name).join(post_tags, post_tags.c.tag_id == Tag.id).join(
+            Post, Post.id == post_tags.c.post_id
+        ).filter(Post.image_file == filename).distinct()
+        tag_names = [name for (name,) in tag_names]
+
+    now = datetime.utcnow()
+    post_values = {'image_updated_at': now, 'updated_at': Post.updated_at}
+    user_values = {'profile_updated_at': now}
+    if error is not None:
+        logger.warning('Could not process image %s/%s: %s', folder, filename, error)
+        post_values['image_file'] = None
+        user_values['profile_image'] = DEFAULT_PROFILE_IMAGE
+        db.session.execute(
+            db.delete(UploadRef).where(UploadRef.path == f'{folder}/{filename}'),
+            execution_options={'synchronize_session': False}
+        )
+
+    # Listings show the placeholder until now, their validators read these columns
+    if folder == 'post_images':
+        db.session.execute(
+            db.update(Post).where(Post.image_file == filename).values(**post_values),
+            execution_options={'synchronize_session': False}
+        )
+    elif folder == 'profile_pics':
+        db.session.execute(
+            db.update(User).where(User.profile_image == filename).values(**user_values),
+            execution_options={'synchronize_session': False}
+        )
+    db.session.commit()
+
+    if folder == 'post_images':
+        invalidate_post_pages(*tag_names)
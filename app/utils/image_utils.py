@@ -0,0 +1,205 @@
+"""
+Responsive image variants.
+Every uploaded picture is kept in its original format as a fallback and written
+again as WebP at each width in IMAGE_VARIANT_WIDTHS for its folder, named
+'<stem>.w<width>.webp' next to the original. Templates list the variants in a
+srcset so browsers download the smallest file that fills the displayed size.
+While an upload is still being processed a placeholder is shown instead.
+Uploads are checked from their header before anything decodes them.
+Pillow is imported by the functions that decode images, so pages that only
+link to uploads never load it.
+"""
+import os
+import re
+
+from flask import current_app, url_for
+
+DEFAULT_PROFILE_IMAGE = 'default_profile.jpg'
+PLACEHOLDER_IMAGE = 'img/placeholder.svg'
+# Bounding box of the original-format fallback per upload folder
+FALLBACK_SIZES = {'post_images': (800, 800), 'profile_pics': (150, 150)}
+VARIANT_PATTERN = re.compile(r'\.w\d+\.webp$')
+# Uploads waiting for the image processor
+PENDING_SUFFIX = '.pending'
+
+# Accepted upload formats, the extension they are stored with and their file signatures
+UPLOAD_FORMATS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif'}
+UPLOAD_SIGNATURES = (b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a')
+
+
+class InvalidImage(ValueError):
+    """Raised for uploads that are not an accepted image or are too large to decode"""
+
+
+def check_signature(header):
+    """
+    Reject an upload from its first bytes, before the rest of it is read.
+
+    Raises:
+        InvalidImage: If the bytes do not start like a JPEG, PNG or GIF file
+    """
+    if not header.startswith(UPLOAD_SIGNATURES):
+        raise InvalidImage('Only JPEG, PNG and GIF images are accepted.')
+
+
+def probe_image(path, max_pixels):
+    """
+    Check an upload's format and dimensions from its header, without decoding it.
+
+    Args:
+        path: Path of the spooled upload
+        max_pixels: Largest width * height accepted
+
+    Returns:
+        str: Extension to store the image with
+
+    Raises:
+        InvalidImage: If the file is not an accepted image or has too many pixels
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        # Image.open only parses the header, pixel data is read on first access
+        with Image.open(path, formats=list(UPLOAD_FORMATS)) as img:
+            image_format, (width, height) = img.format, img.size
+    except Image.DecompressionBombError as e:
+        raise InvalidImage(f'The image has too many pixels, the limit is {max_pixels:,}.') from e
+    except (UnidentifiedImageError, OSError, SyntaxError) as e:
+        raise InvalidImage('The file is not a valid image.') from e
+
+    if width * height > max_pixels:
+        raise InvalidImage(
+            f'The image is {width}x{height} pixels, the limit is {max_pixels:,} pixels.'
+        )
+    return UPLOAD_FORMATS[image_format]
+
+
+def variant_widths(folder):
+    """Get the configured variant widths for an upload folder"""
+    return tuple(sorted(current_app.config.get('IMAGE_VARIANT_WIDTHS', {}).get(folder, ())))
+
+
+def variant_filename(filename, width):
+    """Get the name of a WebP variant of an uploaded file"""
+    stem, _ = os.path.splitext(filename)
+    return f'{stem}.w{width}.webp'
+
+
+def is_variant(filename):
+    return bool(VARIANT_PATTERN.search(filename))
+
+
+def upload_stem(filename):
+    """Get the name an upload shares with its variants and staging files, without extensions"""
+    for suffix in (PENDING_SUFFIX, '.tmp'):
+        if filename.endswith(suffix):
+            filename = filename[:-len(suffix)]
+    match = VARIANT_PATTERN.search(filename)
+    if match:
+        return filename[:match.start()]
+    return os.path.splitext(filename)[0]
+
+
+def resize_to_width(img, width):
+    """Scale an image down to a width keeping its aspect ratio, never up"""
+    from PIL import Image
+
+    if img.width <= width:
+        return img.copy()
+    height = max(1, round(img.height * width / img.width))
+    return img.resize((width, height), Image.LANCZOS)
+
+
+def write_variants(img, directory, filename, widths, quality=None):
+    """
+    Write WebP variants of an image.
+
+    Args:
+        img: Opened PIL image
+        directory: Directory of the original file
+        filename: Name of the original file
+        widths: Variant widths in pixels
+        quality: WebP quality, defaults to IMAGE_WEBP_QUALITY
+
+    Returns:
+        list: Names of the written variants
+    """
+    if quality is None:
+        quality = current_app.config.get('IMAGE_WEBP_QUALITY', 80)
+
+    # WebP has no palette or CMYK mode, keep transparency where there is some
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if img.mode in ('P', 'LA', 'PA') else 'RGB')
+
+    written = []
+    for width in widths:
+        name = variant_filename(filename, width)
+        resize_to_width(img, width).save(os.path.join(directory, name), 'WEBP', quality=quality, method=4)
+        written.append(name)
+    return written
+
+
+def generate_variants(folder, filename, force=False):
+    """
+    Write the missing variants of a file already in the upload folder.
+
+    Args:
+        folder: Subfolder within UPLOAD_FOLDER
+        filename: Name of the original file
+        force: Rewrite variants that already exist
+
+    Returns:
+        list: Names of the written variants
+    """
+    directory = os.path.join(current_app.config['UPLOAD_FOLDER'], folder)
+    widths = [
+        width for width in variant_widths(folder)
+        if force or not os.path.exists(os.path.join(directory, variant_filename(filename, width)))
+    ]
+    if not widths:
+        return []
+
+    from PIL import Image
+
+    with Image.open(os.path.join(directory, filename)) as img:
+        return write_variants(img, directory, filename, widths)
+
+
+def upload_path(folder, filename):
+    """Get the static path of an uploaded file"""
+    # The default profile picture lives at the top of the upload folder
+    if filename == DEFAULT_PROFILE_IMAGE:
+        return f'uploads/{filename}'
+    return f'uploads/{folder}/{filename}'
+
+
+def upload_ready(folder, filename):
+    """Check whether an uploaded file has been processed"""
+    if filename == DEFAULT_PROFILE_IMAGE:
+        return True
+    return os.path.exists(os.path.join(current_app.config['UPLOAD_FOLDER'], folder, filename))
+
+
+def upload_url(folder, filename):
+    """Get the URL of an uploaded file in its original format, or of the placeholder"""
+    if not upload_ready(folder, filename):
+        return url_for('static', filename=PLACEHOLDER_IMAGE)
+    return url_for('static', filename=upload_path(folder, filename))
+
+
+def upload_srcset(folder, filename):
+    """
+    Get a srcset listing the WebP variants of an uploaded file, or '' if it has none.
+
+    Only variants that exist are listed: browsers do not fall back to the
+    original when a listed variant is missing, e.g. for uploads from before
+    variants were generated that `flask images backfill` has not reached yet.
+    """
+    if not filename or filename == DEFAULT_PROFILE_IMAGE or not upload_ready(folder, filename):
+        return ''
+    directory = os.path.join(current_app.config['UPLOAD_FOLDER'], folder)
+    return ', '.join(
+        f"{url_for('static', filename=upload_path(folder, variant_filename(filename, width)))} {width}w"
+        for width in variant_widths(folder)
+        if os.path.exists(os.path.join(directory, variant_filename(filename, width)))
+    )
@@ -0,0 +1,150 @@
+"""
+Cross-worker cache invalidation bus.
+Write paths invalidate their own caches and publish (channel, key) events into
+a small SQLite event log shared by every worker on the host. Each worker remembers
+the last sequence number it has seen and, at most every INVALIDATION_POLL_INTERVAL
+seconds, reads newer events before handling a request and passes them to the
+handlers subscribed to their channel.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import request
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidationBus:
+    """
+    Publish/subscribe for cache invalidation without an external broker.
+
+    Configured with INVALIDATION_BUS_PATH, INVALIDATION_POLL_INTERVAL (seconds)
+    and INVALIDATION_RETENTION (seconds events are kept in the log).
+    """
+
+    def __init__(self, app=None):
+        self.path = None
+        self.poll_interval = 1.0
+        self.retention = 3600
+        self.last_seq = 0
+        self._handlers = {}
+        self._last_poll = 0.0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.path = app.config.get('INVALIDATION_BUS_PATH') or os.path.join(app.instance_path, 'invalidation.db')
+        self.poll_interval = app.config.get('INVALIDATION_POLL_INTERVAL', 1.0)
+        self.retention = app.config.get('INVALIDATION_RETENTION', 3600)
+
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS events (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    channel TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    origin INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            # Start from the end of the log, older events are already reflected in fresh caches
+            self.last_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM events').fetchone()[0]
+
+        app.before_request(self._poll_before_request)
+        app.extensions['invalidation_bus'] = self
+
+    @contextmanager
+    def _connect(self):
+        """Open the event log, committing and closing it afterwards"""
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def subscribe(self, channel, handler):
+        """
+        Register a handler for a channel.
+
+        Args:
+            channel (str): Channel name, e.g. 'fragments'
+            handler (callable): Called with each published key
+        """
+        handlers = self._handlers.setdefault(channel, [])
+        if handler not in handlers:
+            handlers.append(handler)
+
+    def _dispatch(self, channel, key):
+        for handler in self._handlers.get(channel, []):
+            handler(key)
+
+    def publish(self, channel, *keys):
+        """
+        Record keys for the other workers.
+
+        The publishing worker is expected to have invalidated its own cache
+        already, its events are skipped when it polls.
+
+        Args:
+            channel (str): Channel name
+            keys: Keys to invalidate
+        """
+        if not keys:
+            return
+
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.executemany(
+                    'INSERT INTO events (channel, key, origin, created_at) VALUES (?, ?, ?, ?)',
+                    [(channel, key, os.getpid(), now) for key in keys]
+                )
+                conn.execute('DELETE FROM events WHERE created_at < ?', (now - self.retention,))
+        except sqlite3.Error as e:
+            # The write that triggered this has already been committed, do not fail the request
+            logger.warning('Could not publish invalidation for %s: %s', channel, e)
+
+    def poll(self):
+        """
+        Apply events published by other workers since the last poll.
+
+        Returns:
+            int: Number of events applied
+        """
+        with self._lock:
+            try:
+                with self._connect() as conn:
+                    rows = conn.execute(
+                        'SELECT seq, channel, key, origin FROM events WHERE seq > ? ORDER BY seq',
+                        (self.last_seq,)
+                    ).fetchall()
+            except sqlite3.Error as e:
+                # Caches may be stale until the log can be read again, pages are still served.
+                # The next attempt waits for the poll interval like a successful poll
+                logger.warning('Could not poll invalidations from %s: %s', self.path, e)
+                self._last_poll = time.time()
+                return 0
+
+            pid = os.getpid()
+            applied = 0
+            for seq, channel, key, origin in rows:
+                self.last_seq = seq
+                # This worker's own events were applied when they were published
+                if origin != pid:
+                    self._dispatch(channel, key)
+                    applied += 1
+            self._last_poll = time.time()
+            return applied
+
+    def _poll_before_request(self):
+        if request.endpoint == 'static':
+            return
+        if time.time() - self._last_poll >= self.poll_interval:
+            self.poll()
@@ -0,0 +1,237 @@
+"""
+Login CPU protection.
+Password hashing is deliberately slow, so a burst of login attempts can take
+every worker's CPU. Attempts are first checked against sliding-window limits
+per client IP and per username, and the hashing that remains runs on a small
+per-process thread pool with a bounded queue, leaving the other request
+threads free for normal pages.
+"""
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordHashBusy(Exception):
+    """Raised when the password hashing queue is full"""
+
+    def __init__(self):
+        super().__init__('The server is busy, please try again in a moment.')
+
+
+class _Ring:
+    """Times of a key's most recent events, oldest at the write position"""
+    __slots__ = ('times', 'pos')
+
+    def __init__(self, size):
+        self.times = array('d', [float('-inf')]) * size
+        self.pos = 0
+
+
+class SlidingWindowLimiter:
+    """
+    Allow at most `limit` events per `window` seconds per key.
+
+    Each key keeps the times of its last `limit` events in a fixed-size ring
+    buffer. A new event is allowed when the oldest of them has left the window.
+    At most `max_keys` keys are kept, the least recently used are dropped first.
+    """
+
+    def __init__(self, limit, window, max_keys=10000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._rings = OrderedDict()
+        self._lock = threading.Lock()
+
+    def retry_after(self, key, now=None):
+        """Seconds until the key may have another event, 0 if it may now"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring is None:
+                return 0
+            return max(0.0, ring.times[ring.pos] + self.window - now)
+
+    def record(self, key, now=None):
+        """Record an event for a key"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring is None:
+                ring = self._rings[key] = _Ring(self.limit)
+                if len(self._rings) > self.max_keys:
+                    self._rings.popitem(last=False)
+            else:
+                self._rings.move_to_end(key)
+            ring.times[ring.pos] = now
+            ring.pos = (ring.pos + 1) % self.limit
+
+    def hit(self, key, now=None):
+        """
+        Record an event if the key is within its limit.
+
+        Returns:
+            float: 0 if the event was allowed, otherwise seconds until it would be
+        """
+        now = time.monotonic() if now is None else now
+        wait = self.retry_after(key, now)
+        if not wait:
+            self.record(key, now)
+        return wait
+
+    def reset(self, key):
+        with self._lock:
+            self._rings.pop(key, None)
+
+    def __len__(self):
+        return len(self._rings)
+
+
+class LoginGuard:
+    """
+    Rate limits and a bounded hashing pool for the login path.
+
+    Configured with LOGIN_IP_LIMIT and LOGIN_IP_WINDOW (attempts per client IP),
+    LOGIN_USER_LIMIT and LOGIN_USER_WINDOW (failed attempts per username),
+    PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE (hashes waiting for a worker)
+    and PASSWORD_HASH_TIMEOUT (seconds).
+    """
+
+    def __init__(self, app=None):
+        self.ip_limiter = SlidingWindowLimiter(20, 60)
+        self.user_limiter = SlidingWindowLimiter(5, 300)
+        self.workers = 2
+        self.queue_limit = 16
+        self.timeout = 5.0
+        self.counters = dict.fromkeys(
+            ('attempts', 'rate_limited_ip', 'rate_limited_user', 'hashes', 'hashes_queued', 'hashes_rejected'), 0
+        )
+        self.in_flight = 0
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_limit)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.ip_limiter = SlidingWindowLimiter(config.get('LOGIN_IP_LIMIT', 20), config.get('LOGIN_IP_WINDOW', 60))
+        self.user_limiter = SlidingWindowLimiter(config.get('LOGIN_USER_LIMIT', 5), config.get('LOGIN_USER_WINDOW', 300))
+        self.workers = config.get('PASSWORD_HASH_WORKERS', 2)
+        self.queue_limit = config.get('PASSWORD_HASH_QUEUE', 16)
+        self.timeout = config.get('PASSWORD_HASH_TIMEOUT', 5.0)
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_limit)
+        app.extensions['login_guard'] = self
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def check_attempt(self, ip, username):
+        """
+        Record a login attempt and check the limits for it.
+
+        Returns:
+            float: 0 if the attempt may go ahead, otherwise seconds to wait
+        """
+        self._count('attempts')
+        wait = self.user_limiter.retry_after(username.lower())
+        if wait:
+            self._count('rate_limited_user')
+            return wait
+        wait = self.ip_limiter.hit(ip)
+        if wait:
+            self._count('rate_limited_ip')
+        return wait
+
+    def record_failure(self, username):
+        """Count a failed login against the username"""
+        self.user_limiter.record(username.lower())
+
+    def record_success(self, username):
+        """Forget earlier failed logins for the username"""
+        self.user_limiter.reset(username.lower())
+
+    def _get_executor(self):
+        # Threads do not survive a fork, each worker process starts its own pool
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _release(self, future):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def run(self, func, *args):
+        """
+        Run a password hashing function on the pool and wait for its result.
+
+        Raises:
+            PasswordHashBusy: If the queue is full or the result takes longer than PASSWORD_HASH_TIMEOUT
+        """
+        if self.workers == 0:
+            return func(*args)
+
+        if not self._slots.acquire(blocking=False):
+            self._count('hashes_rejected')
+            raise PasswordHashBusy()
+        with self._lock:
+            self.in_flight += 1
+            self.counters['hashes'] += 1
+            if self.in_flight > self.workers:
+                self.counters['hashes_queued'] += 1
+
+        try:
+            future = self._get_executor().submit(func, *args)
+        except Exception:
+            self._release(None)
+            raise
+        # The slot is freed when the hash finishes, even if this request stopped waiting
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            self._count('hashes_rejected')
+            raise PasswordHashBusy()
+
+    def stats(self):
+        """Get login attempt and hashing queue counters"""
+        stats = dict(self.counters)
+        stats.update({
+            'hash_workers': self.workers,
+            'hash_in_flight': self.in_flight,
+            'hash_waiting': max(0, self.in_flight - self.workers),
+            'tracked_ips': len(self.ip_limiter),
+            'tracked_usernames': len(self.user_limiter),
+        })
+        return stats
+
+
+def _guard():
+    return current_app.extensions.get('login_guard') if has_app_context() else None
+
+
+def hash_password(password):
+    """Hash a password, on the login guard's pool when running in the application"""
+    guard = _guard()
+    if guard is None:
+        return generate_password_hash(password)
+    return guard.run(generate_password_hash, password)
+
+
+def verify_password(password_hash, password):
+    """Check a password against its hash, on the login guard's pool when running in the application"""
+    guard = _guard()
+    if guard is None:
+        return check_password_hash(password_hash, password)
+    return guard.run(check_password_hash, password_hash, password)
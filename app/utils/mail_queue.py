@@ -0,0 +1,263 @@
+"""
+Outbound mail queue.
+Requests never talk to the mail server. Messages are written to the
+outbound_emails table in the same transaction as the change that caused them,
+and a background sender thread in each worker process claims due messages in
+batches of MAIL_BATCH_SIZE and sends them over one SMTP connection that stays
+open between batches. Failed sends are retried with exponential backoff until
+MAIL_MAX_ATTEMPTS, permanent rejections are not retried. smtplib and the
+email package are only imported once there is something to send.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+def connection_errors():
+    """Errors that mean the connection is unusable, the message itself may be fine"""
+    import smtplib
+
+    return (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, smtplib.SMTPHeloError,
+            smtplib.SMTPAuthenticationError, smtplib.SMTPNotSupportedError)
+
+
+def build_message(sender, recipient, subject, html_body):
+    """Build a MIME message with an HTML body"""
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    message = MIMEMultipart('alternative')
+    message['Subject'] = subject
+    message['From'] = sender
+    message['To'] = recipient
+    message.attach(MIMEText(html_body, 'html'))
+    return message
+
+
+def is_permanent(error):
+    """Check whether the mail server rejected a message for good (5xx reply)"""
+    import smtplib
+
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+class MailSender:
+    """
+    Background sender for the outbound mail queue.
+
+    Configured with MAIL_BACKEND ('smtp', or 'console' to log messages instead),
+    MAIL_SERVER, MAIL_PORT, MAIL_USE_TLS, MAIL_USERNAME, MAIL_PASSWORD,
+    MAIL_DEFAULT_SENDER, MAIL_TIMEOUT, MAIL_BATCH_SIZE, MAIL_POLL_INTERVAL,
+    MAIL_IDLE_TIMEOUT (seconds an unused connection stays open),
+    MAIL_MAX_ATTEMPTS, MAIL_RETRY_BASE and MAIL_RETRY_MAX (seconds), and
+    MAIL_SENDER_THREAD (0 leaves the queue to `flask mail worker`).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.counters = dict.fromkeys(('sent', 'retried', 'failed', 'batches', 'connections'), 0)
+        self._connection = None
+        self._last_used = 0.0
+        self._wake = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        self._stop = None
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self._stop is not None:
+            # A sender started for another application stops with it
+            self._stop.set()
+            self._wake.set()
+            self._thread = None
+        self.app = app
+        app.extensions['mail_sender'] = self
+        if app.config.get('MAIL_SENDER_THREAD', True):
+            # Retries and lapsed claims left by a restarted worker are sent without waiting for new mail
+            app.before_request(self._ensure_thread)
+
+    @property
+    def config(self):
+        return self.app.config
+
+    def notify(self):
+        """Wake the sender after messages have been committed to the queue"""
+        if self.config.get('MAIL_SENDER_THREAD', True):
+            self._ensure_thread()
+            self._wake.set()
+
+    def _ensure_thread(self):
+        # Threads do not survive a fork, each worker process starts its own sender
+        if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+                self._connection = None
+                self._stop = threading.Event()
+                self._thread = threading.Thread(target=self.run, args=(self._stop,), name='mail-sender', daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def run(self, stop=None):
+        """Send due messages until `stop` is set, waiting for notify() or the poll interval in between"""
+        while stop is None or not stop.is_set():
+            sent = 0
+            try:
+                with self.app.app_context():
+                    sent = self.send_due()
+            except Exception:
+                logger.exception('Mail sender failed')
+            if sent < self.config.get('MAIL_BATCH_SIZE', 50):
+                self._wake.wait(self.config.get('MAIL_POLL_INTERVAL', 5.0))
+                self._wake.clear()
+                self._close_idle()
+
+    def send_due(self):
+        """
+        Claim one batch of due messages and send it.
+
+        Returns:
+            int: Number of messages claimed
+        """
+        from app import db
+        from app.models.email import OutboundEmail
+
+        config = self.config
+        lease = config.get('MAIL_TIMEOUT', 10) * config.get('MAIL_BATCH_SIZE', 50) + 60
+        messages = OutboundEmail.claim_due(config.get('MAIL_BATCH_SIZE', 50), lease)
+        if not messages:
+            return 0
+
+        with self._send_lock:
+            sent_ids = self._send_batch(messages)
+
+        if sent_ids:
+            db.session.execute(
+                db.delete(OutboundEmail).where(OutboundEmail.id.in_(sent_ids)),
+                execution_options={'synchronize_session': False}
+            )
+        db.session.commit()
+        with self._lock:
+            self.counters['batches'] += 1
+            self.counters['sent'] += len(sent_ids)
+        return len(messages)
+
+    def _send_batch(self, messages):
+        """Send claimed messages over the shared connection, rescheduling the ones that fail"""
+        import smtplib
+
+        sent_ids = []
+        for index, message in enumerate(messages):
+            try:
+                self._deliver(message)
+            except OSError as e:
+                # SMTPException is an OSError too, only replies about this message leave the connection usable
+                if isinstance(e, smtplib.SMTPException) and not isinstance(e, connection_errors()):
+                    if is_permanent(e):
+                        self._fail(message, e)
+                    else:
+                        self._schedule_retry(message, e)
+                    continue
+                # The server went away, the rest of the batch waits for the next attempt too
+                self._close()
+                for pending in messages[index:]:
+                    self._schedule_retry(pending, e)
+                break
+            else:
+                sent_ids.append(message.id)
+        return sent_ids
+
+    def _deliver(self, message):
+        config = self.config
+        sender = config.get('MAIL_DEFAULT_SENDER', 'noreply@example.com')
+        if config.get('MAIL_BACKEND', 'console') == 'console':
+            self.app.logger.info('Email to %s: %s\n%s', message.recipient, message.subject, message.html_body)
+            return
+
+        import smtplib
+
+        mime = build_message(sender, message.recipient, message.subject, message.html_body)
+        connection = self._connect()
+        try:
+            connection.send_message(mime)
+        except smtplib.SMTPServerDisconnected:
+            # Idle connections get dropped by the server, reconnect once
+            self._close()
+            self._connect().send_message(mime)
+        self._last_used = time.monotonic()
+
+    def _connect(self):
+        import smtplib
+
+        if self._connection is None:
+            config = self.config
+            connection = smtplib.SMTP(
+                config.get('MAIL_SERVER', 'localhost'), config.get('MAIL_PORT', 25),
+                timeout=config.get('MAIL_TIMEOUT', 10)
+            )
+            try:
+                if config.get('MAIL_USE_TLS'):
+                    connection.starttls()
+                if config.get('MAIL_USERNAME'):
+                    connection.login(config['MAIL_USERNAME'], config.get('MAIL_PASSWORD', ''))
+            except Exception:
+                connection.close()
+                raise
+            self._connection = connection
+            with self._lock:
+                self.counters['connections'] += 1
+        return self._connection
+
+    def _close(self):
+        import smtplib
+
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            try:
+                connection.quit()
+            except (smtplib.SMTPException, OSError):
+                connection.close()
+
+    def _close_idle(self):
+        if self._connection is not None and \
+                time.monotonic() - self._last_used > self.config.get('MAIL_IDLE_TIMEOUT', 30):
+            with self._send_lock:
+                self._close()
+
+    def _schedule_retry(self, message, error):
+        config = self.config
+        message.attempts += 1
+        message.claim = None
+        message.last_error = str(error)[:300]
+        if message.attempts >= config.get('MAIL_MAX_ATTEMPTS', 5):
+            self._fail(message, error)
+            return
+        delay = min(config.get('MAIL_RETRY_MAX', 3600), config.get('MAIL_RETRY_BASE', 30) * 2 ** (message.attempts - 1))
+        # Jitter keeps messages that failed together from retrying together
+        message.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay * random.uniform(1.0, 1.2))
+        with self._lock:
+            self.counters['retried'] += 1
+
+    def _fail(self, message, error):
+        logger.warning('Giving up on email %s to %s: %s', message.id, message.recipient, error)
+        message.status = 'failed'
+        message.claim = None
+        message.last_error = str(error)[:300]
+        with self._lock:
+            self.counters['failed'] += 1
+
+    def stats(self):
+        """Get sender counters"""
+        stats = dict(self.counters)
+        stats['connected'] = self._connection is not None
+        return stats
@@ -0,0 +1,266 @@
+"""
+Request and SQL instrumentation.
+Every request records its latency per endpoint and the number and duration of
+the SQL statements it ran, counted from SQLAlchemy engine events. Template
+rendering and the AI and image helpers are timed as named spans. Everything is
+kept in in-process histograms and served at /metrics in the Prometheus text
+format, one set per worker process. Requests slower than METRICS_SLOW_REQUEST
+seconds are logged with their span and query breakdown. /metrics and the other
+stats endpoints answer only requests carrying the STATS_TOKEN bearer token.
+"""
+import hmac
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import Response, abort, current_app, g, has_request_context, request
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def stats_token_required(view):
+    """
+    Serve an operational stats view only to requests with an
+    'Authorization: Bearer <STATS_TOKEN>' header, as a 404 to everyone else
+    and to everyone while STATS_TOKEN is unset.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config.get('STATS_TOKEN')
+        supplied = request.headers.get('Authorization', '')
+        if not token or not hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+            abort(404)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, as Prometheus expects"""
+
+    def __init__(self, name, help_text, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Counts per bucket, the last one is +Inf, then the sum
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for labels, values in series:
+            label_text = ','.join(f'{name}="{escape_label(value)}"' for name, value in zip(self.label_names, labels))
+            prefix = label_text + ',' if label_text else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {values[-1]:.6f}')
+            lines.append(f'{self.name}_count{{{label_text}}} {cumulative}')
+        return lines
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RequestStats:
+    """Timings collected while one request is handled"""
+    __slots__ = ('start', 'queries', 'query_time', 'statements', 'spans')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        # Statement text -> [count, seconds], for the slow request log
+        self.statements = defaultdict(lambda: [0, 0.0])
+        self.spans = defaultdict(float)
+
+
+request_duration = Histogram(
+    'app_request_duration_seconds', 'Time to handle a request, by endpoint.', ('endpoint', 'method', 'status')
+)
+request_queries = Histogram(
+    'app_request_sql_queries', 'SQL statements run per request, by endpoint.', ('endpoint',),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200)
+)
+sql_duration = Histogram(
+    'app_sql_duration_seconds', 'Time to execute a SQL statement, by statement type.', ('statement',)
+)
+span_duration = Histogram(
+    'app_span_duration_seconds', 'Time spent in named spans such as template rendering and AI helpers.', ('span',)
+)
+
+
+def current_stats():
+    """Get the timings of the current request, or None outside of an instrumented request"""
+    return g.get('_request_stats') if has_request_context() else None
+
+
+def observe_span(name, seconds):
+    """Record time spent in a named span"""
+    span_duration.observe(seconds, name)
+    stats = current_stats()
+    if stats is not None:
+        stats.spans[name] += seconds
+
+
+@contextmanager
+def span(name):
+    """Time a block of code as a named span"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_span(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorator timing every call of a function as a named span"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TimedTemplate(Template):
+    """Jinja template recording each top-level render as a span"""
+
+    def render(self, *args, **kwargs):
+        with span(f'template:{self.name}'):
+            return super().render(*args, **kwargs)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    sql_duration.observe(elapsed, statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER')
+    stats = current_stats()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_time += elapsed
+        entry = stats.statements[' '.join(statement.split())[:200]]
+        entry[0] += 1
+        entry[1] += elapsed
+
+
+def _handle_error(exception_context):
+    # Failed statements never reach after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('query_start'):
+        connection.info['query_start'].pop()
+
+
+class Metrics:
+    """
+    Request latency, SQL and span metrics.
+
+    Configured with METRICS_ENABLED and METRICS_SLOW_REQUEST (seconds, 0 turns
+    the slow request log off). The counters of other extensions that have a
+    stats() method are served at /metrics too.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.slow_request = 1.0
+        self.histograms = [request_duration, request_queries, sql_duration, span_duration]
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.slow_request = app.config.get('METRICS_SLOW_REQUEST', 1.0)
+        app.extensions['metrics'] = self
+        if not app.config.get('METRICS_ENABLED', True):
+            return
+
+        # Listening on the Engine class covers engines created after this point too
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+        app.jinja_env.template_class = TimedTemplate
+        app.before_request(self._start_request)
+        app.after_request(self._end_request)
+        app.add_url_rule('/metrics', 'metrics', stats_token_required(self.metrics_view))
+
+    def _start_request(self):
+        g._request_stats = RequestStats()
+
+    def _end_request(self, response):
+        stats = current_stats()
+        if stats is None:
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        method = request.method
+        if response.is_streamed:
+            # Streamed pages keep querying while their body is sent
+            response.call_on_close(lambda: self._record(stats, endpoint, method, response.status_code))
+        else:
+            self._record(stats, endpoint, method, response.status_code)
+        return response
+
+    def _record(self, stats, endpoint, method, status):
+        elapsed = time.perf_counter() - stats.start
+        request_duration.observe(elapsed, endpoint, method, status)
+        request_queries.observe(stats.queries, endpoint)
+        if self.slow_request and elapsed >= self.slow_request:
+            self.log_slow_request(stats, endpoint, method, elapsed)
+
+    def log_slow_request(self, stats, endpoint, method, elapsed):
+        spans = ', '.join(
+            f'{name} {seconds * 1000:.0f}ms'
+            for name, seconds in sorted(stats.spans.items(), key=lambda item: -item[1])
+        )
+        top = sorted(stats.statements.items(), key=lambda item: -item[1][1])[:5]
+        queries = ''.join(f'\n  {count}x {seconds * 1000:.1f}ms {statement}' for statement, (count, seconds) in top)
+        logger.warning(
+            'Slow request %s %s took %.0fms: %d queries in %.0fms; spans: %s%s',
+            method, endpoint, elapsed * 1000, stats.queries, stats.query_time * 1000, spans or 'none', queries
+        )
+
+    def expose(self):
+        """Render all metrics in the Prometheus text format"""
+        lines = []
+        for histogram in self.histograms:
+            lines.extend(histogram.expose())
+
+        # Counters of the other extensions, e.g. app_image_processor_pending
+        for name, extension in sorted(self.app.extensions.items()):
+            if extension is self or not callable(getattr(extension, 'stats', None)):
+                continue
+            for key, value in sorted(extension.stats().items()):
+                if isinstance(value, (int, float)):
+                    metric = f'app_{name}_{key}'
+                    lines.append(f'# TYPE {metric} gauge')
+                    lines.append(f'{metric} {float(value):g}')
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        return Response(self.expose(), mimetype='text/plain; version=0.0.4')
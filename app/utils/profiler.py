@@ -0,0 +1,221 @@
+"""
+On-demand request profiling.
+A request is profiled when it carries an X-Profile header matching
+PROFILER_TOKEN, or is picked at random with probability PROFILER_SAMPLE_RATE.
+While it runs, one background thread samples the stack of the thread handling
+it every PROFILER_INTERVAL seconds via sys._current_frames(), so the request
+itself runs unmodified. The samples are written in the collapsed-stack format
+flame graph tools read, one file per request, and the oldest files are removed
+beyond PROFILER_MAX_FILES or PROFILER_MAX_BYTES.
+"""
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_SUFFIX = '.folded'
+
+
+class StackSampler:
+    """Background thread sampling the stacks of registered threads"""
+
+    def __init__(self, interval=0.005, max_depth=128):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._targets = {}
+        self._labels = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+
+    def start(self, thread_id):
+        """Start collecting samples of a thread"""
+        samples = Counter()
+        with self._lock:
+            self._targets[thread_id] = samples
+            if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+        self._wake.set()
+        return samples
+
+    def stop(self, thread_id):
+        """Stop sampling a thread and get its samples, collapsed stack -> count"""
+        with self._lock:
+            return self._targets.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            with self._lock:
+                idle = not self._targets
+                if idle:
+                    self._wake.clear()
+            if idle:
+                self._wake.wait()
+                continue
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, samples in self._targets.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[self._collapse(frame)] += 1
+
+    def _collapse(self, frame):
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                module = frame.f_globals.get('__name__', '?')
+                label = self._labels[code] = f'{module}:{code.co_name}'.replace(';', ':')
+            labels.append(label)
+            frame = frame.f_back
+        return ';'.join(reversed(labels))
+
+
+class RequestProfiler:
+    """
+    Opt-in sampling profiler for live requests.
+
+    Configured with PROFILER_TOKEN (value of the X-Profile header that profiles
+    a request, unset turns the header off), PROFILER_SAMPLE_RATE (share of
+    requests profiled at random), PROFILER_ENDPOINTS (endpoints eligible for
+    random sampling, all if empty), PROFILER_DIR, PROFILER_INTERVAL (seconds
+    between samples), PROFILER_MAX_CONCURRENT, PROFILER_MAX_FILES and
+    PROFILER_MAX_BYTES.
+    """
+
+    def __init__(self, app=None):
+        self.sampler = StackSampler()
+        self.directory = None
+        self.token = None
+        self.sample_rate = 0.0
+        self.endpoints = frozenset()
+        self.max_concurrent = 2
+        self.max_files = 50
+        self.max_bytes = 20 * 1024 * 1024
+        self.active = 0
+        self.counters = dict.fromkeys(('profiles', 'samples', 'skipped_busy'), 0)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.directory = config.get('PROFILER_DIR') or os.path.join(app.instance_path, 'profiles')
+        self.token = config.get('PROFILER_TOKEN')
+        self.sample_rate = config.get('PROFILER_SAMPLE_RATE', 0.0)
+        self.endpoints = frozenset(config.get('PROFILER_ENDPOINTS') or ())
+        self.sampler.interval = config.get('PROFILER_INTERVAL', 0.005)
+        self.max_concurrent = config.get('PROFILER_MAX_CONCURRENT', 2)
+        self.max_files = config.get('PROFILER_MAX_FILES', 50)
+        self.max_bytes = config.get('PROFILER_MAX_BYTES', 20 * 1024 * 1024)
+        app.extensions['request_profiler'] = self
+        if self.token or self.sample_rate:
+            app.before_request(self._start_request)
+            app.after_request(self._end_request)
+            app.teardown_request(self._teardown_request)
+
+    def wants_profile(self):
+        """Check whether the current request asked for, or was picked for, profiling"""
+        header = request.headers.get(PROFILE_HEADER)
+        if header is not None:
+            return bool(self.token) and hmac.compare_digest(header.encode(), self.token.encode())
+        if not self.sample_rate or (self.endpoints and request.endpoint not in self.endpoints):
+            return False
+        return random.random() < self.sample_rate
+
+    def _start_request(self):
+        if not self.wants_profile():
+            return
+        with self._lock:
+            if self.active >= self.max_concurrent:
+                self.counters['skipped_busy'] += 1
+                return
+            self.active += 1
+        g._profile = (threading.get_ident(), time.perf_counter())
+        self.sampler.start(threading.get_ident())
+
+    def _end_request(self, response):
+        profile = g.pop('_profile', None)
+        if profile is None:
+            return response
+        name = self.profile_name(request.endpoint)
+        if request.headers.get(PROFILE_HEADER) is not None:
+            response.headers['X-Profile-File'] = name
+        if response.is_streamed:
+            # Keep sampling while the body is generated
+            response.call_on_close(lambda: self._finish(profile, name))
+        else:
+            self._finish(profile, name)
+        return response
+
+    def _teardown_request(self, exc):
+        # after_request does not run when the view raised
+        profile = g.pop('_profile', None)
+        if profile is not None:
+            self._finish(profile, self.profile_name(request.endpoint))
+
+    @staticmethod
+    def profile_name(endpoint):
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        return f'{stamp}-{endpoint or "unmatched"}-{os.getpid()}-{random.randrange(16 ** 4):04x}{PROFILE_SUFFIX}'
+
+    def _finish(self, profile, name):
+        thread_id, start = profile
+        samples = self.sampler.stop(thread_id)
+        with self._lock:
+            self.active -= 1
+            self.counters['profiles'] += 1
+            self.counters['samples'] += sum(samples.values())
+        try:
+            self.write(name, samples, time.perf_counter() - start)
+        except OSError:
+            logger.exception('Could not write profile %s', name)
+
+    def write(self, name, samples, elapsed):
+        """Write collapsed stacks, most frequent first, then enforce the file caps"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            for stack, count in samples.most_common():
+                f.write(f'{stack} {count}\n')
+        os.replace(path + '.tmp', path)
+        logger.info('Wrote profile %s: %.0fms, %d samples', name, elapsed * 1000, sum(samples.values()))
+        self.prune()
+
+    def prune(self):
+        """Remove the oldest profiles beyond PROFILER_MAX_FILES or PROFILER_MAX_BYTES"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(PROFILE_SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort(reverse=True)
+
+        total = 0
+        for index, (_, size, path) in enumerate(entries):
+            total += size
+            if index >= self.max_files or total > self.max_bytes:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def stats(self):
+        """Get profiling counters"""
+        stats = dict(self.counters)
+        stats['active'] = self.active
+        return stats
@@ -0,0 +1,78 @@
+"""
+Streamed HTML responses.
+Large pages are rendered with Jinja's generate() instead of render(), so the
+first bytes leave while later parts of the template are still fetching rows.
+Template output is grouped into chunks of STREAMING_CHUNK_SIZE bytes and, when
+the client accepts it, gzipped on the fly with a sync flush after every chunk
+so compression never holds output back.
+"""
+import zlib
+
+from flask import Response, request, current_app, get_flashed_messages, stream_template
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+
+
+def iter_chunks(parts, chunk_size):
+    """Group small template output strings into encoded chunks of about chunk_size bytes"""
+    buffer = []
+    size = 0
+    for part in parts:
+        data = part.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of chunks into one gzip stream, flushing after every chunk"""
+    # wbits=31 writes the gzip header and trailer instead of a raw zlib stream
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_page(template_name, **context):
+    """
+    Render a template as a streamed response.
+
+    Context values may be lazy (generators, or callables the template calls),
+    they are evaluated while the response is being sent, inside the request context.
+    The session is saved before the body is sent, so the session changes the
+    template would make are made first: flashed messages are taken out of it
+    and signed-in users' forms get their CSRF secret. Both are kept for the
+    rest of the request and the template gets the same values.
+
+    Configured with STREAMING_CHUNK_SIZE (bytes), STREAMING_GZIP and STREAMING_GZIP_LEVEL.
+
+    Args:
+        template_name (str): Template to render
+        context: Template variables
+
+    Returns:
+        Response: Chunked text/html response
+    """
+    get_flashed_messages()
+    if current_user.is_authenticated:
+        generate_csrf()
+
+    config = current_app.config
+    chunks = iter_chunks(stream_template(template_name, **context), config.get('STREAMING_CHUNK_SIZE', 8192))
+
+    compress = config.get('STREAMING_GZIP', True) and request.accept_encodings['gzip']
+    if compress:
+        chunks = gzip_chunks(chunks, config.get('STREAMING_GZIP_LEVEL', 6))
+
+    response = Response(chunks, mimetype='text/html')
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
@@ -0,0 +1,36 @@
+from markupsafe import Markup
+
+EXCERPT_LENGTH = 200
+
+def plain_text(html):
+    """
+    Strip HTML tags and collapse whitespace
+    
+    Args:
+        html: Post content, which may contain HTML
+        
+    Returns:
+        String: Plain text content
+    """
+    return Markup(html or '').striptags()
+
+
+def make_excerpt(text, length=EXCERPT_LENGTH):
+    """
+    Cut plain text to a maximum length on a word boundary
+    
+    Args:
+        text: Plain text to shorten
+        length: Maximum length including the trailing ellipsis
+        
+    Returns:
+        String: The text itself if short enough, otherwise its start followed by '...'
+    """
+    if len(text) <= length:
+        return text
+    return text[:length - 3].rsplit(' ', 1)[0] + '...'
+
+
+def count_words(text):
+    """Count whitespace separated words in plain text"""
+    return len(text.split())
@@ -0,0 +1,171 @@
+"""
+Buffered post view recording.
+Writing a row for every page view would make each read a write. Views are
+instead merged in memory per (user, post) pair and a background thread in
+each worker process writes the buffer every VIEW_FLUSH_INTERVAL seconds, or
+sooner once VIEW_FLUSH_SIZE pairs are waiting, as one upsert per table. The
+buffer never holds more than VIEW_BUFFER_MAX pairs: while the database is
+slow or unavailable, views of pairs that are not buffered yet are dropped and
+counted, and a batch that could not be written is merged back as far as it
+fits. Views are an engagement signal, losing a few under load is acceptable.
+"""
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime
+from functools import wraps
+
+from flask import make_response
+from flask_login import current_user
+
+logger = logging.getLogger(__name__)
+
+
+class ViewRecorder:
+    """
+    In-memory buffer of post views, written to the database in batches.
+
+    Configured with VIEW_FLUSH_INTERVAL, VIEW_FLUSH_SIZE, VIEW_BUFFER_MAX and
+    VIEW_FLUSH_THREAD (0 writes the buffer in the request that fills it to
+    VIEW_FLUSH_SIZE, and at exit).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.counters = dict.fromkeys(('recorded', 'written', 'dropped', 'flushes', 'failures'), 0)
+        # (user_id or None, post_id) -> [views, time of the last view]
+        self._buffer = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        atexit.register(self._flush_at_exit)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self.app is not None and self.app is not app:
+            # Views buffered for another application belong in its database, not the new one's
+            self.flush()
+            with self._lock:
+                self._buffer = {}
+        self.app = app
+        app.extensions['view_recorder'] = self
+
+    @property
+    def config(self):
+        return self.app.config
+
+    def record(self, post_id, user_id=None):
+        """Count a view of a post, by a signed-in user or anonymously"""
+        key = (user_id, post_id)
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._buffer.get(key)
+            if entry is not None:
+                entry[0] += 1
+                entry[1] = now
+            elif len(self._buffer) >= self.config.get('VIEW_BUFFER_MAX', 20000):
+                self.counters['dropped'] += 1
+                return
+            else:
+                self._buffer[key] = [1, now]
+            self.counters['recorded'] += 1
+            full = len(self._buffer) >= self.config.get('VIEW_FLUSH_SIZE', 500)
+
+        if self.config.get('VIEW_FLUSH_THREAD', True):
+            self._ensure_thread()
+            if full:
+                self._wake.set()
+        elif full:
+            self.flush()
+
+    def counted(self, view):
+        """Record a view of the post_id view argument when the page is served, including 304 answers"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            response = make_response(view(*args, **kwargs))
+            if response.status_code in (200, 304):
+                user_id = current_user.id if current_user.is_authenticated else None
+                self.record(kwargs['post_id'], user_id)
+            return response
+        return wrapper
+
+    def _ensure_thread(self):
+        # Threads do not survive a fork, each worker process starts its own writer
+        if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+                if self._thread_pid not in (None, os.getpid()):
+                    # Views buffered by the parent are the parent's to write
+                    self._buffer = {}
+                self._thread = threading.Thread(target=self.run, name='view-recorder', daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def run(self, stop=None):
+        """Write the buffer until `stop` is set, every flush interval or when it fills up"""
+        while stop is None or not stop.is_set():
+            self._wake.wait(self.config.get('VIEW_FLUSH_INTERVAL', 5.0))
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered views.
+
+        Returns:
+            int: Number of (user, post) pairs written
+        """
+        from app import db
+        from app.models.view import PostView
+        from app.models.trending import TrendingScore
+
+        with self._flush_lock:
+            with self._lock:
+                events, self._buffer = self._buffer, {}
+            if not events:
+                return 0
+
+            try:
+                with self.app.app_context():
+                    written = PostView.merge(events)
+                    TrendingScore.record_views(written)
+                    db.session.commit()
+            except Exception:
+                logger.exception('Could not write %d buffered views', len(events))
+                self._requeue(events)
+                return 0
+
+            with self._lock:
+                self.counters['flushes'] += 1
+                self.counters['written'] += sum(count for count, _ in events.values())
+            return len(events)
+
+    def _requeue(self, events):
+        """Merge a batch that failed back into the buffer, dropping what does not fit"""
+        limit = self.config.get('VIEW_BUFFER_MAX', 20000)
+        with self._lock:
+            self.counters['failures'] += 1
+            for key, (count, last_viewed_at) in events.items():
+                entry = self._buffer.get(key)
+                if entry is not None:
+                    entry[0] += count
+                    entry[1] = max(entry[1], last_viewed_at)
+                elif len(self._buffer) < limit:
+                    self._buffer[key] = [count, last_viewed_at]
+                else:
+                    self.counters['dropped'] += count
+
+    def _flush_at_exit(self):
+        if self.app is not None and self._buffer and self._thread_pid in (None, os.getpid()):
+            self.flush()
+
+    def stats(self):
+        """Get recorder counters"""
+        stats = dict(self.counters)
+        stats['buffered'] = len(self._buffer)
+        return stats
@@ -0,0 +1,131 @@
+"""
+Start-up warm-up and readiness.
+Loading scikit-learn, the recommendation model and TextBlob's lexicon and
+compiling every template takes seconds, which without a warm-up the first
+requests of each worker pay for. The WSGI entry point runs the warm-up once
+after creating the application; with the server preloading the application,
+that happens in the master process and the workers share the loaded memory
+copy-on-write. /readyz answers 503 until the warm-up has finished.
+Creating the application itself imports none of these libraries, and compiled
+templates are kept in a bytecode cache so restarts skip compiling them.
+"""
+import logging
+import os
+import time
+
+from flask import jsonify
+from jinja2 import FileSystemBytecodeCache
+
+logger = logging.getLogger(__name__)
+
+
+class TemplateBytecodeCache(FileSystemBytecodeCache):
+    """Jinja bytecode cache in a folder, a failed write only means compiling again next time"""
+
+    def dump_bytecode(self, bucket):
+        try:
+            super().dump_bytecode(bucket)
+        except OSError:
+            logger.warning('Could not write the template bytecode cache in %s', self.directory)
+
+
+def compile_templates(app):
+    """Compile every template into the Jinja cache"""
+    names = [name for name in app.jinja_env.list_templates() if name.endswith('.html')]
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def load_model(app):
+    """Import scikit-learn and load the stored recommendation model"""
+    import sklearn.feature_extraction.text  # noqa: F401
+    import sklearn.metrics.pairwise  # noqa: F401
+    from app.utils.ai.recommendation import load_recommendation_model
+
+    vectorizer, _, post_ids = load_recommendation_model()
+    return len(post_ids) if vectorizer is not None else 0
+
+
+def prime_sentiment(app):
+    """Import TextBlob and load its sentiment lexicon"""
+    from app.utils.ai.sentiment_analysis import analyze_sentiment
+
+    return analyze_sentiment('A quick warm up sentence that is rather good.')['sentiment']
+
+
+def load_image_plugins(app):
+    """Import Pillow and its image format plugins"""
+    from PIL import Image
+
+    Image.init()
+    return len(Image.OPEN)
+
+
+class WarmUp:
+    """
+    Warm-up steps and the readiness endpoint.
+
+    Steps run in order, a failing step is logged and does not stop the others
+    or readiness, the work it would have done then happens on first use.
+    WARMUP_STEPS names the steps to run. With JINJA_BYTECODE_CACHE set,
+    compiled templates are stored in JINJA_BYTECODE_CACHE_DIR.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.ready = False
+        self.steps = {}
+        self.duration = None
+        self.step_functions = [
+            ('templates', compile_templates),
+            ('recommendation_model', load_model),
+            ('sentiment', prime_sentiment),
+            ('images', load_image_plugins),
+        ]
+        self.enabled_steps = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        # A new application has not been warmed up yet
+        self.ready = False
+        self.steps = {}
+        self.duration = None
+        self.enabled_steps = frozenset(app.config.get('WARMUP_STEPS') or ())
+        if app.config.get('JINJA_BYTECODE_CACHE'):
+            directory = app.config.get('JINJA_BYTECODE_CACHE_DIR') or os.path.join(app.instance_path, 'jinja_cache')
+            os.makedirs(directory, exist_ok=True)
+            app.jinja_env.bytecode_cache = TemplateBytecodeCache(directory)
+        app.extensions['warmup'] = self
+        app.add_url_rule('/readyz', 'readyz', self.readiness_view)
+
+    def run(self):
+        """Run every warm-up step, then report ready"""
+        start = time.perf_counter()
+        with self.app.app_context():
+            for name, step in self.step_functions:
+                if name not in self.enabled_steps:
+                    continue
+                step_start = time.perf_counter()
+                try:
+                    result = step(self.app)
+                    error = None
+                except Exception as e:
+                    logger.exception('Warm-up step %s failed', name)
+                    result, error = None, str(e)
+                self.steps[name] = {
+                    'seconds': round(time.perf_counter() - step_start, 3), 'result': result, 'error': error
+                }
+        self.duration = round(time.perf_counter() - start, 3)
+        self.ready = True
+        logger.info('Warm-up finished in %.2fs', self.duration)
+
+    def readiness_view(self):
+        body = {'ready': self.ready, 'warmup_seconds': self.duration, 'steps': self.steps}
+        return jsonify(body), 200 if self.ready else 503
+
+    def stats(self):
+        """Get readiness for /metrics"""
+        return {'ready': self.ready, 'warmup_seconds': self.duration or 0}
@@ -0,0 +1,5 @@
+"""
+Performance benchmarks.
+corpus generates seeded synthetic databases of 1k, 10k and 100k posts and run
+times the hot paths against them, see `python -m benchmarks.run --help`.
+"""
@@ -0,0 +1,235 @@
+"""
+Synthetic corpus generator.
+Builds a database of users, tagged posts and comments of a given size from a
+fixed seed, so every run benchmarks the same data. Posts are written around a
+set of topics, each with its own vocabulary and tags, which gives the
+recommendation model real similarities to find. Rows are bulk inserted in
+batches, the derived counters are rebuilt once at the end.
+"""
+import os
+import random
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+SIZES = {'1k': 1_000, '10k': 10_000, '100k': 100_000}
+
+SYLLABLES = ('ka', 'lo', 'mi', 'ra', 'ten', 'vo', 'shi', 'pra', 'del', 'nu', 'gor', 'fie',
+             'zan', 'tre', 'qua', 'bel', 'sto', 'mar', 'in', 'ux', 'pel', 'dro', 'vin', 'cas')
+COMMON_WORDS = ('the', 'a', 'and', 'of', 'to', 'in', 'is', 'for', 'with', 'on', 'that', 'this',
+                'it', 'as', 'are', 'be', 'from', 'by', 'about', 'how', 'when', 'why', 'what')
+POSITIVE_WORDS = ('good', 'great', 'excellent', 'helpful', 'love', 'clear', 'amazing', 'nice', 'useful')
+NEGATIVE_WORDS = ('bad', 'terrible', 'wrong', 'boring', 'awful', 'confusing', 'poor', 'useless', 'hate')
+NEUTRAL_WORDS = ('post', 'article', 'point', 'section', 'example', 'idea', 'question', 'part', 'read')
+
+PASSWORD = 'password123'
+TOPICS = 24
+WORDS_PER_TOPIC = 40
+TAGS_PER_TOPIC = 6
+
+
+def make_words(rng, count):
+    """Make unique pronounceable words from the syllable table"""
+    words = set()
+    while len(words) < count:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))))
+    return sorted(words)
+
+
+class Corpus:
+    """Vocabulary and row generators for one seed"""
+
+    def __init__(self, seed=42):
+        self.rng = random.Random(seed)
+        words = make_words(self.rng, TOPICS * WORDS_PER_TOPIC + 400)
+        self.generic = words[TOPICS * WORDS_PER_TOPIC:]
+        self.topics = [words[i * WORDS_PER_TOPIC:(i + 1) * WORDS_PER_TOPIC] for i in range(TOPICS)]
+        self.topic_tags = [
+            [f'{topic[0]}-{n}' for n in range(TAGS_PER_TOPIC)] for topic in self.topics
+        ]
+        self.now = datetime(2024, 1, 1)
+
+    def sentence(self, topic, length):
+        rng = self.rng
+        vocabulary = self.topics[topic]
+        words = [
+            rng.choice(vocabulary) if rng.random() < 0.5
+            else rng.choice(COMMON_WORDS) if rng.random() < 0.5
+            else rng.choice(self.generic)
+            for _ in range(length)
+        ]
+        return ' '.join(words).capitalize() + '.'
+
+    def post(self, topic):
+        """Get (title, html content, tag names) of a post about a topic"""
+        rng = self.rng
+        title = ' '.join(rng.choice(self.topics[topic]) for _ in range(rng.randint(3, 7))).capitalize()
+        paragraphs = [
+            ' '.join(self.sentence(topic, rng.randint(8, 18)) for _ in range(rng.randint(2, 5)))
+            for _ in range(rng.randint(2, 4))
+        ]
+        content = ''.join(f'<p>{paragraph}</p>' for paragraph in paragraphs)
+        tags = rng.sample(self.topic_tags[topic], rng.randint(1, 3))
+        if rng.random() < 0.3:
+            tags.append(rng.choice(self.topic_tags[rng.randrange(TOPICS)]))
+        return title, content, list(dict.fromkeys(tags))
+
+    def comment(self):
+        """Get (content, sentiment, polarity) of a comment"""
+        rng = self.rng
+        roll = rng.random()
+        if roll < 0.5:
+            mood, polarity, pool = 'positive', rng.uniform(0.2, 1.0), POSITIVE_WORDS
+        elif roll < 0.75:
+            mood, polarity, pool = 'negative', rng.uniform(-1.0, -0.2), NEGATIVE_WORDS
+        else:
+            mood, polarity, pool = 'neutral', rng.uniform(-0.1, 0.1), NEUTRAL_WORDS
+        words = [rng.choice(pool) if rng.random() < 0.3 else rng.choice(COMMON_WORDS + NEUTRAL_WORDS)
+                 for _ in range(rng.randint(6, 30))]
+        return ' '.join(words).capitalize() + '.', mood, polarity
+
+    def search_terms(self, count):
+        """Get words that occur in post titles, for search queries"""
+        return [self.rng.choice(self.rng.choice(self.topics)) for _ in range(count)]
+
+
+def iter_batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(posts, seed=42, comments_per_post=3, batch_size=2000, echo=print):
+    """
+    Fill the current application's empty database with a synthetic corpus.
+
+    Args:
+        posts (int): Number of posts
+        seed (int): Random seed, the same seed gives the same corpus
+        comments_per_post (int): Average number of comments per post
+        batch_size (int): Rows inserted per statement
+        echo: Progress callback
+
+    Returns:
+        dict: Number of rows written per table
+    """
+    from app import db
+    from app.cli import rebuild_aggregates
+    from app.models.post import Post, Comment, Tag, post_tags
+    from app.models.user import User
+    from app.utils.text_utils import plain_text, make_excerpt, count_words
+
+    corpus = Corpus(seed)
+    rng = corpus.rng
+    user_count = max(10, posts // 20)
+    # Every user gets the same password, hashing it once keeps generation fast
+    password_hash = generate_password_hash(PASSWORD)
+
+    db.session.execute(User.__table__.insert(), [
+        {'username': f'user{i:06d}', 'email': f'user{i:06d}@example.com', 'password_hash': password_hash,
+         'first_name': 'User', 'last_name': str(i), 'profile_image': 'default_profile.jpg',
+         'created_at': corpus.now, 'last_seen': corpus.now, 'is_active': True}
+        for i in range(1, user_count + 1)
+    ])
+    tag_names = [name for tags in corpus.topic_tags for name in tags]
+    db.session.execute(Tag.__table__.insert(), [{'name': name} for name in tag_names])
+    db.session.commit()
+    tag_ids = dict(db.session.query(Tag.name, Tag.id))
+    echo(f'Inserted {user_count} users and {len(tag_names)} tags')
+
+    def post_rows():
+        for post_id in range(1, posts + 1):
+            title, content, tags = corpus.post(rng.randrange(TOPICS))
+            text = plain_text(content)
+            created_at = corpus.now - timedelta(minutes=(posts - post_id) * 5)
+            yield ({
+                'id': post_id, 'title': title[:120], 'content': content, 'excerpt': make_excerpt(text),
+                'word_count': count_words(text), 'created_at': created_at, 'updated_at': created_at,
+                'published': rng.random() < 0.95, 'comment_count': 0, 'user_id': rng.randint(1, user_count)
+            }, [{'post_id': post_id, 'tag_id': tag_ids[name]} for name in tags])
+
+    for batch in iter_batches(post_rows(), batch_size):
+        db.session.execute(Post.__table__.insert(), [row for row, _ in batch])
+        db.session.execute(post_tags.insert(), [link for _, links in batch for link in links])
+        db.session.commit()
+        echo(f'Inserted {batch[-1][0]["id"]} posts')
+
+    def comment_rows():
+        for post_id in range(1, posts + 1):
+            for _ in range(rng.randint(0, comments_per_post * 2)):
+                content, sentiment, polarity = corpus.comment()
+                yield {
+                    'content': content, 'sentiment': sentiment, 'sentiment_polarity': polarity,
+                    'sentiment_subjectivity': rng.random(), 'post_id': post_id,
+                    'user_id': rng.randint(1, user_count),
+                    'created_at': corpus.now - timedelta(minutes=(posts - post_id) * 5 - rng.randint(1, 600))
+                }
+
+    comment_count = 0
+    for batch in iter_batches(comment_rows(), batch_size):
+        db.session.execute(Comment.__table__.insert(), batch)
+        db.session.commit()
+        comment_count += len(batch)
+    echo(f'Inserted {comment_count} comments')
+
+    rebuild_aggregates()
+    return {'users': user_count, 'tags': len(tag_names), 'posts': posts, 'comments': comment_count}
+
+
+def corpus_path(directory, size, seed=42):
+    """Get the path of the cached corpus database for a size and seed"""
+    return os.path.abspath(os.path.join(directory, f'corpus-{size}-{seed}.db'))
+
+
+def ensure_corpus(directory, size, seed=42, echo=print):
+    """
+    Get the path of a corpus database, generating it on first use.
+
+    Args:
+        directory: Directory corpus databases are cached in
+        size: Key of SIZES, e.g. '10k'
+        seed: Random seed
+
+    Returns:
+        str: Path of the SQLite database
+    """
+    from app import create_app, db
+
+    path = corpus_path(directory, size, seed)
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(directory, exist_ok=True)
+    partial = path + '.partial'
+    if os.path.exists(partial):
+        os.remove(partial)
+    echo(f'Generating the {size} corpus in {path}')
+    app = create_app(benchmark_config(partial, directory))
+    with app.app_context():
+        db.create_all()
+        generate(SIZES[size], seed=seed, echo=echo)
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+        db.engine.dispose()
+    os.replace(partial, path)
+    return path
+
+
+def benchmark_config(database_path, work_dir):
+    """Application config for running against a corpus database without side effects"""
+    return {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database_path}',
+        'UPLOAD_FOLDER': os.path.join(work_dir, 'uploads'),
+        'INVALIDATION_BUS_PATH': os.path.join(work_dir, 'invalidation.db'),
+        'WTF_CSRF_ENABLED': False,
+        'MAIL_SENDER_THREAD': False,
+        'VIEW_FLUSH_THREAD': False,
+        # Every request does its full work, and uploads are processed in the timed call
+        'FRAGMENT_CACHE_TYPE': 'null',
+        'IMAGE_WORKERS': 0,
+    }
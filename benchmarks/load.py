@@ -0,0 +1,404 @@
+"""
+End-to-end load generator.
+Drives a running server with a weighted mix of scenarios at a target arrival
+rate. Arrivals are scheduled open-loop, so a slow server builds up a backlog
+rather than quietly lowering the load, and each request's latency counts from
+its scheduled start. Signed-in scenarios use seeded users with their own
+cookies and CSRF tokens, read from the WTForms pages like a browser would.
+
+    python -m benchmarks.load seed --size 10k --database instance/load.db
+    DATABASE_URI=sqlite:///load.db LOGIN_IP_LIMIT=100000 flask run --port 5000
+    python -m benchmarks.load run --url http://127.0.0.1:5000 --rate 50 --duration 60
+
+The server's login rate limits apply to the generator's single address, raise
+LOGIN_IP_LIMIT when seeding sign-ins faster than it allows.
+"""
+import http.client
+import io
+import json
+import os
+import queue
+import random
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+import click
+
+from benchmarks.corpus import PASSWORD, SIZES, Corpus, ensure_corpus
+from benchmarks.run import DEFAULT_CORPUS_DIR, percentile
+
+CSRF_PATTERN = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+LOCKED_MESSAGE = b'database is locked'
+DEFAULT_MIX = 'browse=50,search=15,read_comments=10,login=5,comment=15,upload=5'
+
+
+class HttpSession:
+    """One keep-alive connection with its own cookies, like a browser tab"""
+
+    def __init__(self, base_url, timeout=30):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.timeout = timeout
+        self.cookies = {}
+        self.csrf_token = None
+        self.connection = None
+
+    def request(self, method, path, body=None, headers=None):
+        """
+        Send a request without following redirects.
+
+        Returns:
+            tuple: (status, body bytes)
+        """
+        headers = dict(headers or {})
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = self.connection_class(self.host, self.port, timeout=self.timeout)
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                break
+            except Exception as e:
+                # A failed request leaves the connection in an unknown state, the next one opens a new connection
+                self.connection.close()
+                self.connection = None
+                # The server closed the idle keep-alive connection, retry once on a new one
+                disconnected = isinstance(e, (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError))
+                if attempt or not disconnected:
+                    raise
+        for header in response.headers.get_all('Set-Cookie') or ():
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        if response.getheader('Connection', '').lower() == 'close':
+            self.connection.close()
+            self.connection = None
+        return response.status, data
+
+    def get(self, path):
+        return self.request('GET', path)
+
+    def post_form(self, path, fields):
+        return self.request('POST', path, urlencode(fields), {'Content-Type': 'application/x-www-form-urlencoded'})
+
+    def post_multipart(self, path, fields, files):
+        boundary = uuid.uuid4().hex
+        body = io.BytesIO()
+        for name, value in fields.items():
+            body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+        for name, (filename, content, content_type) in files.items():
+            body.write(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                f'Content-Type: {content_type}\r\n\r\n'.encode()
+            )
+            body.write(content)
+            body.write(b'\r\n')
+        body.write(f'--{boundary}--\r\n'.encode())
+        return self.request('POST', path, body.getvalue(), {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+
+    def fetch_csrf_token(self, path):
+        status, data = self.get(path)
+        match = CSRF_PATTERN.search(data.decode('utf-8', 'replace'))
+        if match:
+            self.csrf_token = match.group(1)
+        return status, data
+
+
+class Recorder:
+    """Latency and status samples per endpoint, shared by all workers"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+        self.locked = 0
+        self.late = 0
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, status, body=b'', expected=(200, 302)):
+        with self._lock:
+            self.samples[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+            if status not in expected:
+                self.errors[endpoint] += 1
+            if LOCKED_MESSAGE in body:
+                self.locked += 1
+
+    def mark_late(self):
+        with self._lock:
+            self.late += 1
+
+    def record_failure(self, endpoint, seconds, error):
+        with self._lock:
+            self.samples[endpoint].append(seconds)
+            self.statuses[endpoint][type(error).__name__] += 1
+            self.errors[endpoint] += 1
+
+    def report(self, elapsed):
+        endpoints = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            endpoints[endpoint] = {
+                'requests': len(samples),
+                'errors': self.errors[endpoint],
+                'error_rate': self.errors[endpoint] / len(samples),
+                'p50_ms': percentile(samples, 0.50) * 1000,
+                'p90_ms': percentile(samples, 0.90) * 1000,
+                'p99_ms': percentile(samples, 0.99) * 1000,
+                'max_ms': samples[-1] * 1000,
+                'statuses': {str(status): count for status, count in self.statuses[endpoint].items()},
+            }
+        total = sum(len(samples) for samples in self.samples.values())
+        return {
+            'elapsed_s': elapsed,
+            'requests': total,
+            'throughput': total / elapsed if elapsed else 0.0,
+            'errors': sum(self.errors.values()),
+            'database_locked': self.locked,
+            'late_starts': self.late,
+            'endpoints': endpoints,
+        }
+
+
+class Scenarios:
+    """User journeys, each a short sequence of requests"""
+
+    def __init__(self, base_url, recorder, post_ids, tag_names, usernames, seed):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.post_ids = post_ids
+        self.tag_names = tag_names
+        self.usernames = usernames
+        self.corpus = Corpus(seed)
+        self.terms = self.corpus.search_terms(200)
+        self._signed_in = queue.SimpleQueue()
+        self._rng_lock = threading.Lock()
+
+    def choice(self, values):
+        with self._rng_lock:
+            return self.corpus.rng.choice(values)
+
+    def timed(self, endpoint, started, call, expected=(200, 302)):
+        """Run one request and record it, latency counts from `started`"""
+        try:
+            status, body = call()
+        except (OSError, http.client.HTTPException) as e:
+            self.recorder.record_failure(endpoint, time.perf_counter() - started, e)
+            return None, b''
+        self.recorder.record(endpoint, time.perf_counter() - started, status, body, expected)
+        return status, body
+
+    def new_session(self):
+        return HttpSession(self.base_url)
+
+    def sign_in(self, started):
+        """Sign a seeded user in on a new session"""
+        session = self.new_session()
+        self.timed('GET /login', started, lambda: session.fetch_csrf_token('/login'))
+        username = self.choice(self.usernames)
+        status, _ = self.timed('POST /login', time.perf_counter(), lambda: session.post_form('/login', {
+            'csrf_token': session.csrf_token or '', 'username': username, 'password': PASSWORD
+        }), expected=(302,))
+        return session if status == 302 else None
+
+    def signed_in_session(self, started):
+        """Reuse a signed-in session, or sign a new user in"""
+        try:
+            return self._signed_in.get_nowait()
+        except queue.Empty:
+            return self.sign_in(started)
+
+    def release(self, session):
+        if session is not None:
+            self._signed_in.put(session)
+
+    def browse(self, started):
+        session = self.new_session()
+        self.timed('GET /', started, lambda: session.get('/'))
+        post_id = self.choice(self.post_ids)
+        self.timed('GET /post/<id>', time.perf_counter(), lambda: session.get(f'/post/{post_id}'))
+        if self.tag_names:
+            tag = self.choice(self.tag_names)
+            self.timed('GET /tag/<name>', time.perf_counter(), lambda: session.get(f'/tag/{tag}'))
+
+    def search(self, started):
+        session = self.new_session()
+        term = self.choice(self.terms)
+        self.timed('GET /search', started, lambda: session.get(f'/search?{urlencode({"query": term})}'))
+
+    def read_comments(self, started):
+        session = self.new_session()
+        post_id = self.choice(self.post_ids)
+        self.timed('GET /post/<id>/comments', started, lambda: session.get(f'/post/{post_id}/comments'))
+
+    def login(self, started):
+        self.release(self.sign_in(started))
+
+    def comment(self, started):
+        session = self.signed_in_session(started)
+        if session is None:
+            return
+        post_id = self.choice(self.post_ids)
+        content, _, _ = self.corpus.comment()
+        status, _ = self.timed('POST /post/<id>/comment', time.perf_counter(), lambda: session.post_form(
+            f'/post/{post_id}/comment', {'csrf_token': session.csrf_token or '', 'content': content}
+        ), expected=(302,))
+        # Sessions whose request failed are dropped, the next journey signs a new user in
+        if status is not None:
+            self.release(session)
+
+    def upload(self, started):
+        from PIL import Image
+
+        session = self.signed_in_session(started)
+        if session is None:
+            return
+        status, _ = self.timed('GET /post/new', time.perf_counter(), lambda: session.fetch_csrf_token('/post/new'))
+        if status is None:
+            return
+        with self._rng_lock:
+            title, content, tags = self.corpus.post(self.corpus.rng.randrange(len(self.corpus.topics)))
+            noise = self.corpus.rng.randint(10, 100)
+        image = io.BytesIO()
+        Image.effect_noise((800, 600), noise).convert('RGB').save(image, 'JPEG', quality=85)
+        status, _ = self.timed('POST /post/new', time.perf_counter(), lambda: session.post_multipart('/post/new', {
+            'csrf_token': session.csrf_token or '', 'title': title[:100], 'content': content,
+            'tags': ', '.join(tags), 'published': 'y'
+        }, {'image': ('upload.jpg', image.getvalue(), 'image/jpeg')}), expected=(302,))
+        if status is not None:
+            self.release(session)
+
+
+def parse_mix(text):
+    """Parse 'browse=50,search=10' into scenario weights"""
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip():
+            mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def read_targets(database):
+    """Get published post ids, tag names and usernames from the seeded database"""
+    with sqlite3.connect(f'file:{database}?mode=ro', uri=True) as conn:
+        post_ids = [row[0] for row in conn.execute('SELECT id FROM posts WHERE published = 1')]
+        tag_names = [row[0] for row in conn.execute('SELECT name FROM tags')]
+        usernames = [row[0] for row in conn.execute("SELECT username FROM users WHERE username LIKE 'user%'")]
+    return post_ids, tag_names, usernames
+
+
+@click.group()
+def cli():
+    """Seed a database and drive a running server with a traffic mix."""
+
+
+@cli.command()
+@click.option('--size', default='1k', type=click.Choice(list(SIZES)), show_default=True)
+@click.option('--database', default=os.path.join('instance', 'load.db'), show_default=True,
+              help='Database file the server under test will use.')
+@click.option('--seed', default=42, show_default=True)
+@click.option('--corpus-dir', default=DEFAULT_CORPUS_DIR, show_default=True)
+def seed(size, database, seed, corpus_dir):
+    """Write a fresh copy of a synthetic corpus to DATABASE."""
+    shutil.copyfile(ensure_corpus(corpus_dir, size, seed, echo=click.echo), database)
+    click.echo(f'Seeded {database}, users sign in with password {PASSWORD!r}')
+
+
+@cli.command()
+@click.option('--url', default='http://127.0.0.1:5000', show_default=True)
+@click.option('--database', default=os.path.join('instance', 'load.db'), show_default=True,
+              help='Seeded database, read for post ids, tags and usernames.')
+@click.option('--rate', default=20.0, show_default=True, help='Scenario starts per second.')
+@click.option('--duration', default=30.0, show_default=True, help='Seconds to generate load for.')
+@click.option('--concurrency', default=32, show_default=True, help='Worker threads running scenarios.')
+@click.option('--mix', default=DEFAULT_MIX, show_default=True, help='Scenario weights.')
+@click.option('--seed', default=42, show_default=True)
+@click.option('--server-log', type=click.Path(dir_okay=False), help='Server log to count "database is locked" errors in.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Also write the report to this JSON file.')
+def run(url, database, rate, duration, concurrency, mix, seed, server_log, output):
+    """Drive the server at URL with the scenario mix."""
+    post_ids, tag_names, usernames = read_targets(database)
+    recorder = Recorder()
+    scenarios = Scenarios(url, recorder, post_ids, tag_names, usernames, seed)
+    weights = parse_mix(mix)
+    unknown = [name for name in weights if name.startswith('_') or not callable(getattr(Scenarios, name, None))]
+    if unknown:
+        raise click.BadParameter(f'unknown scenarios: {", ".join(unknown)}', param_hint='--mix')
+
+    arrivals = queue.Queue()
+    stop = object()
+
+    def worker():
+        while True:
+            item = arrivals.get()
+            if item is stop:
+                return
+            name, scheduled = item
+            if time.perf_counter() - scheduled > 1.0:
+                recorder.mark_late()
+            getattr(scenarios, name)(scheduled)
+
+    # Error pages rarely show the exception, the server log does
+    log_offset = os.path.getsize(server_log) if server_log and os.path.exists(server_log) else 0
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+
+    # Poisson arrivals at the target rate, scheduled ahead of time so a backlog shows in the latencies
+    rng = random.Random(seed)
+    names, cumulative = list(weights), list(weights.values())
+    click.echo(f'Running {mix} at {rate}/s for {duration}s against {url}')
+    start = time.perf_counter()
+    next_at = start
+    while next_at - start < duration:
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        arrivals.put((rng.choices(names, cumulative)[0], next_at))
+        next_at += rng.expovariate(rate)
+
+    for _ in threads:
+        arrivals.put(stop)
+    for thread in threads:
+        thread.join()
+    report = recorder.report(time.perf_counter() - start)
+    if server_log and os.path.exists(server_log):
+        with open(server_log, 'rb') as f:
+            f.seek(log_offset)
+            report['database_locked'] += f.read().count(LOCKED_MESSAGE)
+
+    click.echo(f'\n{"endpoint":<28}{"requests":>9}{"errors":>8}{"p50 ms":>9}{"p90 ms":>9}{"p99 ms":>9}{"max ms":>9}')
+    for endpoint, stats in report['endpoints'].items():
+        click.echo(
+            f'{endpoint:<28}{stats["requests"]:>9}{stats["errors"]:>8}{stats["p50_ms"]:>9.1f}'
+            f'{stats["p90_ms"]:>9.1f}{stats["p99_ms"]:>9.1f}{stats["max_ms"]:>9.1f}'
+        )
+    click.echo(
+        f'\n{report["requests"]} requests in {report["elapsed_s"]:.1f}s ({report["throughput"]:.1f}/s), '
+        f'{report["errors"]} errors, {report["database_locked"]} "database is locked", '
+        f'{report["late_starts"]} scenarios started over 1s late'
+    )
+    for endpoint, stats in report['endpoints'].items():
+        odd = {status: count for status, count in stats['statuses'].items() if status not in ('200', '302')}
+        if odd:
+            click.echo(f'  {endpoint}: {odd}')
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,300 @@
+"""
+Microbenchmarks for the AI, ORM and rendering hot paths.
+Each benchmark is timed over a number of iterations after a warm-up, then run
+a few more times under tracemalloc for its peak memory, so tracing never
+distorts the timings. Results can be saved as a baseline and later runs are
+compared against it.
+
+    python -m benchmarks.run --size 1k --size 10k
+    python -m benchmarks.run --size 10k --save-baseline
+    python -m benchmarks.run --size 10k --fail-on-regression
+"""
+import io
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from itertools import count
+
+import click
+
+from benchmarks.corpus import SIZES, Corpus, benchmark_config, ensure_corpus
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+DEFAULT_CORPUS_DIR = os.path.join('instance', 'benchmarks')
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def measure(func, iterations, warmup=2, memory_runs=3):
+    """
+    Time a function and measure its peak memory.
+
+    Returns:
+        dict: p50_ms, p99_ms, mean_ms, throughput (calls per second) and peak_mb
+    """
+    for _ in range(warmup):
+        func()
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        for _ in range(min(memory_runs, iterations)):
+            func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    total = sum(timings)
+    return {
+        'iterations': iterations,
+        'p50_ms': percentile(timings, 0.50) * 1000,
+        'p99_ms': percentile(timings, 0.99) * 1000,
+        'mean_ms': total / iterations * 1000,
+        'throughput': iterations / total if total else 0.0,
+        'peak_mb': peak / (1024 * 1024),
+    }
+
+
+class Benchmarks:
+    """The benchmarked operations, set up against one corpus"""
+
+    def __init__(self, app, work_dir, seed=42):
+        self.app = app
+        self.work_dir = work_dir
+        self.rng = random.Random(seed)
+        self.terms = Corpus(seed).search_terms(50)
+        self.client = app.test_client()
+
+        from app import db
+        from app.models.post import Comment, Post
+
+        with app.app_context():
+            self.post_ids = [post_id for (post_id,) in db.session.query(Post.id).filter(Post.published == True)]
+            self.commenter_ids = [user_id for (user_id,) in db.session.query(Comment.user_id).distinct().limit(500)]
+            self.comment_texts = [text for (text,) in db.session.query(Comment.content).limit(500)]
+
+    def registry(self):
+        """Benchmark name -> (setup returning the function to time, default iterations)"""
+        return {
+            'ai.build_model': (self.build_model, 3),
+            'ai.similar_posts': (self.similar_posts, 50),
+            'ai.user_recommendations': (self.user_recommendations, 50),
+            'ai.sentiment': (self.sentiment, 200),
+            'image.save_picture': (self.save_picture, 20),
+            'page.home': (lambda: self.page(lambda: '/'), 50),
+            'page.post': (lambda: self.page(lambda: f'/post/{self.rng.choice(self.post_ids)}'), 50),
+            'page.search': (lambda: self.page(lambda: f'/search?query={self.rng.choice(self.terms)}'), 50),
+            'api.posts': (lambda: self.page(lambda: '/api/v1/posts?limit=20'), 50),
+            'api.search': (lambda: self.page(lambda: f'/api/v1/search?q={self.rng.choice(self.terms)}&fields=id,title'), 50),
+        }
+
+    def in_app(self, func):
+        def wrapper():
+            with self.app.app_context():
+                return func()
+        return wrapper
+
+    def build_model(self):
+        from app import db
+        from app.models.post import Post
+        from app.utils.ai.recommendation import build_recommendation_model
+
+        def run():
+            posts = db.session.query(Post.id, Post.title, Post.content).all()
+            build_recommendation_model(posts)
+        return self.in_app(run)
+
+    def ensure_model(self):
+        from app import db
+        from app.models.post import Post
+        from app.utils.ai.recommendation import build_recommendation_model, should_rebuild_model
+
+        with self.app.app_context():
+            if should_rebuild_model():
+                build_recommendation_model(db.session.query(Post.id, Post.title, Post.content).all())
+
+    def similar_posts(self):
+        from app.utils.ai.recommendation import get_similar_posts
+
+        self.ensure_model()
+        return self.in_app(lambda: get_similar_posts(self.rng.choice(self.post_ids)))
+
+    def user_recommendations(self):
+        from app.utils.ai.recommendation import get_user_recommendations
+
+        self.ensure_model()
+        return self.in_app(lambda: get_user_recommendations(self.rng.choice(self.commenter_ids)))
+
+    def sentiment(self):
+        from app.utils.ai.sentiment_analysis import analyze_sentiment
+
+        return lambda: analyze_sentiment(self.rng.choice(self.comment_texts))
+
+    def save_picture(self):
+        from PIL import Image
+        from werkzeug.datastructures import FileStorage
+        from app.utils.file_utils import save_picture
+
+        # Pictures are encoded here so only the upload is timed
+        pictures = []
+        for sigma in (10, 40, 70, 100):
+            data = io.BytesIO()
+            Image.effect_noise((1600, 1200), sigma).convert('RGB').save(data, 'JPEG', quality=90)
+            pictures.append(data.getvalue())
+        calls = count()
+
+        def run():
+            # Different bytes every call, identical uploads would be deduplicated.
+            # Decoders ignore data after the end of the JPEG
+            call = next(calls)
+            data = pictures[call % len(pictures)] + call.to_bytes(8, 'big')
+            with self.app.test_request_context():
+                save_picture(FileStorage(io.BytesIO(data), filename='upload.jpg'), folder='post_images')
+        return run
+
+    def page(self, url):
+        def run():
+            response = self.client.get(url())
+            response.get_data()
+            response.close()
+            if response.status_code != 200:
+                raise RuntimeError(f'{response.request.path} returned {response.status_code}')
+        return run
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results with a baseline.
+
+    Returns:
+        list: (size, name, metric, baseline value, new value, change) of regressions over threshold
+    """
+    regressions = []
+    for size, benchmarks in results.items():
+        for name, result in benchmarks.items():
+            previous = baseline.get(size, {}).get(name)
+            if not previous:
+                continue
+            for metric in ('p50_ms', 'p99_ms', 'peak_mb'):
+                if previous.get(metric):
+                    change = result[metric] / previous[metric] - 1
+                    result[f'{metric}_change'] = change
+                    if change > threshold:
+                        regressions.append((size, name, metric, previous[metric], result[metric], change))
+    return regressions
+
+
+def format_change(result, metric):
+    change = result.get(f'{metric}_change')
+    return '' if change is None else f'{change:+.0%}'
+
+
+def print_table(size, benchmarks):
+    click.echo(f'\n{size} posts')
+    click.echo(f'{"benchmark":<26}{"p50 ms":>10}{"":>6}{"p99 ms":>10}{"":>6}{"ops/s":>10}{"peak MB":>10}{"":>6}')
+    for name, result in benchmarks.items():
+        click.echo(
+            f'{name:<26}{result["p50_ms"]:>10.2f}{format_change(result, "p50_ms"):>6}'
+            f'{result["p99_ms"]:>10.2f}{format_change(result, "p99_ms"):>6}'
+            f'{result["throughput"]:>10.1f}{result["peak_mb"]:>10.2f}{format_change(result, "peak_mb"):>6}'
+        )
+
+
+@click.command()
+@click.option('--size', 'sizes', multiple=True, type=click.Choice(list(SIZES)), help='Corpus size, 1k by default.')
+@click.option('--only', 'only', multiple=True, help='Run benchmarks whose name starts with this, e.g. page.')
+@click.option('--iterations', type=int, help='Iterations per benchmark instead of its default.')
+@click.option('--seed', default=42, show_default=True)
+@click.option('--corpus-dir', default=DEFAULT_CORPUS_DIR, show_default=True, help='Where corpus databases are cached.')
+@click.option('--baseline', 'baseline_path', default=DEFAULT_BASELINE, show_default=True)
+@click.option('--save-baseline', is_flag=True, help='Store these results as the new baseline.')
+@click.option('--threshold', default=0.10, show_default=True, help='Slowdown that counts as a regression.')
+@click.option('--fail-on-regression', is_flag=True, help='Exit with status 1 if anything regressed.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Also write the results to this JSON file.')
+def main(sizes, only, iterations, seed, corpus_dir, baseline_path, save_baseline, threshold,
+         fail_on_regression, output):
+    """Benchmark the AI, ORM and rendering hot paths against synthetic corpora."""
+    from app import create_app, db, initialize
+    from app.utils.ai import recommendation
+
+    results = {}
+    for size in sizes or ('1k',):
+        database = ensure_corpus(corpus_dir, size, seed, echo=click.echo)
+        work_dir = tempfile.mkdtemp(prefix='benchmark-')
+        # Models and uploads written by the benchmarks stay out of the application's folders
+        recommendation.MODEL_PATH = os.path.join(work_dir, 'models')
+        # Benchmarks write to a copy, every run starts from the corpus as generated
+        copy = os.path.join(work_dir, 'corpus.db')
+        shutil.copyfile(database, copy)
+        config = benchmark_config(copy, work_dir)
+        config['METRICS_SLOW_REQUEST'] = 0
+        app = None
+        try:
+            app = create_app(config)
+            initialize(app)
+            suite = Benchmarks(app, work_dir, seed)
+            results[size] = {}
+            for name, (setup, default_iterations) in suite.registry().items():
+                if only and not name.startswith(only):
+                    continue
+                click.echo(f'{size} {name}...', nl=False)
+                results[size][name] = measure(setup(), iterations or default_iterations)
+                click.echo(f' {results[size][name]["p50_ms"]:.2f} ms')
+        finally:
+            if app is not None:
+                # Buffered views would otherwise be written at exit, after the copy is gone
+                app.extensions['view_recorder'].flush()
+                with app.app_context():
+                    db.engine.dispose()
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f).get('results', {})
+    regressions = compare(results, baseline, threshold)
+
+    for size, benchmarks in results.items():
+        print_table(size, benchmarks)
+
+    report = {'python': platform.python_version(), 'machine': platform.machine(), 'results': results}
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if save_baseline:
+        # Sizes and benchmarks not run this time keep their previous baseline
+        for size, benchmarks in results.items():
+            baseline.setdefault(size, {}).update({
+                name: {key: value for key, value in result.items() if not key.endswith('_change')}
+                for name, result in benchmarks.items()
+            })
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(report, results=baseline), f, indent=2)
+        click.echo(f'\nSaved the baseline to {baseline_path}')
+
+    if regressions:
+        click.echo(f'\n{len(regressions)} regressions over {threshold:.0%}:')
+        for size, name, metric, before, after, change in regressions:
+            click.echo(f'  {size} {name} {metric}: {before:.2f} -> {after:.2f} ({change:+.0%})')
+        if fail_on_regression:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
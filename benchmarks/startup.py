@@ -0,0 +1,89 @@
+"""
+Cold start report.
+Creates the application in fresh interpreters under `python -X importtime`
+and reports the wall time of create_app and of a CLI invocation, then the
+modules that took longest to import, by cumulative time (the module and
+everything it imported) and by self time.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 10 --top 30
+"""
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+
+CREATE_APP = (
+    'import time; start = time.perf_counter(); '
+    'from app import create_app; create_app(); '
+    'print(time.perf_counter() - start)'
+)
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def parse_importtime(stderr):
+    """
+    Parse -X importtime output.
+
+    Returns:
+        list: (module, self microseconds, cumulative microseconds, depth) per imported module
+    """
+    modules = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            modules.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return modules
+
+
+def run_python(code, importtime=False):
+    """Run code in a fresh interpreter from the project root, get (stdout, stderr)"""
+    args = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(args, cwd=root, capture_output=True, text=True, check=True)
+    return result.stdout, result.stderr
+
+
+def time_command(args, runs):
+    """Median wall time in seconds of running a command"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(args, capture_output=True, check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+@click.command()
+@click.option('--runs', default=5, show_default=True, help='Interpreters started per measurement.')
+@click.option('--top', default=20, show_default=True, help='Modules listed per table.')
+def main(runs, top):
+    """Report where the application spends its start-up time."""
+    create_times = [float(run_python(CREATE_APP)[0].split()[-1]) for _ in range(runs)]
+    process_time = time_command([sys.executable, '-c', 'from app import create_app; create_app()'], runs)
+    cli_time = time_command([sys.executable, '-m', 'flask', '--app', 'app:create_app', '--help'], runs)
+
+    click.echo(f'create_app        {statistics.median(create_times) * 1000:>8.0f} ms (median of {runs})')
+    click.echo(f'whole process     {process_time * 1000:>8.0f} ms')
+    click.echo(f'flask --help      {cli_time * 1000:>8.0f} ms')
+
+    modules = parse_importtime(run_python(CREATE_APP, importtime=True)[1])
+    loaded = {module for module, *_ in modules}
+    click.echo(f'\n{len(modules)} modules imported')
+    heavy = [name for name in ('PIL', 'numpy', 'sklearn', 'joblib', 'textblob', 'nltk', 'smtplib',
+                               'multiprocessing') if name in loaded]
+    click.echo(f'Heavy modules imported at start-up: {", ".join(heavy) or "none"}')
+
+    for title, key in (('cumulative', 2), ('self', 1)):
+        click.echo(f'\nTop {top} by {title} time')
+        for module, self_us, cumulative_us, depth in sorted(modules, key=lambda m: m[key], reverse=True)[:top]:
+            click.echo(f'{cumulative_us / 1000:>9.1f} ms {self_us / 1000:>8.1f} ms  {"  " * depth}{module}')
+
+
+if __name__ == '__main__':
+    main()
@@ -9,29 +9,20 @@ from app.models.user import User
 from app.models.post import Post, Comment, Tag
 
 def clear_database_with_orm():
-    """Clear database using SQLAlchemy ORM"""
-    print("Clearing database using SQLAlchemy ORM...")
+    """Clear database by truncating the tables through SQLAlchemy"""
+    print("Clearing database using SQLAlchemy...")
     app = create_app()
     
     with app.app_context():
-        # Delete all comments first (they depend on posts and users)
-        comment_count = Comment.query.count()
-        Comment.query.delete()
+        from app.cli import EXPORT_TABLES, get_table, truncate_tables
         
-        # Delete all post-tag associations and tags
+        comment_count = Comment.query.count()
         tag_count = Tag.query.count()
-        Tag.query.delete()
-        
-        # Delete all posts
         post_count = Post.query.count()
-        Post.query.delete()
-        
-        # Delete all users
         user_count = User.query.count()
-        User.query.delete()
         
-        # Commit the changes
-        db.session.commit()
+        # Truncate every table with one statement each instead of deleting rows
+        truncate_tables([get_table(name) for name in EXPORT_TABLES] + [get_table('tag_counts')])
         
         print(f"Deleted {comment_count} comments")
         print(f"Deleted {tag_count} tags")
@@ -55,7 +46,7 @@ def clear_database_with_sqlite():
     cursor.execute("PRAGMA foreign_keys = OFF")
     
     # Delete data from all relevant tables
-    tables = ['comments', 'post_tags', 'tags', 'posts', 'users']
+    tables = ['comments', 'post_tags', 'tag_counts', 'tags', 'posts', 'users']
     
     for table in tables:
         try:
@@ -0,0 +1,29 @@
+"""
+Gunicorn settings for wsgi:app, each can be overridden from the environment.
+The application is preloaded and warmed up in the master, workers fork from it
+and share the loaded model and templates copy-on-write.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+preload_app = True
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# Recycle workers now and then, so slow leaks cannot grow without bound
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+
+
+def post_fork(server, worker):
+    # Database connections opened in the master must not be shared with the workers
+    from app import db
+    from wsgi import app
+
+    with app.app_context():
+        db.engine.dispose(close=False)
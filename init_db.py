@@ -1,9 +1,6 @@
-from app import create_app, db
+from app import create_app, initialize
 
-# Create app context
+# Create the folders, default picture and all tables
 app = create_app()
-
-with app.app_context():
-    # Create all tables
-    db.create_all()
-    print("Database initialized successfully!")
+initialize(app)
+print("Database initialized successfully!")
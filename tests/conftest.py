@@ -0,0 +1,86 @@
+import io
+
+import pytest
+
+from app import create_app, db, initialize
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """Application on a fresh SQLite database, with work done in the request instead of background threads"""
+    from app.utils.ai import recommendation
+
+    # Models built by the tests must not replace the ones in the repository
+    monkeypatch.setattr(recommendation, 'MODEL_PATH', str(tmp_path / 'models'))
+
+    app = create_app({
+        'TESTING': True,
+        'SECRET_KEY': 'test',
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'),
+        'WTF_CSRF_ENABLED': False,
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'JINJA_BYTECODE_CACHE': False,
+        'INVALIDATION_BUS_PATH': str(tmp_path / 'invalidation.db'),
+        'IMAGE_WORKERS': 0,
+        'PASSWORD_HASH_WORKERS': 0,
+        'MAIL_SENDER_THREAD': False,
+        'VIEW_FLUSH_THREAD': False,
+    })
+    initialize(app)
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    """Create a user with the password 'password123', returning its id"""
+    from app.models.user import User
+
+    def make_user(username='alice'):
+        with app.app_context():
+            user = User(username=username, email=f'{username}@example.com', password='password123')
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+    return make_user
+
+
+@pytest.fixture
+def login():
+    def login(client, username='alice'):
+        return client.post('/login', data={'username': username, 'password': 'password123'})
+    return login
+
+
+@pytest.fixture
+def make_post():
+    """Create a post through the form, returning the response"""
+    def make_post(client, title='Hello', content='Some post content', tags='', published=True, image=None):
+        data = {'title': title, 'content': content, 'tags': tags}
+        if published:
+            data['published'] = 'y'
+        if image is not None:
+            data['image'] = (image, 'image.jpg')
+        return client.post('/post/new', data=data, content_type='multipart/form-data')
+    return make_post
+
+
+@pytest.fixture
+def jpeg():
+    """Make an in-memory JPEG file to upload"""
+    from PIL import Image
+
+    def jpeg(color='red', size=(400, 300)):
+        data = io.BytesIO()
+        Image.new('RGB', size, color).save(data, 'JPEG')
+        data.seek(0)
+        return data
+    return jpeg
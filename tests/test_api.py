@@ -0,0 +1,84 @@
+import pytest
+
+from app import db
+from app.models.post import Post
+from app.utils.image_tasks import handle_processed
+
+FUTURE = 'Fri, 01 Jan 2100 00:00:00 GMT'
+PROFILE = {'username': 'alice2', 'email': 'alice@example.com', 'first_name': '', 'last_name': '', 'about_me': ''}
+
+
+@pytest.fixture
+def author(client, make_user, login):
+    make_user()
+    author = client.application.test_client()
+    login(author)
+    return author
+
+
+def test_posts_are_paginated_with_a_cursor_and_sparse_fields(client, author, make_post):
+    for i in range(5):
+        make_post(author, title=f'Post {i}', tags='news')
+
+    titles = []
+    cursor = None
+    while True:
+        data = client.get('/api/v1/posts', query_string={'limit': 2, 'fields': 'id,title', 'cursor': cursor}).get_json()
+        assert all(set(post) == {'id', 'title'} for post in data['data'])
+        titles += [post['title'] for post in data['data']]
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+    assert titles == [f'Post {i}' for i in reversed(range(5))]
+    assert client.get('/api/v1/posts', query_string={'cursor': 'garbage'}).status_code == 400
+
+
+@pytest.mark.parametrize('url', ['/api/v1/posts', '/api/v1/posts/1/similar', '/api/v1/trending'])
+def test_limits_are_clamped_to_at_least_one(client, author, make_post, url):
+    for i in range(3):
+        make_post(author, title=f'Post {i}')
+    author.post('/post/1/comment', data={'content': 'Trending now'})
+
+    for limit in (0, -5):
+        data = client.get(url, query_string={'limit': limit}).get_json()['data']
+        assert len(data) == 1
+
+
+def test_hidden_posts_do_not_leak_through_conditional_requests(client, author, make_post):
+    make_post(author, title='Draft', published=False)
+    # Shows the flashed message, pages with one are never conditional
+    author.get('/').close()
+    assert author.get('/api/v1/posts/1').status_code == 200
+
+    for url in ['/api/v1/posts/1', '/api/v1/posts/1/comments']:
+        assert client.get(url).status_code == 404
+        assert client.get(url, headers={'If-Modified-Since': FUTURE}).status_code == 404
+        etag = author.get(url).headers['ETag']
+        assert author.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_author_profile_changes_revalidate_api_responses(client, author, make_post):
+    make_post(author)
+    author.post('/post/1/comment', data={'content': 'By the author'})
+    urls = ['/api/v1/posts', '/api/v1/posts/1', '/api/v1/posts/1/comments']
+    etags = {}
+    for url in urls:
+        response = client.get(url)
+        etags[url] = response.headers['ETag']
+        assert client.get(url, headers={'If-None-Match': etags[url]}).status_code == 304
+
+    author.post('/profile', data=PROFILE)
+
+    for url in urls:
+        response = client.get(url, headers={'If-None-Match': etags[url]})
+        assert response.status_code == 200
+        assert b'alice2' in response.data
+
+
+def test_post_lists_revalidate_once_an_image_is_processed(app, client, author, make_post, jpeg):
+    make_post(author, image=jpeg())
+    etag = client.get('/api/v1/posts').headers['ETag']
+    with app.app_context():
+        handle_processed('post_images', db.session.get(Post, 1).image_file, None)
+
+    assert client.get('/api/v1/posts', headers={'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,50 @@
+import gzip
+import os
+import shutil
+from pathlib import Path
+
+from flask import url_for
+
+from app.utils.assets import StaticAssets, build_assets
+
+STATIC_CSS = Path(__file__).parent.parent / 'app' / 'static' / 'css'
+
+
+def test_build_fingerprints_and_compresses_assets(tmp_path):
+    shutil.copytree(STATIC_CSS, tmp_path / 'css')
+
+    manifest = build_assets(str(tmp_path))
+
+    hashed = manifest['css/main.css']
+    assert hashed.startswith('dist/css/main.') and hashed.endswith('.css')
+    with open(tmp_path / 'css' / 'main.css', 'rb') as f:
+        original = f.read()
+    with gzip.open(tmp_path / (hashed + '.gz')) as f:
+        assert f.read() == original
+    assert build_assets(str(tmp_path)) == manifest
+
+
+def test_fingerprinted_assets_are_served_immutable_and_precompressed(app, tmp_path):
+    static_folder = tmp_path / 'static'
+    shutil.copytree(STATIC_CSS, static_folder / 'css')
+    build_assets(str(static_folder))
+    app.static_folder = str(static_folder)
+    assets = app.extensions['static_assets']
+    assets.manifest = StaticAssets.load_manifest(app.static_folder)
+
+    with app.test_request_context():
+        url = url_for('static', filename='css/main.css')
+    assert '/dist/css/main.' in url
+
+    client = app.test_client()
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    response.close()
+
+    response = client.get(url)
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == (static_folder / 'css' / 'main.css').read_bytes()
+    response.close()
+    assert os.path.isfile(static_folder / 'dist' / 'manifest.json')
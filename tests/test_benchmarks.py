@@ -0,0 +1,92 @@
+import hashlib
+import os
+
+import pytest
+from click.testing import CliRunner
+
+from app import create_app, db, initialize
+from benchmarks.corpus import benchmark_config, corpus_path, generate
+from benchmarks.run import Benchmarks, compare, main, measure, percentile
+
+
+@pytest.fixture
+def suite(tmp_path, monkeypatch):
+    from app.utils.ai import recommendation
+
+    monkeypatch.setattr(recommendation, 'MODEL_PATH', str(tmp_path / 'models'))
+    config = benchmark_config(tmp_path / 'corpus.db', str(tmp_path))
+    config['JINJA_BYTECODE_CACHE'] = False
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+        generate(30, echo=lambda message: None)
+    initialize(app)
+    yield Benchmarks(app, str(tmp_path))
+    with app.app_context():
+        db.engine.dispose()
+
+
+def test_percentile_uses_the_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 0.5) == 50
+    assert percentile(values, 0.99) == 99
+    assert percentile([7], 0.99) == 7
+
+
+def test_measure_times_every_iteration():
+    calls = []
+    result = measure(lambda: calls.append(1), 10, warmup=2, memory_runs=3)
+    assert len(calls) == 15
+    assert result['iterations'] == 10
+    assert result['p50_ms'] <= result['p99_ms']
+
+
+def test_compare_reports_slowdowns_over_the_threshold():
+    results = {'1k': {'page.home': {'p50_ms': 12.0, 'p99_ms': 20.0, 'peak_mb': 1.0}}}
+    baseline = {'1k': {'page.home': {'p50_ms': 10.0, 'p99_ms': 19.0, 'peak_mb': 1.0}}}
+    [(size, name, metric, before, after, change)] = compare(results, baseline, 0.10)
+    assert (size, name, metric, before, after) == ('1k', 'page.home', 'p50_ms', 10.0, 12.0)
+    assert results['1k']['page.home']['p99_ms_change'] == pytest.approx(20 / 19 - 1)
+
+
+def test_benchmarks_run_without_caches_or_background_work(suite):
+    config = suite.app.config
+    assert config['FRAGMENT_CACHE_TYPE'] == 'null'
+    assert config['IMAGE_WORKERS'] == 0
+    assert config['MAIL_SENDER_THREAD'] is False
+    assert config['VIEW_FLUSH_THREAD'] is False
+
+    for name in ('page.home', 'page.post', 'page.search', 'api.posts'):
+        setup, _ = suite.registry()[name]
+        setup()()
+
+
+def test_every_save_picture_call_stores_a_new_picture(suite):
+    run = suite.save_picture()
+    for _ in range(5):
+        run()
+    stored = [name for name in os.listdir(os.path.join(suite.work_dir, 'uploads', 'post_images'))
+              if not name.endswith('.pending')]
+    assert len(stored) == 5
+
+
+def test_runs_leave_the_cached_corpus_unchanged(tmp_path, monkeypatch):
+    from app.utils.ai import recommendation
+
+    monkeypatch.setattr(recommendation, 'MODEL_PATH', recommendation.MODEL_PATH)
+    # Every page view is written
+    monkeypatch.setenv('VIEW_FLUSH_SIZE', '1')
+    database = corpus_path(str(tmp_path), '1k')
+    app = create_app(benchmark_config(database, str(tmp_path)))
+    with app.app_context():
+        db.create_all()
+        generate(30, echo=lambda message: None)
+        db.engine.dispose()
+    with open(database, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+
+    result = CliRunner().invoke(main, ['--only', 'page.post', '--iterations', '3', '--corpus-dir', str(tmp_path),
+                                       '--baseline', str(tmp_path / 'baseline.json')])
+    assert result.exit_code == 0, result.output
+    with open(database, 'rb') as f:
+        assert hashlib.sha256(f.read()).hexdigest() == digest
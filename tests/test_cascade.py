@@ -0,0 +1,105 @@
+import sqlite3
+
+from app import db
+from app.models.post import Post, Comment, Tag, TagCount
+from app.models.user import User
+
+
+def test_deleting_a_post_removes_its_comments(app, client, make_user, login, make_post):
+    make_user()
+    login(client)
+    make_post(client, tags='a')
+    client.post('/post/1/comment', data={'content': 'a comment'})
+
+    client.post('/post/1/delete')
+
+    with app.app_context():
+        assert Post.query.count() == 0
+        assert Comment.query.count() == 0
+        assert db.session.query(TagCount.post_count).scalar() == 0
+
+
+def test_deleting_an_account_removes_its_posts_and_comments(app, client, make_user, login, make_post):
+    make_user()
+    make_user('bob')
+    login(client)
+    make_post(client, title='Alice post', tags='a, b')
+    bob = app.test_client()
+    login(bob, 'bob')
+    make_post(bob, title='Bob post', tags='a')
+    client.post('/post/2/comment', data={'content': 'alice on bob'})
+    bob.post('/post/2/comment', data={'content': 'bob on bob'})
+    bob.post('/post/1/comment', data={'content': 'bob on alice'})
+    with app.app_context():
+        updated_at = db.session.get(Post, 2).updated_at
+
+    response = client.post('/profile/delete')
+    assert response.status_code == 302
+
+    with app.app_context():
+        assert User.query.filter_by(username='alice').first() is None
+        assert [post.title for post in Post.query] == ['Bob post']
+        assert [comment.content for comment in Comment.query] == ['bob on bob']
+        post = db.session.get(Post, 2)
+        assert post.comment_count == 1
+        assert post.updated_at == updated_at
+        counts = dict(db.session.query(Tag.name, TagCount.post_count).join(TagCount.tag))
+        assert counts == {'a': 1, 'b': 0}
+
+    # The session no longer belongs to anyone
+    assert client.get('/profile').status_code == 302
+
+
+BASELINE_SCHEMA = '''
+CREATE TABLE users (id INTEGER NOT NULL, username VARCHAR(64) NOT NULL, PRIMARY KEY (id));
+CREATE TABLE tags (id INTEGER NOT NULL, name VARCHAR(50) NOT NULL, PRIMARY KEY (id), UNIQUE (name));
+CREATE TABLE posts (
+    id INTEGER NOT NULL, title VARCHAR(120) NOT NULL, content TEXT NOT NULL, image_file VARCHAR(120),
+    created_at DATETIME, updated_at DATETIME, published BOOLEAN, user_id INTEGER NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id)
+);
+CREATE TABLE post_tags (
+    post_id INTEGER NOT NULL, tag_id INTEGER NOT NULL, PRIMARY KEY (post_id, tag_id),
+    FOREIGN KEY(post_id) REFERENCES posts (id), FOREIGN KEY(tag_id) REFERENCES tags (id)
+);
+CREATE TABLE comments (
+    id INTEGER NOT NULL, content TEXT NOT NULL, created_at DATETIME, post_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL, PRIMARY KEY (id),
+    FOREIGN KEY(post_id) REFERENCES posts (id), FOREIGN KEY(user_id) REFERENCES users (id)
+);
+INSERT INTO users VALUES (1, 'alice');
+INSERT INTO tags VALUES (1, 'python');
+INSERT INTO posts VALUES (1, 'Hello', '<p>Some post content</p>', NULL, '2024-01-01', '2024-01-01', 1, 1);
+INSERT INTO post_tags VALUES (1, 1);
+INSERT INTO comments VALUES (1, 'Nice', '2024-01-02', 1, 1);
+'''
+
+
+def test_cascade_update_keeps_columns_added_by_other_scripts(tmp_path, monkeypatch):
+    import update_db_ai
+    import update_db_tags
+    import update_db_comments
+    import update_db_excerpts
+    import update_db_cascade
+
+    (tmp_path / 'instance').mkdir()
+    conn = sqlite3.connect(tmp_path / 'instance' / 'app.db')
+    conn.executescript(BASELINE_SCHEMA)
+    conn.close()
+
+    monkeypatch.chdir(tmp_path)
+    for script in (update_db_ai, update_db_tags, update_db_comments, update_db_excerpts, update_db_cascade):
+        script.update_database()
+
+    conn = sqlite3.connect(tmp_path / 'instance' / 'app.db')
+    assert conn.execute('SELECT excerpt, word_count, comment_count FROM posts').fetchall() == [
+        ('Some post content', 3, 1)
+    ]
+    assert 'ON DELETE CASCADE' in conn.execute("SELECT sql FROM sqlite_master WHERE name = 'posts'").fetchone()[0]
+    indexes = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert 'ix_comments_post_created' in indexes
+
+    conn.execute('PRAGMA foreign_keys = ON')
+    conn.execute('DELETE FROM users')
+    assert conn.execute('SELECT COUNT(*) FROM comments').fetchone()[0] == 0
+    conn.close()
@@ -0,0 +1,53 @@
+import re
+
+from app import db
+from app.models.post import Post
+
+
+def test_comments_are_paginated_with_a_cursor(client, make_user, login, make_post):
+    make_user()
+    login(client)
+    make_post(client)
+    for i in range(45):
+        client.post('/post/1/comment', data={'content': f'comment number {i}'})
+
+    page = client.get('/post/1').get_data()
+    assert b'Comments (45)' in page
+    seen = set(re.findall(rb'comment number (\d+)', page))
+    cursor = re.search(rb'data-cursor="([^"]+)"', page).group(1).decode()
+    while cursor:
+        data = client.get('/post/1/comments', query_string={'cursor': cursor}).get_json()
+        seen.update(re.findall(r'comment number (\d+)', data['html']))
+        cursor = data['next_cursor']
+    assert len(seen) == 45
+
+
+def test_invalid_cursor_is_rejected(client, make_user, login, make_post):
+    make_user()
+    login(client)
+    make_post(client)
+    client.post('/post/1/comment', data={'content': 'first'})
+
+    for cursor in ('garbage', 'garbage_1', '2024-01-01T00:00:00_x'):
+        assert client.get('/post/1/comments', query_string={'cursor': cursor}).status_code == 400
+    # No cursor is the first page
+    response = client.get('/post/1/comments', query_string={'cursor': ''})
+    assert response.status_code == 200
+    assert 'first' in response.get_json()['html']
+
+
+def test_comments_keep_the_comment_count_without_touching_the_post(app, client, make_user, login, make_post):
+    make_user()
+    login(client)
+    make_post(client)
+    with app.app_context():
+        updated_at = db.session.get(Post, 1).updated_at
+
+    client.post('/post/1/comment', data={'content': 'one'})
+    client.post('/post/1/comment', data={'content': 'two'})
+    client.post('/comment/1/delete')
+
+    with app.app_context():
+        post = db.session.get(Post, 1)
+        assert post.comment_count == 1
+        assert post.updated_at == updated_at
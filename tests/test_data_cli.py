@@ -0,0 +1,40 @@
+from app import db
+from app.models.post import Post, Tag, TagCount
+from app.models.upload import UploadRef
+
+
+def test_export_and_import_keep_the_data(app, client, make_user, login, make_post, tmp_path):
+    make_user()
+    login(client)
+    make_post(client, title='First', tags='a, b')
+    make_post(client, title='Second', tags='a')
+    client.post('/post/1/comment', data={'content': 'a comment'})
+    with app.app_context():
+        before = [(post.title, post.created_at, post.updated_at, post.comment_count) for post in Post.query]
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['data', 'export', str(tmp_path / 'export')])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(args=['data', 'import', '--clear', str(tmp_path / 'export')])
+    assert result.exit_code == 0, result.output
+
+    with app.app_context():
+        after = [(post.title, post.created_at, post.updated_at, post.comment_count) for post in Post.query]
+        assert after == before
+        counts = dict(db.session.query(Tag.name, TagCount.post_count).join(TagCount.tag))
+        assert counts == {'a': 2, 'b': 1}
+
+
+def test_clear_removes_upload_references(app, client, make_user, login, make_post, jpeg):
+    make_user()
+    login(client)
+    make_post(client, image=jpeg())
+    with app.app_context():
+        assert UploadRef.query.count() == 1
+
+    result = app.test_cli_runner().invoke(args=['data', 'clear', '--yes'])
+    assert result.exit_code == 0, result.output
+
+    with app.app_context():
+        assert Post.query.count() == 0
+        assert UploadRef.query.count() == 0
@@ -0,0 +1,41 @@
+from app.utils.cache import LRUBackend
+
+
+def test_anonymous_pages_are_cached_until_a_post_changes(client, make_user, login, make_post):
+    make_user()
+    author = client.application.test_client()
+    login(author)
+    make_post(author, title='First', tags='news')
+
+    assert client.get('/').headers['X-Cache'] == 'MISS'
+    assert client.get('/').headers['X-Cache'] == 'HIT'
+    assert client.get('/tag/news').headers['X-Cache'] == 'MISS'
+    assert client.get('/tag/news').headers['X-Cache'] == 'HIT'
+
+    make_post(author, title='Second', tags='news')
+
+    response = client.get('/')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert b'Second' in response.data
+    assert client.get('/tag/news').headers['X-Cache'] == 'MISS'
+
+
+def test_pages_of_signed_in_users_are_not_cached(client, make_user, login, make_post):
+    make_user()
+    login(client)
+    make_post(client)
+    client.get('/')
+
+    assert 'X-Cache' not in client.get('/').headers
+
+
+def test_lru_backend_evicts_least_recently_used_entries():
+    backend = LRUBackend(max_bytes=100)
+    backend.set('a', 'x' * 40)
+    backend.set('b', 'x' * 40)
+    backend.get('a')
+    backend.set('c', 'x' * 40)
+
+    assert backend.get('a') is not None
+    assert backend.get('b') is None
+    assert backend.get('c') is not None
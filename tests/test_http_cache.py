@@ -0,0 +1,70 @@
+import time
+from types import SimpleNamespace
+
+from app.utils import http_cache
+
+
+def test_unchanged_pages_are_answered_with_304(client, make_user, login, make_post):
+    make_user()
+    author = client.application.test_client()
+    login(author)
+    make_post(author, tags='news')
+
+    for url in ['/', '/tag/news', '/post/1']:
+        response = client.get(url)
+        response.close()
+        assert response.status_code == 200
+        assert 'public' in response.headers['Cache-Control']
+        etag = response.headers['ETag']
+
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+        assert client.get(url, headers={'If-Modified-Since': response.headers['Last-Modified']}).status_code == 304
+
+
+def test_new_comments_change_the_post_page(client, make_user, login, make_post):
+    make_user()
+    author = client.application.test_client()
+    login(author)
+    make_post(author)
+    response = client.get('/post/1')
+    response.close()
+
+    author.post('/post/1/comment', data={'content': 'A new comment'})
+
+    response = client.get('/post/1', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 200
+    assert b'A new comment' in response.get_data()
+
+
+def test_author_profile_changes_revalidate_listings(client, make_user, login, make_post):
+    make_user()
+    author = client.application.test_client()
+    login(author)
+    make_post(author, tags='news')
+    etags = {url: client.get(url).headers['ETag'] for url in ['/', '/tag/news']}
+
+    author.post('/profile', data={'username': 'alice2', 'email': 'alice@example.com',
+                                  'first_name': '', 'last_name': '', 'about_me': ''})
+
+    for url, etag in etags.items():
+        response = client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert b'alice2' in response.data
+
+
+def test_signed_in_pages_are_revalidated_before_their_csrf_token_expires(app, client, make_user, login,
+                                                                         make_post, monkeypatch):
+    make_user()
+    login(client)
+    make_post(client)
+    client.get('/')
+    app.config.update(WTF_CSRF_ENABLED=True, WTF_CSRF_TIME_LIMIT=3600)
+
+    response = client.get('/')
+    assert 'private' in response.headers['Cache-Control']
+    etag = response.headers['ETag']
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 304
+
+    now = time.time()
+    monkeypatch.setattr(http_cache, 'time', SimpleNamespace(time=lambda: now + 1800))
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,79 @@
+import threading
+import time
+
+from app import db
+from app.models.post import Post
+from app.utils.image_tasks import handle_processed
+
+
+def test_uploads_are_processed_in_the_pool(app, client, make_user, login, make_post, jpeg):
+    processor = app.extensions['image_processor']
+    processor.workers = 1
+    processor.start_method = 'fork'
+    make_user()
+    login(client)
+    try:
+        response = make_post(client, image=jpeg())
+        assert response.status_code == 302
+
+        deadline = time.time() + 30
+        while processor.pending and time.time() < deadline:
+            time.sleep(0.05)
+        assert processor.stats()['pending'] == 0
+    finally:
+        if processor._executor is not None:
+            processor._executor.shutdown()
+
+    page = client.get('/post/1').get_data(as_text=True)
+    assert 'placeholder.svg' not in page
+    with app.app_context():
+        assert db.session.get(Post, 1).image_file in page
+
+
+def test_uploads_are_refused_when_the_queue_is_full(app, client, make_user, login, make_post, jpeg):
+    processor = app.extensions['image_processor']
+    processor._slots = threading.BoundedSemaphore(1)
+    processor._slots.acquire()
+    processor.queue_timeout = 0.01
+    make_user()
+    login(client)
+
+    response = make_post(client, image=jpeg())
+
+    assert response.status_code == 503
+    assert processor.stats()['rejected'] == 1
+    with app.app_context():
+        assert Post.query.count() == 0
+
+
+def test_failed_processing_removes_the_picture_from_its_post(app, client, make_user, login, make_post, jpeg):
+    make_user()
+    login(client)
+    make_post(client, image=jpeg())
+    with app.app_context():
+        post = db.session.get(Post, 1)
+        image_file, updated_at = post.image_file, post.updated_at
+
+        handle_processed('post_images', image_file, OSError('broken'))
+
+        post = db.session.get(Post, 1)
+        assert post.image_file is None
+        assert post.updated_at == updated_at
+
+
+def test_listings_revalidate_once_an_image_is_processed(app, client, make_user, login, make_post, jpeg):
+    make_user()
+    author = app.test_client()
+    login(author)
+    make_post(author, tags='news', image=jpeg())
+    etags = {url: client.get(url).headers['ETag'] for url in ['/', '/tag/news']}
+    with app.app_context():
+        post = db.session.get(Post, 1)
+        image_file, updated_at = post.image_file, post.updated_at
+
+        # The placeholder shown before is replaced by the picture
+        handle_processed('post_images', image_file, None)
+        assert db.session.get(Post, 1).updated_at == updated_at
+
+    for url, etag in etags.items():
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 200
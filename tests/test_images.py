@@ -0,0 +1,50 @@
+import os
+import shutil
+
+from app import db
+from app.models.post import Post
+
+
+def post_image(app):
+    with app.app_context():
+        return db.session.get(Post, 1).image_file
+
+
+def test_uploads_get_webp_variants_in_a_srcset(app, client, make_user, login, make_post, jpeg):
+    make_user()
+    login(client)
+    make_post(client, image=jpeg(size=(1200, 900)))
+
+    image_file = post_image(app)
+    directory = os.path.join(app.config['UPLOAD_FOLDER'], 'post_images')
+    for width in app.config['IMAGE_VARIANT_WIDTHS']['post_images']:
+        assert os.path.exists(os.path.join(directory, f'{os.path.splitext(image_file)[0]}.w{width}.webp'))
+
+    page = client.get('/post/1').get_data(as_text=True)
+    assert '<source type="image/webp"' in page
+    assert '.w800.webp 800w' in page
+
+
+def test_pictures_without_variants_have_no_webp_source(app, client, make_user, login, make_post, jpeg):
+    make_user()
+    login(client)
+    make_post(client)
+
+    # A picture uploaded before variants were generated
+    directory = os.path.join(app.config['UPLOAD_FOLDER'], 'post_images')
+    with open(os.path.join(directory, 'legacy.jpg'), 'wb') as f:
+        shutil.copyfileobj(jpeg(), f)
+    with app.app_context():
+        db.session.execute(db.update(Post).values(image_file='legacy.jpg'))
+        db.session.commit()
+
+    page = client.get('/post/1').get_data(as_text=True)
+    assert 'legacy.jpg' in page
+    assert '<source type="image/webp"' not in page
+
+    result = app.test_cli_runner().invoke(args=['images', 'backfill'])
+    assert result.exit_code == 0, result.output
+    assert os.path.exists(os.path.join(directory, 'legacy.w320.webp'))
+
+    page = client.get('/post/1').get_data(as_text=True)
+    assert 'legacy.w320.webp 320w' in page
@@ -0,0 +1,53 @@
+import sqlite3
+import time
+
+
+def publish_from_another_worker(app, channel, key):
+    conn = sqlite3.connect(app.config['INVALIDATION_BUS_PATH'])
+    with conn:
+        conn.execute('INSERT INTO events (channel, key, origin, created_at) VALUES (?, ?, ?, ?)',
+                     (channel, key, -1, time.time()))
+    conn.close()
+
+
+def test_events_of_other_workers_are_dispatched(app):
+    bus = app.extensions['invalidation_bus']
+    received = []
+    bus.subscribe('test', received.append)
+
+    publish_from_another_worker(app, 'test', 'one')
+    bus.publish('test', 'own')
+
+    assert bus.poll() == 1
+    assert received == ['one']
+    assert bus.poll() == 0
+
+
+def test_remote_invalidation_drops_cached_pages(app, client, make_user, login, make_post):
+    make_user()
+    author = app.test_client()
+    login(author)
+    make_post(author)
+    client.get('/')
+    assert client.get('/').headers['X-Cache'] == 'HIT'
+
+    publish_from_another_worker(app, 'fragments', 'home')
+    app.extensions['invalidation_bus'].poll()
+
+    assert client.get('/').headers['X-Cache'] == 'MISS'
+
+
+def test_an_unreadable_bus_leaves_pages_served(app, client, caplog):
+    bus = app.extensions['invalidation_bus']
+    conn = sqlite3.connect(app.config['INVALIDATION_BUS_PATH'])
+    conn.execute('DROP TABLE events')
+    conn.close()
+    bus._last_poll = 0.0
+
+    assert client.get('/').status_code == 200
+    assert 'Could not poll invalidations' in caplog.text
+    # Not retried on every request
+    assert time.time() - bus._last_poll < bus.poll_interval
+    caplog.clear()
+    assert client.get('/').status_code == 200
+    assert 'Could not poll invalidations' not in caplog.text
@@ -0,0 +1,85 @@
+import socket
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+from app import db
+from app.models.post import Comment, Post
+from benchmarks.load import HttpSession, Recorder, Scenarios, parse_mix
+
+
+@pytest.fixture
+def server(app):
+    """The app served over HTTP on a free local port"""
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    thread.join()
+
+
+def test_parse_mix():
+    assert parse_mix('browse=50, search=10,login') == {'browse': 50.0, 'search': 10.0, 'login': 1.0}
+
+
+def test_report_counts_errors_and_locked_databases():
+    recorder = Recorder()
+    recorder.record('GET /', 0.010, 200)
+    recorder.record('GET /', 0.030, 500, b'database is locked')
+    recorder.record_failure('GET /', 0.020, ConnectionResetError())
+
+    report = recorder.report(2.0)
+    assert (report['requests'], report['errors'], report['database_locked']) == (3, 2, 1)
+    assert report['throughput'] == 1.5
+    stats = report['endpoints']['GET /']
+    assert stats['statuses'] == {'200': 1, '500': 1, 'ConnectionResetError': 1}
+    assert stats['p50_ms'] == pytest.approx(20.0)
+    assert stats['max_ms'] == pytest.approx(30.0)
+
+
+def test_scenarios_run_against_a_live_server(app, client, server, make_user, login, make_post):
+    make_user('user1')
+    login(client, 'user1')
+    make_post(client, tags='python')
+    with app.app_context():
+        comments_before = Comment.query.count()
+    # The scenarios read their CSRF tokens from the forms
+    app.config['WTF_CSRF_ENABLED'] = True
+
+    recorder = Recorder()
+    scenarios = Scenarios(server, recorder, [1], ['python'], ['user1'], seed=42)
+    for name in ('browse', 'search', 'read_comments', 'login', 'comment', 'upload'):
+        getattr(scenarios, name)(0.0)
+
+    report = recorder.report(1.0)
+    assert report['errors'] == 0, report['endpoints']
+    assert {'GET /', 'GET /post/<id>', 'GET /tag/<name>', 'GET /search', 'POST /login',
+            'POST /post/<id>/comment', 'POST /post/new'} <= set(report['endpoints'])
+    with app.app_context():
+        assert Comment.query.count() == comments_before + 1
+        assert Post.query.count() == 2
+        assert db.session.get(Post, 2).image_file is not None
+
+
+def test_failed_requests_drop_the_connection_and_the_session():
+    # Accepts connections and never answers
+    listener = socket.create_server(('127.0.0.1', 0))
+    try:
+        session = HttpSession(f'http://127.0.0.1:{listener.getsockname()[1]}', timeout=0.2)
+        with pytest.raises(TimeoutError):
+            session.get('/')
+        # Reusing the connection would fail with CannotSendRequest instead of trying again
+        assert session.connection is None
+
+        recorder = Recorder()
+        scenarios = Scenarios(f'http://127.0.0.1:{listener.getsockname()[1]}', recorder, [1], [], ['user1'], seed=42)
+        scenarios.release(session)
+        scenarios.comment(0.0)
+    finally:
+        listener.close()
+
+    assert recorder.report(1.0)['errors'] == 1
+    # The failed session does not go back to the signed-in pool
+    assert scenarios._signed_in.empty()
@@ -0,0 +1,66 @@
+from app import create_app, initialize
+
+
+def attempt(client, username='alice', password='wrong', **kwargs):
+    return client.post('/login', data={'username': username, 'password': password}, **kwargs)
+
+
+def test_failed_logins_are_limited_per_username(app, client, make_user):
+    make_user()
+    for _ in range(app.config['LOGIN_USER_LIMIT']):
+        assert attempt(client).status_code == 200
+
+    response = attempt(client, password='password123')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+    # Other accounts are not affected
+    make_user('bob')
+    assert attempt(client, 'bob', 'password123').status_code == 302
+
+
+def test_attempts_are_limited_per_client_ip(app, client, make_user):
+    app.config['LOGIN_USER_LIMIT'] = 1000
+    from app.utils.login_guard import SlidingWindowLimiter
+    from app import login_guard
+    login_guard.ip_limiter = SlidingWindowLimiter(3, 60)
+
+    for _ in range(3):
+        attempt(client, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+    assert attempt(client, environ_base={'REMOTE_ADDR': '10.0.0.1'}).status_code == 429
+    assert attempt(client, environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code == 200
+
+
+def test_forwarded_clients_are_limited_separately_behind_a_proxy(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SECRET_KEY': 'test',
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'),
+        'WTF_CSRF_ENABLED': False,
+        'INVALIDATION_BUS_PATH': str(tmp_path / 'invalidation.db'),
+        'PASSWORD_HASH_WORKERS': 0,
+        'MAIL_SENDER_THREAD': False,
+        'VIEW_FLUSH_THREAD': False,
+        'LOGIN_IP_LIMIT': 2,
+        'LOGIN_USER_LIMIT': 1000,
+        'PROXY_FIX_HOPS': 1,
+    })
+    initialize(app)
+    client = app.test_client()
+    proxy = {'REMOTE_ADDR': '127.0.0.1'}
+
+    for _ in range(2):
+        attempt(client, environ_base=proxy, headers={'X-Forwarded-For': '203.0.113.1'})
+    assert attempt(client, environ_base=proxy, headers={'X-Forwarded-For': '203.0.113.1'}).status_code == 429
+    assert attempt(client, environ_base=proxy, headers={'X-Forwarded-For': '203.0.113.2'}).status_code == 200
+
+
+def test_stats_endpoints_require_the_stats_token(app, client):
+    paths = ['/login/stats', '/cache/stats', '/metrics']
+    for path in paths:
+        assert client.get(path).status_code == 404
+
+    app.config['STATS_TOKEN'] = 'secret'
+    for path in paths:
+        assert client.get(path).status_code == 404
+        assert client.get(path, headers={'Authorization': 'Bearer wrong'}).status_code == 404
+        assert client.get(path, headers={'Authorization': 'Bearer secret'}).status_code == 200
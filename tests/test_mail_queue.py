@@ -0,0 +1,157 @@
+import socket
+import threading
+import time
+
+import pytest
+from sqlalchemy import event
+
+from app import db, mail_sender
+from app.models.email import OutboundEmail
+
+
+class SMTPStub:
+    """SMTP server on a local socket, enough of the protocol for smtplib"""
+
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+        self.replies = {}
+        self.server = socket.create_server(('127.0.0.1', 0))
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def handle(self, conn):
+        stream = conn.makefile('rwb')
+
+        def reply(line):
+            stream.write(line.encode() + b'\r\n')
+            stream.flush()
+
+        reply('220 stub ready')
+        recipient = None
+        for line in stream:
+            command = line.decode().strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                reply('250 stub')
+            elif verb == 'RCPT':
+                recipient = command.split('<', 1)[1].rstrip('>')
+                reply(self.replies.get(recipient, '250 ok'))
+            elif verb == 'DATA':
+                reply('354 go ahead')
+                data = b''
+                for data_line in stream:
+                    if data_line == b'.\r\n':
+                        break
+                    data += data_line
+                self.messages.append((recipient, data.decode()))
+                reply('250 queued')
+            elif verb == 'QUIT':
+                reply('221 bye')
+                break
+            else:
+                reply('250 ok')
+        conn.close()
+
+    def close(self):
+        self.server.close()
+
+
+@pytest.fixture
+def smtp(app):
+    stub = SMTPStub()
+    app.config.update(MAIL_BACKEND='smtp', MAIL_SERVER='127.0.0.1', MAIL_PORT=stub.port, MAIL_USE_TLS=False)
+    yield stub
+    with app.app_context():
+        mail_sender._close()
+    stub.close()
+
+
+def queue(app, *recipients):
+    with app.app_context():
+        for recipient in recipients:
+            OutboundEmail.queue('Hello', recipient, '<p>Hi there</p>')
+        db.session.commit()
+
+
+def test_a_batch_is_sent_over_one_connection(app, smtp):
+    queue(app, 'a@example.com', 'b@example.com', 'c@example.com')
+
+    with app.app_context():
+        assert mail_sender.send_due() == 3
+        assert OutboundEmail.query.count() == 0
+
+    assert sorted(recipient for recipient, _ in smtp.messages) == ['a@example.com', 'b@example.com', 'c@example.com']
+    assert 'Hi there' in smtp.messages[0][1]
+    assert smtp.connections == 1
+
+    queue(app, 'd@example.com')
+    with app.app_context():
+        mail_sender.send_due()
+    # The connection stays open between batches
+    assert smtp.connections == 1
+    assert len(smtp.messages) == 4
+
+
+def test_rejected_messages_are_retried_or_failed(app, smtp):
+    smtp.replies['busy@example.com'] = '450 mailbox busy'
+    smtp.replies['gone@example.com'] = '550 no such user'
+    queue(app, 'busy@example.com', 'gone@example.com', 'ok@example.com')
+
+    with app.app_context():
+        assert mail_sender.send_due() == 3
+        left = {message.recipient: message for message in OutboundEmail.query}
+        assert set(left) == {'busy@example.com', 'gone@example.com'}
+        assert (left['busy@example.com'].status, left['busy@example.com'].attempts) == ('pending', 1)
+        assert left['gone@example.com'].status == 'failed'
+        # The retry is not due yet
+        assert mail_sender.send_due() == 0
+
+    assert [recipient for recipient, _ in smtp.messages] == ['ok@example.com']
+
+
+def test_polling_an_empty_queue_does_not_write(app):
+    queue(app, 'a@example.com')
+    with app.app_context():
+        mail_sender.send_due()
+
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            assert mail_sender.send_due() == 0
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+    assert statements
+    assert all(statement.lstrip().upper().startswith('SELECT') for statement in statements)
+
+
+def test_the_sender_starts_with_the_first_request(app, smtp):
+    app.config.update(MAIL_SENDER_THREAD=True, MAIL_POLL_INTERVAL=0.05)
+    mail_sender.init_app(app)
+    # Left in the queue by a worker that was restarted before sending it
+    queue(app, 'a@example.com')
+
+    app.test_client().get('/').close()
+    thread = mail_sender._thread
+    try:
+        assert thread.is_alive()
+        for _ in range(100):
+            if smtp.messages:
+                break
+            time.sleep(0.05)
+        assert [recipient for recipient, _ in smtp.messages] == ['a@example.com']
+    finally:
+        mail_sender._stop.set()
+        mail_sender._wake.set()
+        thread.join(5)
+    assert not thread.is_alive()
@@ -0,0 +1,51 @@
+import logging
+import re
+
+from app.utils.metrics import Histogram
+
+AUTH = {'Authorization': 'Bearer secret'}
+
+
+def sample(text, name, **labels):
+    """Get a sample value from Prometheus text, 0 if the series is missing"""
+    label_text = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    match = re.search(rf'^{re.escape(name)}\{{{re.escape(label_text)}\}} (\S+)$', text, re.M)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('test_seconds', 'Test.', ('kind',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, 'a"b')
+
+    lines = histogram.expose()
+    assert 'test_seconds_bucket{kind="a\\"b",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{kind="a\\"b",le="1.0"} 3' in lines
+    assert 'test_seconds_bucket{kind="a\\"b",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{kind="a\\"b"} 4' in lines
+    assert 'test_seconds_sum{kind="a\\"b"} 6.050000' in lines
+
+
+def test_requests_queries_and_extensions_are_exposed(app, client):
+    app.config['STATS_TOKEN'] = 'secret'
+    before = client.get('/metrics', headers=AUTH).get_data(as_text=True)
+    client.get('/')
+    client.get('/')
+    text = client.get('/metrics', headers=AUTH).get_data(as_text=True)
+
+    labels = {'endpoint': 'main.home', 'method': 'GET', 'status': '200'}
+    assert sample(text, 'app_request_duration_seconds_count', **labels) == \
+        sample(before, 'app_request_duration_seconds_count', **labels) + 2
+    assert sample(text, 'app_request_sql_queries_count', endpoint='main.home') >= 2
+    assert sample(text, 'app_sql_duration_seconds_count', statement='SELECT') > 0
+    assert 'app_span_duration_seconds_count{span="template:main/home.html"}' in text
+    assert '# TYPE app_login_guard_tracked_ips gauge' in text
+
+
+def test_slow_requests_are_logged_with_their_queries(app, client, caplog):
+    app.extensions['metrics'].slow_request = 1e-9
+    with caplog.at_level(logging.WARNING, logger='app.utils.metrics'):
+        client.get('/')
+    [record] = [record for record in caplog.records if record.getMessage().startswith('Slow request GET main.home')]
+    assert 'SELECT' in record.getMessage()
+    assert 'template:main/home.html' in record.getMessage()
@@ -0,0 +1,72 @@
+import os
+import time
+
+from flask import Flask
+
+from app.utils.profiler import RequestProfiler
+
+
+def profiled_app(tmp_path, **config):
+    app = Flask(__name__)
+    app.config.update(PROFILER_DIR=str(tmp_path / 'profiles'), PROFILER_INTERVAL=0.001, **config)
+    profiler = RequestProfiler(app)
+
+    @app.route('/slow')
+    def slow_view():
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+        return 'done'
+    return app, profiler
+
+
+def test_requests_with_the_token_are_profiled(tmp_path):
+    app, profiler = profiled_app(tmp_path, PROFILER_TOKEN='secret')
+    client = app.test_client()
+
+    assert 'X-Profile-File' not in client.get('/slow').headers
+    assert 'X-Profile-File' not in client.get('/slow', headers={'X-Profile': 'wrong'}).headers
+    response = client.get('/slow', headers={'X-Profile': 'secret'})
+
+    name = response.headers['X-Profile-File']
+    assert os.listdir(tmp_path / 'profiles') == [name]
+    stacks = (tmp_path / 'profiles' / name).read_text()
+    assert 'flask.app:dispatch_request;test_profiler:slow_view' in stacks
+    stack, count = stacks.splitlines()[0].rsplit(' ', 1)
+    assert int(count) > 0
+    stats = profiler.stats()
+    assert (stats['profiles'], stats['active']) == (1, 0)
+    assert stats['samples'] >= int(count)
+
+
+def test_profiling_is_off_without_a_token_or_sample_rate(tmp_path):
+    app, profiler = profiled_app(tmp_path)
+    response = app.test_client().get('/slow', headers={'X-Profile': ''})
+    assert 'X-Profile-File' not in response.headers
+    assert profiler.counters['profiles'] == 0
+
+
+def test_random_sampling_only_covers_the_listed_endpoints(tmp_path):
+    app, profiler = profiled_app(tmp_path, PROFILER_SAMPLE_RATE=1.0, PROFILER_ENDPOINTS=['other'])
+    client = app.test_client()
+    client.get('/slow')
+    assert profiler.counters['profiles'] == 0
+
+    profiler.endpoints = frozenset(['slow_view'])
+    client.get('/slow')
+    assert profiler.counters['profiles'] == 1
+    # Sampled profiles are not announced to the client
+    assert 'X-Profile-File' not in client.get('/slow').headers
+
+
+def test_old_profiles_are_pruned(tmp_path):
+    app, profiler = profiled_app(tmp_path, PROFILER_TOKEN='secret', PROFILER_MAX_FILES=2)
+    os.makedirs(profiler.directory)
+    for i in range(3):
+        path = os.path.join(profiler.directory, f'old-{i}.folded')
+        with open(path, 'w') as f:
+            f.write('a;b 1\n')
+        os.utime(path, (i, i))
+
+    name = app.test_client().get('/slow', headers={'X-Profile': 'secret'}).headers['X-Profile-File']
+    assert sorted(os.listdir(profiler.directory)) == sorted([name, 'old-2.folded'])
@@ -0,0 +1,41 @@
+from app import db
+from app.models.post import Post
+from app.models.read_models import card_query, load_cards
+from app.utils.text_utils import make_excerpt
+
+
+def test_excerpt_and_word_count_follow_the_content(app, make_user):
+    user_id = make_user()
+    with app.app_context():
+        post = Post(title='Hello', content='<p>Some <b>bold</b> words</p>', user_id=user_id)
+        db.session.add(post)
+        db.session.commit()
+        assert (post.excerpt, post.word_count) == ('Some bold words', 3)
+
+        post.content = 'word ' * 100
+        db.session.commit()
+        assert post.word_count == 100
+        assert len(post.excerpt) <= 200
+        assert post.excerpt.endswith('...')
+
+
+def test_make_excerpt_cuts_on_a_word_boundary():
+    assert make_excerpt('short text', 20) == 'short text'
+    assert make_excerpt('one two three four', 12) == 'one two...'
+
+
+def test_cards_carry_author_and_tags(app, client, make_user, login, make_post):
+    make_user()
+    login(client)
+    make_post(client, title='Tagged', tags='b, a')
+
+    with app.app_context():
+        [card] = load_cards(card_query())
+        assert card.title == 'Tagged'
+        assert card.author.get_full_name() == 'alice'
+        assert [tag.name for tag in card.tags] == ['a', 'b']
+        assert not hasattr(card, '__dict__')
+
+    response = client.get('/')
+    assert b'Tagged' in response.data
+    assert b'Some post content' in response.data
@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+from app import create_app, db
+
+HEAVY_MODULES = ('sklearn', 'numpy', 'joblib', 'textblob', 'nltk', 'PIL', 'smtplib')
+
+
+def test_creating_the_app_imports_no_heavy_libraries(tmp_path):
+    code = (
+        'import sys\n'
+        'from app import create_app\n'
+        f'create_app({{"SQLALCHEMY_DATABASE_URI": "sqlite://", "INVALIDATION_BUS_PATH": {str(tmp_path / "bus.db")!r}}})\n'
+        f'print(",".join(name for name in {HEAVY_MODULES!r} if name in sys.modules))\n'
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ''
+
+
+def test_init_sets_up_folders_and_tables(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'app.db'),
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'INVALIDATION_BUS_PATH': str(tmp_path / 'invalidation.db'),
+    })
+    # Starting does no setup
+    assert not os.path.exists(tmp_path / 'uploads')
+
+    runner = app.test_cli_runner()
+    for _ in range(2):
+        result = runner.invoke(args=['init'])
+        assert result.exit_code == 0, result.output
+        assert 'Initialized' in result.output
+
+    assert os.path.isdir(tmp_path / 'uploads' / 'profile_pics')
+    assert os.path.isdir(tmp_path / 'uploads' / 'post_images')
+    assert os.path.getsize(tmp_path / 'uploads' / 'default_profile.jpg') > 100
+    with app.app_context():
+        tables = set(db.inspect(db.engine).get_table_names())
+        assert {'users', 'posts', 'comments', 'tags', 'outbound_emails'} <= tables
+        db.engine.dispose()
@@ -0,0 +1,49 @@
+import gzip
+import re
+
+from app import db
+from app.models.post import Comment
+
+
+def test_pages_are_streamed_and_gzipped(client, make_user, login, make_post):
+    make_user()
+    login(client)
+    make_post(client, title='Streamed post')
+
+    response = client.get('/post/1', headers={'Accept-Encoding': 'gzip'})
+    assert response.is_streamed
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert b'Streamed post' in gzip.decompress(response.get_data())
+
+    response = client.get('/search', query_string={'query': 'Streamed'})
+    assert response.is_streamed
+    assert b'Streamed post' in response.get_data()
+
+
+def test_flashed_messages_are_shown_once(client, make_user, login, make_post):
+    make_user()
+    login(client)
+    make_post(client)
+    client.get('/').close()
+
+    client.post('/post/1/comment', data={'content': 'A nice comment'})
+
+    assert b'comment has been added' in client.get('/post/1').get_data()
+    assert b'comment has been added' not in client.get('/post/1').get_data()
+
+
+def test_forms_on_streamed_pages_post_with_a_fresh_session(app, client, make_user, login, make_post):
+    make_user()
+    login(client)
+    make_post(client)
+    with client.session_transaction() as session:
+        session.pop('csrf_token', None)
+    app.config['WTF_CSRF_ENABLED'] = True
+
+    page = client.get('/post/1').get_data()
+    token = re.search(rb'name="csrf_token"[^>]*value="([^"]+)"', page).group(1).decode()
+    response = client.post('/post/1/comment', data={'content': 'Posted from the page', 'csrf_token': token})
+
+    assert response.status_code == 302
+    with app.app_context():
+        assert db.session.query(Comment.content).scalar() == 'Posted from the page'
@@ -0,0 +1,86 @@
+from app import db
+from app.models.post import Post, Tag, TagCount
+from app.utils import db_utils
+
+
+def tag_counts(app):
+    with app.app_context():
+        return {name: count for name, count in db.session.query(Tag.name, TagCount.post_count).join(TagCount.tag)}
+
+
+def edit(client, post_id, tags, published=True):
+    data = {'title': 'Hello', 'content': 'Some post content', 'tags': tags}
+    if published:
+        data['published'] = 'y'
+    return client.post(f'/post/{post_id}/update', data=data)
+
+
+def test_tag_names_are_normalized_and_deduplicated(app, client, make_user, login, make_post):
+    make_user()
+    login(client)
+    make_post(client, tags='Python, flask,python, ,Flask ')
+
+    with app.app_context():
+        assert sorted(tag.name for tag in db.session.get(Post, 1).tags) == ['flask', 'python']
+    assert tag_counts(app) == {'flask': 1, 'python': 1}
+
+
+def test_counts_follow_tag_changes_and_publishing(app, client, make_user, login, make_post):
+    make_user()
+    login(client)
+    make_post(client, tags='python, flask')
+    make_post(client, title='Two', tags='python')
+
+    edit(client, 1, 'python, web')
+    assert tag_counts(app) == {'flask': 0, 'python': 2, 'web': 1}
+
+    edit(client, 1, 'python, web', published=False)
+    assert tag_counts(app) == {'flask': 0, 'python': 1, 'web': 0}
+
+    edit(client, 1, 'python, web')
+    assert tag_counts(app) == {'flask': 0, 'python': 2, 'web': 1}
+
+    client.post('/post/1/delete')
+    assert tag_counts(app) == {'flask': 0, 'python': 1, 'web': 0}
+
+
+def test_counts_are_kept_without_on_conflict_support(app, client, make_user, login, make_post, monkeypatch):
+    monkeypatch.setattr(db_utils, 'dialect_insert', lambda table: None)
+    make_user()
+    login(client)
+    make_post(client, tags='python, flask')
+    make_post(client, title='Two', tags='python')
+    assert tag_counts(app) == {'flask': 1, 'python': 2}
+
+    edit(client, 1, 'python, web')
+    assert tag_counts(app) == {'flask': 0, 'python': 2, 'web': 1}
+
+    edit(client, 1, 'python, web', published=False)
+    assert tag_counts(app) == {'flask': 0, 'python': 1, 'web': 0}
+
+
+def test_rebuild_matches_maintained_counts(app, client, make_user, login, make_post):
+    make_user()
+    login(client)
+    make_post(client, tags='a, b')
+    make_post(client, title='Two', tags='a', published=False)
+    maintained = tag_counts(app)
+
+    with app.app_context():
+        db.session.execute(db.update(TagCount).values(post_count=0))
+        TagCount.rebuild()
+        db.session.commit()
+    assert tag_counts(app) == maintained == {'a': 1, 'b': 1}
+
+
+def test_tag_page_lists_published_posts(client, make_user, login, make_post):
+    make_user()
+    login(client)
+    make_post(client, title='Shown', tags='Python')
+    make_post(client, title='Hidden', tags='python', published=False)
+
+    response = client.get('/tag/python')
+    assert response.status_code == 200
+    assert b'Shown' in response.data
+    assert b'Hidden' not in response.data
+    assert client.get('/tag/missing').status_code == 404
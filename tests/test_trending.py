@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models.post import Comment
+from app.models.trending import TrendingScore
+
+
+def scores(app):
+    with app.app_context():
+        return dict(db.session.query(TrendingScore.post_id, TrendingScore.score))
+
+
+def test_comments_rank_posts_and_deleting_them_takes_them_out(app, client, make_user, login, make_post):
+    make_user()
+    login(client)
+    make_post(client, title='Quiet')
+    make_post(client, title='Busy')
+    client.post('/post/2/comment', data={'content': 'first'})
+    client.post('/post/2/comment', data={'content': 'second'})
+    client.post('/post/1/comment', data={'content': 'only'})
+
+    with app.app_context():
+        assert [post_id for post_id, _ in TrendingScore.top()] == [2, 1]
+    assert [post['title'] for post in client.get('/api/v1/trending').get_json()['data']] == ['Busy', 'Quiet']
+
+    client.post('/comment/1/delete')
+    client.post('/comment/2/delete')
+    assert scores(app)[2] == pytest.approx(0.0, abs=1e-9)
+
+
+def test_older_activity_counts_for_less(app, client, make_user, login, make_post):
+    make_user()
+    login(client)
+    make_post(client)
+    make_post(client, title='Two')
+    now = datetime.utcnow()
+    with app.app_context():
+        TrendingScore.adjust([(1, now, 0.0), (2, now - timedelta(hours=24), 0.0)])
+        top = dict(TrendingScore.top())
+        assert top[2] / top[1] == pytest.approx(0.5, rel=1e-3)
+
+
+def test_removing_a_comment_after_compaction_never_goes_negative(app, client, make_user, login, make_post):
+    make_user()
+    login(client)
+    make_post(client)
+    client.post('/post/1/comment', data={'content': 'old news'})
+
+    with app.app_context():
+        comment = db.session.get(Comment, 1)
+        comment.created_at = datetime.utcnow() - timedelta(days=30)
+        db.session.commit()
+        # The month old comment has decayed away and compaction drops the score
+        TrendingScore.rebuild()
+        TrendingScore.compact()
+        db.session.commit()
+        assert db.session.get(TrendingScore, 1) is None
+
+    client.post('/comment/1/delete')
+    assert scores(app) == {}
+
+    # A score that compaction only shrank is floored at zero
+    with app.app_context():
+        now = datetime.utcnow()
+        # Weighs 0.5, then a neutral comment's 1.0 is taken out
+        TrendingScore.adjust([(1, now, -1.0)])
+        TrendingScore.adjust([(1, now, 0.0)], sign=-1)
+        db.session.commit()
+        assert db.session.get(TrendingScore, 1).score == 0.0
+
+
+def test_the_trending_page_limit_is_clamped(app, client, make_user, login, make_post):
+    make_user()
+    login(client)
+    make_post(client)
+    make_post(client, title='Two')
+    with app.app_context():
+        TrendingScore.adjust([(1, datetime.utcnow(), 0.0), (2, datetime.utcnow(), 1.0)])
+        db.session.commit()
+
+    # LIMIT -1 would read the whole score index
+    for limit, shown in (('-1', 1), ('0', 1), ('1', 1), ('100', 2)):
+        response = client.get('/trending?limit=' + limit)
+        assert response.status_code == 200
+        assert response.get_data(as_text=True).count('<article') == shown
@@ -0,0 +1,92 @@
+import os
+
+from app import db
+from app.models.post import Post, Tag, TagCount
+from app.models.upload import UploadRef
+from app.utils.file_utils import delete_files
+
+
+def refs(app):
+    with app.app_context():
+        return {ref.path: ref.ref_count for ref in UploadRef.query}
+
+
+def image_path(app, post_id):
+    with app.app_context():
+        image_file = db.session.get(Post, post_id).image_file
+    return f'post_images/{image_file}', os.path.join(app.config['UPLOAD_FOLDER'], 'post_images', image_file)
+
+
+def edit(client, post_id, image=None, published=True, tags='a'):
+    data = {'title': 'Hello', 'content': 'Some post content', 'tags': tags}
+    if published:
+        data['published'] = 'y'
+    if image is not None:
+        data['image'] = (image, 'image.jpg')
+    return client.post(f'/post/{post_id}/update', data=data, content_type='multipart/form-data')
+
+
+def test_identical_uploads_share_one_counted_file(app, client, make_user, login, make_post, jpeg):
+    make_user()
+    login(client)
+    make_post(client, image=jpeg('red'))
+    make_post(client, title='Two', image=jpeg('red'))
+
+    path, file_path = image_path(app, 1)
+    assert image_path(app, 2)[0] == path
+    assert refs(app) == {path: 2}
+
+    client.post('/post/1/delete')
+    assert refs(app) == {path: 1}
+    assert os.path.exists(file_path)
+
+    client.post('/post/2/delete')
+    assert refs(app) == {}
+    assert not os.path.exists(file_path)
+
+
+def test_replaced_images_are_released(app, client, make_user, login, make_post, jpeg):
+    make_user()
+    login(client)
+    make_post(client, image=jpeg('red'))
+    old_path, old_file = image_path(app, 1)
+
+    edit(client, 1, image=jpeg('blue'))
+
+    new_path, new_file = image_path(app, 1)
+    assert refs(app) == {new_path: 1}
+    assert os.path.exists(new_file)
+    assert not os.path.exists(old_file)
+
+
+def test_unpublishing_with_a_new_image_keeps_tag_counts(app, client, make_user, login, make_post, jpeg):
+    make_user()
+    login(client)
+    make_post(client, tags='a', image=jpeg('red'))
+
+    edit(client, 1, image=jpeg('blue'), published=False)
+    with app.app_context():
+        assert db.session.query(TagCount.post_count).join(TagCount.tag).filter(Tag.name == 'a').scalar() == 0
+
+    edit(client, 1, image=jpeg('green'))
+    with app.app_context():
+        assert db.session.query(TagCount.post_count).join(TagCount.tag).filter(Tag.name == 'a').scalar() == 1
+
+
+def test_a_file_reused_before_it_is_deleted_is_kept(app, client, make_user, login, make_post, jpeg):
+    make_user()
+    login(client)
+    make_post(client, image=jpeg('red'))
+    path, file_path = image_path(app, 1)
+
+    # The last reference is dropped, then an identical upload reuses the file before it is deleted
+    with app.app_context():
+        unused = UploadRef.release(path)
+        db.session.commit()
+    assert unused == [path]
+    make_post(client, title='Two', image=jpeg('red'))
+
+    with app.app_context():
+        assert delete_files(unused) == 0
+    assert os.path.exists(file_path)
+    assert refs(app) == {path: 1}
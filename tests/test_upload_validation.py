@@ -0,0 +1,50 @@
+import io
+import os
+
+from PIL import Image
+
+from app.models.post import Post
+
+
+def upload_files(app):
+    directory = os.path.join(app.config['UPLOAD_FOLDER'], 'post_images')
+    return [name for _, _, names in os.walk(directory) for name in names]
+
+
+def test_files_that_are_not_images_are_rejected(app, client, make_user, login, make_post):
+    make_user()
+    login(client)
+
+    response = make_post(client, image=io.BytesIO(b'%PDF-1.4 not a picture'))
+
+    assert response.status_code == 400
+    assert b'Only JPEG, PNG and GIF images are accepted.' in response.data
+    assert upload_files(app) == []
+    with app.app_context():
+        assert Post.query.count() == 0
+
+
+def test_truncated_images_are_rejected(app, client, make_user, login, make_post):
+    make_user()
+    login(client)
+
+    response = make_post(client, image=io.BytesIO(b'\xff\xd8\xff\xe0' + b'\x00' * 16))
+
+    assert response.status_code == 400
+    assert b'The file is not a valid image.' in response.data
+    assert upload_files(app) == []
+
+
+def test_images_over_the_pixel_limit_are_rejected_before_decoding(app, client, make_user, login, make_post):
+    app.config['IMAGE_MAX_PIXELS'] = 100 * 100
+    make_user()
+    login(client)
+    data = io.BytesIO()
+    Image.new('RGB', (200, 200)).save(data, 'PNG')
+    data.seek(0)
+
+    response = make_post(client, image=data)
+
+    assert response.status_code == 400
+    assert b'200x200 pixels' in response.data
+    assert upload_files(app) == []
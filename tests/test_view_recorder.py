@@ -0,0 +1,106 @@
+from app import create_app, db, view_recorder
+from app.models.view import PostView, PostViewCount
+
+
+def view_counts(app):
+    with app.app_context():
+        return dict(db.session.query(PostViewCount.post_id, PostViewCount.views))
+
+
+def test_views_are_buffered_then_written_in_one_batch(app, client, make_user, login, make_post):
+    make_user()
+    author = app.test_client()
+    login(author)
+    make_post(author)
+    author.get('/').close()
+
+    for _ in range(3):
+        client.get('/post/1').close()
+    author.get('/post/1').close()
+    # 304 answers are views too
+    etag = client.get('/api/v1/posts/1').headers['ETag']
+    assert client.get('/api/v1/posts/1', headers={'If-None-Match': etag}).status_code == 304
+
+    assert view_counts(app) == {}
+    assert view_recorder.stats()['buffered'] == 2
+    assert view_recorder.flush() == 2
+
+    assert view_counts(app) == {1: 6}
+    with app.app_context():
+        assert [(view.user_id, view.view_count) for view in PostView.query] == [(1, 1)]
+    assert view_recorder.stats()['buffered'] == 0
+
+
+def test_a_full_buffer_is_written_by_the_request_without_a_thread(app, client, make_user, login, make_post):
+    make_user()
+    login(client)
+    make_post(client)
+    app.config['VIEW_FLUSH_SIZE'] = 1
+
+    client.get('/post/1').close()
+    assert view_counts(app) == {1: 1}
+
+
+def test_views_past_the_buffer_limit_are_dropped(app):
+    app.config['VIEW_BUFFER_MAX'] = 2
+    before = view_recorder.stats()
+    for post_id in (1, 2, 3):
+        view_recorder.record(post_id)
+    # Pairs already buffered are still counted
+    view_recorder.record(1)
+
+    stats = view_recorder.stats()
+    assert stats['buffered'] == 2
+    assert (stats['dropped'] - before['dropped'], stats['recorded'] - before['recorded']) == (1, 3)
+
+
+def test_a_failed_write_keeps_the_views_for_the_next_one(app, client, make_user, login, make_post, monkeypatch):
+    make_user()
+    login(client)
+    make_post(client)
+    client.get('/post/1').close()
+
+    def broken(events):
+        raise RuntimeError('database is locked')
+    monkeypatch.setattr(PostView, 'merge', broken)
+    assert view_recorder.flush() == 0
+    assert view_recorder.stats()['buffered'] == 1
+    monkeypatch.undo()
+
+    assert view_recorder.flush() == 1
+    assert view_counts(app) == {1: 1}
+
+
+def test_a_new_app_writes_the_views_buffered_for_the_previous_one(app, client, make_user, login, make_post,
+                                                                  tmp_path):
+    make_user()
+    login(client)
+    make_post(client)
+    client.get('/post/1').close()
+
+    other = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'other.db'),
+        'INVALIDATION_BUS_PATH': str(tmp_path / 'other-bus.db'),
+        'VIEW_FLUSH_THREAD': False,
+    })
+    assert view_recorder.app is other
+    assert view_recorder.stats()['buffered'] == 0
+    assert view_counts(app) == {1: 1}
+
+
+
+def test_api_responses_with_view_counts_revalidate_when_views_are_written(client, make_user, login, make_post):
+    make_user()
+    author = client.application.test_client()
+    login(author)
+    make_post(author)
+
+    for url in ['/api/v1/posts?fields=id,view_count', '/api/v1/posts/1?fields=id,view_count']:
+        response = client.get(url)
+        assert 'Last-Modified' not in response.headers
+        etag = response.headers['ETag']
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+        client.get('/post/1').close()
+        view_recorder.flush()
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,54 @@
+import os
+
+from app import warmup
+
+
+def test_readiness_follows_the_warm_up(app, client):
+    response = client.get('/readyz')
+    assert response.status_code == 503
+    assert response.get_json()['ready'] is False
+
+    warmup.run()
+
+    data = client.get('/readyz').get_json()
+    assert data['ready'] is True
+    assert data['steps']['templates']['result'] > 0
+    assert all(step['error'] is None for step in data['steps'].values())
+
+
+def test_a_failing_step_does_not_block_readiness(app, client, monkeypatch):
+    def broken(app):
+        raise RuntimeError('no model')
+
+    monkeypatch.setattr(warmup, 'step_functions', [('templates', warmup.step_functions[0][1]),
+                                                   ('recommendation_model', broken)])
+    warmup.run()
+
+    response = client.get('/readyz')
+    assert response.status_code == 200
+    steps = response.get_json()['steps']
+    assert steps['recommendation_model']['error'] == 'no model'
+    assert steps['templates']['error'] is None
+
+
+def test_only_the_configured_steps_run(app, monkeypatch):
+    ran = []
+    monkeypatch.setattr(warmup, 'enabled_steps', frozenset(['images']))
+    monkeypatch.setattr(warmup, 'step_functions', [(name, lambda app, name=name: ran.append(name))
+                                                   for name in ('templates', 'images')])
+    warmup.run()
+    assert ran == ['images']
+
+
+def test_compiled_templates_are_cached_on_disk(tmp_path):
+    from app import create_app
+
+    directory = tmp_path / 'jinja_cache'
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'),
+        'INVALIDATION_BUS_PATH': str(tmp_path / 'invalidation.db'),
+        'JINJA_BYTECODE_CACHE': True,
+        'JINJA_BYTECODE_CACHE_DIR': str(directory),
+    })
+    app.jinja_env.get_template('main/home.html')
+    assert os.listdir(directory)
@@ -0,0 +1,96 @@
+"""
+Update database script for database-level cascading deletes.
+SQLite cannot change a foreign key in place, so the posts, comments,
+post_tags and tag_counts tables are rebuilt with ON DELETE CASCADE
+foreign keys and their data copied over.
+The new tables are made from the current CREATE TABLE statements, so every
+column is kept whichever other update scripts have run.
+Run the update scripts in this order: update_db_ai.py, update_db_tags.py,
+update_db_comments.py, update_db_excerpts.py, then this script. Running it
+before update_db_excerpts.py works too, the columns are added afterwards.
+This script uses SQLite directly to avoid dependency issues.
+"""
+import re
+import sqlite3
+import os
+
+TABLES = ['posts', 'comments', 'post_tags', 'tag_counts']
+
+REFERENCES = re.compile(r'(REFERENCES\s+"?\w+"?\s*\([^)]*\))(?!\s*ON DELETE)', re.IGNORECASE)
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_comments_post_created ON comments (post_id, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_tag_counts_post_count ON tag_counts (post_count)",
+]
+
+# Parents first, so orphans of orphans are removed too
+ORPHAN_DELETES = [
+    "DELETE FROM posts WHERE user_id NOT IN (SELECT id FROM users)",
+    "DELETE FROM comments WHERE post_id NOT IN (SELECT id FROM posts) OR user_id NOT IN (SELECT id FROM users)",
+    "DELETE FROM post_tags WHERE post_id NOT IN (SELECT id FROM posts) OR tag_id NOT IN (SELECT id FROM tags)",
+    "DELETE FROM tag_counts WHERE tag_id NOT IN (SELECT id FROM tags)",
+]
+
+def cascade_sql(create_sql, table):
+    """The table's CREATE TABLE statement, for {table}_new with cascading foreign keys"""
+    create_sql = re.sub(rf'^CREATE TABLE\s+"?{table}"?', f'CREATE TABLE {table}_new', create_sql.strip())
+    return REFERENCES.sub(r'\1 ON DELETE CASCADE', create_sql)
+
+def get_columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [col[1] for col in cursor.fetchall()]
+
+def update_database():
+    # Path to the SQLite database
+    db_path = 'instance/app.db'
+
+    # Check if the database exists
+    if not os.path.exists(db_path):
+        print(f"Database not found at {db_path}. Please run the application first to create the database.")
+        return
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    # Foreign keys must be off while tables are dropped and renamed
+    cursor.execute("PRAGMA foreign_keys = OFF")
+
+    for table in TABLES:
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        row = cursor.fetchone()
+        if row is None:
+            print(f"Table {table} not found, skipping.")
+            continue
+        if 'ON DELETE CASCADE' in row[0]:
+            print(f"Table {table} already has cascading foreign keys.")
+            continue
+
+        print(f"Rebuilding {table} with cascading foreign keys...")
+        # Indexes are dropped with the old table, they are created again on the new one
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,))
+        index_sqls = [index_row[0] for index_row in cursor.fetchall()]
+        cursor.execute(cascade_sql(row[0], table))
+        columns = ', '.join(get_columns(cursor, table))
+        cursor.execute(f"INSERT INTO {table}_new ({columns}) SELECT {columns} FROM {table}")
+        cursor.execute(f"DROP TABLE {table}")
+        cursor.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+        for index_sql in index_sqls:
+            cursor.execute(index_sql)
+
+    for index_sql in INDEXES:
+        cursor.execute(index_sql)
+
+    # Remove rows left behind by earlier deletes, as the cascade would have done
+    orphans = 0
+    for delete_sql in ORPHAN_DELETES:
+        cursor.execute(delete_sql)
+        orphans += cursor.rowcount
+    print(f"Removed {orphans} orphaned rows.")
+
+    conn.commit()
+    conn.close()
+    print("Database update complete!")
+
+if __name__ == '__main__':
+    print("Updating database for cascading deletes...")
+    update_database()
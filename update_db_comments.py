@@ -0,0 +1,50 @@
+"""
+Update database script for paginated comments.
+Adds the stored comment_count column to posts, fills it from the comments table,
+and adds the (post_id, created_at, id) index used for comment pagination.
+This script uses SQLite directly to avoid dependency issues.
+"""
+import sqlite3
+import os
+
+def update_database():
+    # Path to the SQLite database
+    db_path = 'instance/app.db'
+
+    # Check if the database exists
+    if not os.path.exists(db_path):
+        print(f"Database not found at {db_path}. Please run the application first to create the database.")
+        return
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    cursor.execute("PRAGMA table_info(posts)")
+    columns = [col[1] for col in cursor.fetchall()]
+
+    if 'comment_count' not in columns:
+        print("Adding comment_count column to posts table...")
+        cursor.execute('ALTER TABLE posts ADD COLUMN comment_count INTEGER NOT NULL DEFAULT 0')
+    else:
+        print("comment_count column already exists in posts table.")
+
+    # Recount so the script also repairs drifted counters
+    cursor.execute('''
+        UPDATE posts SET comment_count = (
+            SELECT COUNT(*) FROM comments WHERE comments.post_id = posts.id
+        )
+    ''')
+    print(f"Counted comments for {cursor.rowcount} posts.")
+
+    print("Creating comment pagination index...")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS ix_comments_post_created ON comments (post_id, created_at, id)"
+    )
+
+    conn.commit()
+    conn.close()
+    print("Database update complete!")
+
+if __name__ == '__main__':
+    print("Updating database for comment pagination...")
+    update_database()
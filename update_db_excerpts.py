@@ -0,0 +1,63 @@
+"""
+Update database script for stored post excerpts.
+Adds the excerpt and word_count columns to posts and fills them from
+the existing post content, the same way the Post model does on save.
+This script uses SQLite directly to avoid dependency issues.
+"""
+import sqlite3
+import os
+from markupsafe import Markup
+
+EXCERPT_LENGTH = 200
+
+def make_summary(content):
+    text = Markup(content or '').striptags()
+    excerpt = text
+    if len(text) > EXCERPT_LENGTH:
+        excerpt = text[:EXCERPT_LENGTH - 3].rsplit(' ', 1)[0] + '...'
+    return excerpt, len(text.split())
+
+def update_database():
+    # Path to the SQLite database
+    db_path = 'instance/app.db'
+
+    # Check if the database exists
+    if not os.path.exists(db_path):
+        print(f"Database not found at {db_path}. Please run the application first to create the database.")
+        return
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    cursor.execute("PRAGMA table_info(posts)")
+    columns = [col[1] for col in cursor.fetchall()]
+
+    if 'excerpt' not in columns:
+        print("Adding excerpt and word_count columns to posts table...")
+        cursor.execute("ALTER TABLE posts ADD COLUMN excerpt VARCHAR(200) NOT NULL DEFAULT ''")
+        cursor.execute("ALTER TABLE posts ADD COLUMN word_count INTEGER NOT NULL DEFAULT 0")
+    else:
+        print("Excerpt columns already exist in posts table.")
+
+    # Fill the columns in batches so large tables are not held in memory
+    read_cursor = conn.cursor()
+    read_cursor.execute("SELECT id, content FROM posts")
+    updated = 0
+    while True:
+        rows = read_cursor.fetchmany(500)
+        if not rows:
+            break
+        cursor.executemany(
+            "UPDATE posts SET excerpt = ?, word_count = ? WHERE id = ?",
+            [(*make_summary(content), post_id) for post_id, content in rows]
+        )
+        updated += len(rows)
+    print(f"Stored excerpts for {updated} posts.")
+
+    conn.commit()
+    conn.close()
+    print("Database update complete!")
+
+if __name__ == '__main__':
+    print("Updating database for post excerpts...")
+    update_database()
@@ -0,0 +1,38 @@
+"""
+Update database script for image processing tracking.
+Adds the image_updated_at column to posts, set when a post's picture has been
+processed or dropped, which conditional requests use to replace placeholders
+on post listings. It does not depend on the other update scripts.
+This script uses SQLite directly to avoid dependency issues.
+"""
+import sqlite3
+import os
+
+def update_database():
+    # Path to the SQLite database
+    db_path = 'instance/app.db'
+
+    # Check if the database exists
+    if not os.path.exists(db_path):
+        print(f"Database not found at {db_path}. Please run the application first to create the database.")
+        return
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    cursor.execute("PRAGMA table_info(posts)")
+    columns = [col[1] for col in cursor.fetchall()]
+
+    if 'image_updated_at' not in columns:
+        print("Adding image_updated_at column to posts table...")
+        cursor.execute('ALTER TABLE posts ADD COLUMN image_updated_at DATETIME')
+    else:
+        print("image_updated_at column already exists in posts table.")
+
+    conn.commit()
+    conn.close()
+    print("Database update complete!")
+
+if __name__ == '__main__':
+    print("Updating database for image processing tracking...")
+    update_database()
@@ -0,0 +1,40 @@
+"""
+Update database script for profile change tracking.
+Adds the profile_updated_at column to users, which conditional requests use
+to notice author name and picture changes on post listings. It does not
+depend on the other update scripts.
+This script uses SQLite directly to avoid dependency issues.
+"""
+import sqlite3
+import os
+
+def update_database():
+    # Path to the SQLite database
+    db_path = 'instance/app.db'
+
+    # Check if the database exists
+    if not os.path.exists(db_path):
+        print(f"Database not found at {db_path}. Please run the application first to create the database.")
+        return
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    cursor.execute("PRAGMA table_info(users)")
+    columns = [col[1] for col in cursor.fetchall()]
+
+    if 'profile_updated_at' not in columns:
+        print("Adding profile_updated_at column to users table...")
+        cursor.execute('ALTER TABLE users ADD COLUMN profile_updated_at DATETIME')
+        # Pages cached before the update are revalidated once
+        cursor.execute("UPDATE users SET profile_updated_at = datetime('now')")
+    else:
+        print("profile_updated_at column already exists in users table.")
+
+    conn.commit()
+    conn.close()
+    print("Database update complete!")
+
+if __name__ == '__main__':
+    print("Updating database for profile change tracking...")
+    update_database()
@@ -0,0 +1,72 @@
+"""
+Update database script for normalized tags and materialized tag counts.
+Lowercases existing tag names, merges tags that only differed in case,
+and creates the tag_counts table filled from the current posts.
+This script uses SQLite directly to avoid dependency issues.
+"""
+import sqlite3
+import os
+
+def update_database():
+    # Path to the SQLite database
+    db_path = 'instance/app.db'
+
+    # Check if the database exists
+    if not os.path.exists(db_path):
+        print(f"Database not found at {db_path}. Please run the application first to create the database.")
+        return
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    # Merge tags whose names only differ in case or surrounding whitespace
+    cursor.execute("SELECT id, name FROM tags ORDER BY id")
+    keep = {}
+    merged = 0
+    for tag_id, name in cursor.fetchall():
+        normalized = ' '.join(name.split()).lower()[:50]
+        if normalized in keep:
+            target_id = keep[normalized]
+            cursor.execute(
+                "INSERT OR IGNORE INTO post_tags (post_id, tag_id) "
+                "SELECT post_id, ? FROM post_tags WHERE tag_id = ?",
+                (target_id, tag_id)
+            )
+            cursor.execute("DELETE FROM post_tags WHERE tag_id = ?", (tag_id,))
+            cursor.execute("DELETE FROM tags WHERE id = ?", (tag_id,))
+            merged += 1
+        else:
+            keep[normalized] = tag_id
+            if normalized != name:
+                cursor.execute("UPDATE tags SET name = ? WHERE id = ?", (normalized, tag_id))
+    print(f"Normalized tag names, merged {merged} duplicate tags.")
+
+    print("Creating tag_counts table...")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tag_counts (
+            tag_id INTEGER NOT NULL,
+            post_count INTEGER NOT NULL,
+            PRIMARY KEY (tag_id),
+            FOREIGN KEY(tag_id) REFERENCES tags (id)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_tag_counts_post_count ON tag_counts (post_count)")
+
+    # Rebuild counts from scratch so the script can be re-run safely
+    cursor.execute("DELETE FROM tag_counts")
+    cursor.execute('''
+        INSERT INTO tag_counts (tag_id, post_count)
+        SELECT post_tags.tag_id, COUNT(*) FROM post_tags
+        JOIN posts ON posts.id = post_tags.post_id
+        WHERE posts.published = 1
+        GROUP BY post_tags.tag_id
+    ''')
+    print(f"Counted posts for {cursor.rowcount} tags.")
+
+    conn.commit()
+    conn.close()
+    print("Database update complete!")
+
+if __name__ == '__main__':
+    print("Updating database for tag counts...")
+    update_database()
@@ -0,0 +1,13 @@
+"""
+Production WSGI entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The application is created and warmed up on import, with gunicorn's
+preload_app that is once in the master process before workers fork.
+Run `flask init` once per deployment first, starting does no setup.
+"""
+from app import create_app, warmup
+
+app = create_app()
+warmup.run()